@@ -0,0 +1,352 @@
+# artifact_store.py
+"""
+MathSpace 视频仓库
+按内容哈希 (SHA256) 管理渲染产物：相同视频只存一份（硬链接去重），
+记录缓存引用，并在磁盘配额 / 保留期限内按 LRU 自动淘汰 (优先淘汰没有缓存引用的视频)。
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from config import (
+    STATIC_DIR, ARTIFACT_BLOB_DIR,
+    ARTIFACT_QUOTA_MB, ARTIFACT_MAX_AGE_DAYS, ARTIFACT_ACCESS_FLUSH_INTERVAL
+)
+from state_backend import state
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """流式计算文件的 SHA256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    内容寻址的视频仓库
+
+    - blobs:  SHA256 -> 实体文件 (data/blobs/<sha>.mp4)
+    - names:  对外文件名 (static/video_<id>.mp4) -> SHA256，通过硬链接指向 blob
+    - refs:   对外文件名 -> 引用它的缓存键列表 (缓存条目被替换或作废时移除)
+    被缓存引用的视频不按保留期限淘汰，超出配额时也排在无引用的视频之后。
+    淘汰时会通知监听者，保证缓存不会指向已删除的文件。
+    索引保存在共享状态后端 (键 "artifacts")，多个 worker 通过事务串行更新；
+    访问时间 (LRU) 先记在内存里，定期或淘汰前批量写回，命中缓存时不用重写整个索引。
+    """
+
+    def __init__(self, public_dir=STATIC_DIR, blob_dir=ARTIFACT_BLOB_DIR,
+                 backend=state, state_key="artifacts",
+                 quota_bytes=ARTIFACT_QUOTA_MB * 1024 * 1024,
+                 max_age_seconds=ARTIFACT_MAX_AGE_DAYS * 86400,
+                 access_flush_interval=ARTIFACT_ACCESS_FLUSH_INTERVAL):
+        self.public_dir = public_dir
+        self.blob_dir = blob_dir
+        self.backend = backend
+        self.state_key = state_key
+        self.quota_bytes = quota_bytes
+        self.max_age_seconds = max_age_seconds
+        self.access_flush_interval = access_flush_interval
+        self._lock = threading.RLock()
+        self._evict_listeners = []
+        self._pending_access = {}  # 对外文件名 -> 尚未写回索引的最近访问时间
+        self._known_names = set()  # 已确认登记过的对外文件名，命中缓存时不用每次读索引
+        self._last_flush = time.time()
+
+    # ---------- 索引读写 ----------
+    def _empty_index(self):
+        return {"blobs": {}, "names": {}, "refs": {}}
+
+    def _load_index(self):
+        index = self.backend.get_json(self.state_key, None)
+        if not isinstance(index, dict):
+            return self._empty_index()
+        for key, value in self._empty_index().items():
+            index.setdefault(key, value)
+        return index
+
+    @contextmanager
+    def _transaction(self):
+        """在状态后端的事务中读改写索引 (跨进程互斥)"""
+        with self._lock, self.backend.transaction(self.state_key, self._empty_index()) as index:
+            for key, value in self._empty_index().items():
+                index.setdefault(key, value)
+            yield index
+
+    def _blob_path(self, sha):
+        return os.path.join(self.blob_dir, f"{sha}.mp4")
+
+    def _public_path(self, name):
+        return os.path.join(self.public_dir, name)
+
+    # ---------- 监听 ----------
+    def add_evict_listener(self, callback):
+        """注册淘汰回调：callback(names) 会收到被删除的对外文件名列表"""
+        self._evict_listeners.append(callback)
+
+    def _notify_evicted(self, names):
+        if not names:
+            return
+        for callback in self._evict_listeners:
+            try:
+                callback(names)
+            except Exception as e:
+                print(f"⚠️ [仓库] 淘汰回调失败: {e}")
+
+    # ---------- 核心操作 ----------
+    def _link_public(self, sha, name):
+        """把 blob 硬链接到对外目录；不支持硬链接时退化为复制"""
+        public_path = self._public_path(name)
+        if os.path.lexists(public_path):
+            os.remove(public_path)
+        try:
+            os.link(self._blob_path(sha), public_path)
+            return True
+        except OSError:
+            shutil.copy2(self._blob_path(sha), public_path)
+            return False
+
+    def ingest(self, src_path, name):
+        """收录新渲染的视频 (会移动 src_path)，返回内容哈希"""
+        sha = file_sha256(src_path)
+        now = time.time()
+        with self._transaction() as index:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            os.makedirs(self.public_dir, exist_ok=True)
+
+            blob = index["blobs"].get(sha)
+            if blob and os.path.exists(self._blob_path(sha)):
+                # 内容完全相同：丢弃新文件，复用已有 blob
+                os.remove(src_path)
+                print(f"♻️ [仓库] 去重命中: {name} -> {sha[:12]}")
+            else:
+                shutil.move(src_path, self._blob_path(sha))
+                blob = {
+                    "size": os.path.getsize(self._blob_path(sha)),
+                    "created": now,
+                    "last_access": now,
+                    "names": {}
+                }
+                index["blobs"][sha] = blob
+
+            old_sha = index["names"].get(name)
+            if old_sha and old_sha != sha and old_sha in index["blobs"]:
+                index["blobs"][old_sha]["names"].pop(name, None)
+
+            blob["names"][name] = self._link_public(sha, name)
+            blob["last_access"] = now
+            index["names"][name] = sha
+            self._known_names.add(name)
+
+            evicted = self._enforce_locked(index, protect={sha})
+
+        self._notify_evicted(evicted)
+        return sha
+
+    def touch(self, name):
+        """
+        标记一次访问 (LRU)，文件不存在时返回 False；访问时间先记在内存，到期后批量写回
+        只有第一次见到的文件名才读索引确认登记；其他 worker 淘汰时会删掉对外文件，靠文件是否存在发现
+        """
+        with self._lock:
+            if name not in self._known_names:
+                index = self._load_index()
+                sha = index["names"].get(name)
+                if not sha or sha not in index["blobs"]:
+                    return False
+                self._known_names.add(name)
+            if not os.path.exists(self._public_path(name)):
+                self._known_names.discard(name)
+                return False
+            self._pending_access[name] = time.time()
+            due = time.time() - self._last_flush >= self.access_flush_interval
+        if due:
+            self.flush_access()
+        return True
+
+    def _apply_access_locked(self, index):
+        """把内存中的访问时间合并进索引 (取较新的一次)"""
+        for name, accessed in self._pending_access.items():
+            blob = index["blobs"].get(index["names"].get(name))
+            if blob and accessed > blob["last_access"]:
+                blob["last_access"] = accessed
+        self._pending_access.clear()
+        self._last_flush = time.time()
+
+    def flush_access(self):
+        """把积累的访问时间写回索引"""
+        with self._lock:
+            if not self._pending_access:
+                self._last_flush = time.time()
+                return
+            with self._transaction() as index:
+                self._apply_access_locked(index)
+
+    def get_hash(self, name):
+        """查询对外文件名对应的内容哈希"""
+        with self._lock:
+            return self._load_index()["names"].get(name)
+
+    def add_ref(self, name, ref):
+        """记录缓存条目对视频的引用"""
+        with self._transaction() as index:
+            if name not in index["names"]:
+                return False
+            refs = index["refs"].setdefault(name, [])
+            if ref not in refs:
+                refs.append(ref)
+            return True
+
+    def remove_ref(self, name, ref):
+        with self._transaction() as index:
+            refs = index["refs"].get(name, [])
+            if ref in refs:
+                refs.remove(ref)
+                if not refs:
+                    index["refs"].pop(name, None)
+
+    # ---------- 淘汰策略 ----------
+    def _usage_locked(self, index):
+        """实际占用：每个 blob 计一次，复制出来的 (非硬链接) 文件额外计入"""
+        total = 0
+        for blob in index["blobs"].values():
+            copies = sum(1 for linked in blob["names"].values() if not linked)
+            total += blob["size"] * (1 + copies)
+        return total
+
+    def _evict_blob_locked(self, index, sha):
+        blob = index["blobs"].pop(sha, None)
+        if not blob:
+            return []
+        names = list(blob["names"].keys())
+        for name in names:
+            index["names"].pop(name, None)
+            index["refs"].pop(name, None)
+            self._known_names.discard(name)
+            try:
+                os.remove(self._public_path(name))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(self._blob_path(sha))
+        except FileNotFoundError:
+            pass
+        return names
+
+    def _referenced_locked(self, index, sha):
+        return any(index["refs"].get(name) for name in index["blobs"][sha]["names"])
+
+    def _enforce_locked(self, index, protect=()):
+        """
+        按保留期限 + 磁盘配额淘汰，返回被删除的对外文件名
+        - 保留期限只针对没有缓存引用的视频
+        - 超出配额时先按 LRU 淘汰无引用的视频，仍然超出才淘汰被引用的
+        """
+        self._apply_access_locked(index)
+        evicted = []
+        now = time.time()
+
+        if self.max_age_seconds > 0:
+            for sha, blob in list(index["blobs"].items()):
+                if sha not in protect and now - blob["last_access"] > self.max_age_seconds \
+                        and not self._referenced_locked(index, sha):
+                    evicted.extend(self._evict_blob_locked(index, sha))
+
+        if self.quota_bytes > 0:
+            usage = self._usage_locked(index)
+            lru = sorted(
+                (sha for sha in index["blobs"] if sha not in protect),
+                key=lambda s: (self._referenced_locked(index, s), index["blobs"][s]["last_access"])
+            )
+            for sha in lru:
+                if usage <= self.quota_bytes:
+                    break
+                evicted.extend(self._evict_blob_locked(index, sha))
+                usage = self._usage_locked(index)
+
+        if evicted:
+            print(f"🗑️ [仓库] 已淘汰 {len(evicted)} 个视频，当前占用 {self._usage_locked(index) / 1024 / 1024:.1f} MB")
+        return evicted
+
+    def enforce(self):
+        with self._transaction() as index:
+            evicted = self._enforce_locked(index)
+        self._notify_evicted(evicted)
+        return evicted
+
+    def reconcile(self):
+        """启动时对账：收录未登记的旧视频，清理已丢失的条目"""
+        adopted = 0
+        with self._transaction() as index:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            os.makedirs(self.public_dir, exist_ok=True)
+
+            # 1. 索引里有、磁盘上没有的条目
+            lost = []
+            for sha in list(index["blobs"].keys()):
+                if not os.path.exists(self._blob_path(sha)):
+                    lost.extend(self._evict_blob_locked(index, sha))
+                    continue
+                for name, linked in list(index["blobs"][sha]["names"].items()):
+                    if not os.path.exists(self._public_path(name)):
+                        index["blobs"][sha]["names"][name] = self._link_public(sha, name)
+
+            # 2. 磁盘上有、索引里没有的旧视频 (升级前生成的)
+            for filename in os.listdir(self.public_dir):
+                if not filename.endswith(".mp4") or filename in index["names"]:
+                    continue
+                path = self._public_path(filename)
+                sha = file_sha256(path)
+                blob = index["blobs"].get(sha)
+                if not blob:
+                    shutil.move(path, self._blob_path(sha))
+                    stat = os.stat(self._blob_path(sha))
+                    blob = {
+                        "size": stat.st_size,
+                        "created": stat.st_mtime,
+                        "last_access": stat.st_mtime,
+                        "names": {}
+                    }
+                    index["blobs"][sha] = blob
+                blob["names"][filename] = self._link_public(sha, filename)
+                index["names"][filename] = sha
+                adopted += 1
+
+            evicted = lost + self._enforce_locked(index)
+
+        if adopted:
+            print(f"📥 [仓库] 已收录 {adopted} 个历史视频")
+        self._notify_evicted(evicted)
+
+    def reset(self):
+        """清空仓库 (配合核按钮使用)"""
+        with self._transaction() as index:
+            for name in index["names"]:
+                try:
+                    os.remove(self._public_path(name))
+                except FileNotFoundError:
+                    pass
+            shutil.rmtree(self.blob_dir, ignore_errors=True)
+            self._pending_access.clear()
+            self._known_names.clear()
+            index.clear()
+            index.update(self._empty_index())
+
+    def stats(self):
+        with self._lock:
+            index = self._load_index()
+            return {
+                "videos": len(index["names"]),
+                "unique_blobs": len(index["blobs"]),
+                "usage_bytes": self._usage_locked(index),
+                "quota_bytes": self.quota_bytes
+            }
+
+
+artifact_store = ArtifactStore()
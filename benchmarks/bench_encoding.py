@@ -0,0 +1,91 @@
+# benchmarks/bench_encoding.py
+"""
+转码档位基准测试：同一个视频按各档位转码，对比体积和编码耗时
+
+用法:
+    python benchmarks/bench_encoding.py --video static/video_xxxx.mp4 --profiles h264,vp9,webp
+    python benchmarks/bench_encoding.py --duration 8 --target-bytes 200000 --json result.json
+
+不指定 --video 时用 ffmpeg 合成一段 "数学动画风格" 的测试片段 (深色纯色背景 + 网格 + 移动的色块，
+按 Manim -ql 的默认参数编码)。--target-bytes 会覆盖 mp4 / webm 档位的目标大小 (两遍编码)。
+需要本机安装 ffmpeg / ffprobe。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import video_encoding
+from config import FFMPEG_BIN, ENCODING_PROFILES
+from video_packaging import probe_duration, run_ffmpeg
+
+
+def synthetic_clip(path, duration):
+    """深色背景 + 网格 + 匀速移动的色块，480p15 (对应 Manim -ql)"""
+    returncode, stderr = run_ffmpeg([
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"color=c=0x1e1e1e:s=854x480:r=15:d={duration}",
+        "-vf", "drawgrid=w=80:h=80:t=1:c=white@0.25,"
+               "drawbox=x='mod(t*120,720)':y=180:w=120:h=120:color=0x58c4dd:t=fill,"
+               "drawbox=x=100:y='60+mod(t*60,300)':w=60:h=60:color=0xfc6255:t=fill",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", path
+    ], timeout=120)
+    if returncode != 0:
+        raise RuntimeError(f"合成测试片段失败: {stderr[-300:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="待转码的视频 (默认合成测试片段)")
+    parser.add_argument("--duration", type=float, default=6.0, help="合成片段时长 (秒)")
+    parser.add_argument("--profiles", default=",".join(ENCODING_PROFILES), help="逗号分隔的档位")
+    parser.add_argument("--target-bytes", type=int, default=0, help="覆盖视频档位的目标字节数")
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="mathspace_bench_encoding_") as work_dir:
+        src_path = args.video
+        if not src_path:
+            src_path = os.path.join(work_dir, "source.mp4")
+            synthetic_clip(src_path, args.duration)
+        duration = probe_duration(src_path)
+        source_bytes = os.path.getsize(src_path)
+
+        runs = []
+        for profile_name in args.profiles.split(","):
+            profile = ENCODING_PROFILES[profile_name]
+            if args.target_bytes and profile["format"] != "webp":
+                profile["target_bytes"] = args.target_bytes
+            start = time.perf_counter()
+            variant = video_encoding.encode_profile(src_path, work_dir, profile_name, duration)
+            seconds = time.perf_counter() - start
+            run = {"profile": profile_name, "format": profile["format"], "encode_seconds": round(seconds, 2)}
+            if variant is None:
+                run["skipped"] = True
+            else:
+                run["bytes"] = variant["bytes"]
+                run["ratio"] = round(variant["bytes"] / source_bytes, 3)
+                if duration:
+                    run["kbps"] = round(variant["bytes"] * 8 / duration / 1000, 1)
+            runs.append(run)
+
+    report = {
+        "source": args.video or "synthetic",
+        "duration": duration,
+        "source_bytes": source_bytes,
+        "target_bytes": args.target_bytes or None,
+        "runs": runs,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# benchmarks/bench_parsing.py
+"""
+LLM 回复解析微基准：对比旧版正则提取器与 llm_parsing 中的线性扫描实现
+
+用法:
+    python benchmarks/bench_parsing.py --sizes 10000,100000,400000 --json result.json
+
+测试用例 (均为合成的大体量 LLM 输出):
+    normal_code       正常回复：大段说明文字 + 一个 ```python 代码块
+    unclosed_fences   很多 ``` 却没有成对闭合 (被截断的回复)
+    normal_json       说明文字中夹一个 JSON 对象
+    unbalanced_json   大量 '{' 却没有 '}' (旧版贪婪正则的最坏情况)
+    long_play_args    self.play(...) 参数很长的场景代码
+
+每个用例输出耗时和"规模翻倍后的耗时倍数"，线性实现应接近 2，
+出现灾难性回溯的实现会明显大于 2 (平方级约为 4)。
+旧版实现耗时超过 --legacy-budget 秒后不再测更大的规模。
+"""
+
+import os
+import re
+import sys
+import math
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_parsing
+
+
+# ================= 旧版实现 (仅用于对照) =================
+def legacy_extract_code(text):
+    for pattern in [r"```python(.*?)```", r"```(.*?)```", r"<code>(.*?)</code>"]:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            code = match.group(1).strip()
+            return re.sub(r'^python\s*', '', code, flags=re.IGNORECASE)
+    return text.strip().replace("```", "")
+
+
+def legacy_extract_json(text):
+    try:
+        match = re.search(r'\{[\s\S]*\}', text)
+        if match:
+            return json.loads(match.group())
+    except Exception:
+        pass
+    return None
+
+
+def legacy_extract_objects(code):
+    objects = []
+    patterns = [
+        r'(\w+)\s*=\s*(Circle|Square|Triangle|Rectangle|Line|Dot|Text|MathTex|VGroup|Axes|NumberPlane|Sphere|Cube)',
+        r'self\.add\((\w+)\)',
+        r'self\.play\([^)]*(\w+)[^)]*\)',
+        r'def construct\(self\):[\s\S]*?(\w+)\s*='
+    ]
+    for pattern in patterns:
+        for match in re.findall(pattern, code):
+            obj_name = (match[0] or match[1]) if isinstance(match, tuple) else match
+            if obj_name and obj_name not in ['self', 'Scene', 'run_time', 'PI'] and obj_name not in objects:
+                objects.append(obj_name)
+    return objects
+
+
+# ================= 合成输入 =================
+def repeat_to(unit, size):
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def case_normal_code(size):
+    prose = repeat_to("这段代码先创建坐标系，然后绘制函数图像并添加标注。\n", size)
+    return prose + "\n```python\nfrom manim import *\n\nclass MathScene(Scene):\n    def construct(self):\n        self.wait()\n```\n"
+
+
+def case_unclosed_fences(size):
+    return repeat_to("说明 ``` 示例 ", size)
+
+
+def case_normal_json(size):
+    prose = repeat_to("意图分析如下，请参考。", size)
+    return prose + '\n{"intent": "CREATE", "confidence": 0.9, "reason": "新建"}\n' + prose
+
+
+def case_unbalanced_json(size):
+    return repeat_to("{a ", size)
+
+
+def case_long_play_args(size):
+    line = "        self.play(Create(circle_a), FadeIn(square_b), Write(label_c), run_time=2"
+    body = repeat_to(line + ", ", size)
+    return f"class MathScene(Scene):\n    def construct(self):\n{body})\n"
+
+
+CASES = {
+    "normal_code": (case_normal_code, legacy_extract_code, llm_parsing.extract_code_from_markdown),
+    "unclosed_fences": (case_unclosed_fences, legacy_extract_code, llm_parsing.extract_code_from_markdown),
+    "normal_json": (case_normal_json, legacy_extract_json, llm_parsing.extract_json_from_response),
+    "unbalanced_json": (case_unbalanced_json, legacy_extract_json, llm_parsing.extract_json_from_response),
+    "long_play_args": (case_long_play_args, legacy_extract_objects, llm_parsing.extract_objects_from_code),
+}
+
+
+def time_call(func, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def growth(timings):
+    """相邻规模之间的耗时倍数 (按规模比例归一化到翻倍)"""
+    ratios = []
+    for (size_a, t_a), (size_b, t_b) in zip(timings, timings[1:]):
+        if t_a > 0:
+            ratios.append(round((t_b / t_a) ** (1 / math.log2(size_b / size_a)), 2))
+    return ratios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,20000,40000,80000,160000", help="输入规模 (字符数，逗号分隔)")
+    parser.add_argument("--repeat", type=int, default=3, help="每个规模重复次数 (取最快)")
+    parser.add_argument("--legacy-budget", type=float, default=5.0, help="旧版单次耗时上限 (秒)")
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    report = {}
+    for name, (build, legacy, current) in CASES.items():
+        legacy_timings, current_timings = [], []
+        legacy_skipped = False
+        for size in sizes:
+            text = build(size)
+            current_timings.append((size, time_call(current, text, args.repeat)))
+            if not legacy_skipped:
+                elapsed = time_call(legacy, text, 1)
+                legacy_timings.append((size, elapsed))
+                legacy_skipped = elapsed > args.legacy_budget
+
+        report[name] = {
+            "legacy_ms": {size: round(t * 1000, 3) for size, t in legacy_timings},
+            "current_ms": {size: round(t * 1000, 3) for size, t in current_timings},
+            "legacy_growth_per_doubling": growth(legacy_timings),
+            "current_growth_per_doubling": growth(current_timings),
+        }
+        print(f"{name:16s} legacy={report[name]['legacy_ms']}  current={report[name]['current_ms']}")
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
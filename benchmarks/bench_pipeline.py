@@ -0,0 +1,446 @@
+# benchmarks/bench_pipeline.py
+"""
+生成流水线端到端基准测试：通过 /ws/chat 驱动完整工作流
+(LLM 使用本地模拟的 OpenAI 兼容接口，Manim 真实渲染)
+
+用法:
+    python benchmarks/bench_pipeline.py --requests 20 --concurrency 4 --unique 8 --json result.json
+    python benchmarks/bench_pipeline.py --prompts catalog/textbook_prompts.txt --llm-latency 800
+    python benchmarks/bench_pipeline.py --llm-latency 3000 --fallback-latency 300 --llm-slo 1000
+    python benchmarks/bench_pipeline.py --profile merged --llm-latency 800
+
+报告内容:
+    - 每个阶段 (queue / intent / generator / analyzer / improver / render / package) 的 p50/p95/p99
+    - 端到端耗时、吞吐量、缓存命中率 / 请求合并率
+    - 服务进程 (含 Manim 子进程) 的峰值 RSS 与 CPU 利用率
+    - 模拟 LLM 各阶段的调用次数
+    - 指定 --fallback-latency 时再启动一个备用模拟 LLM，报告模型路由的切换情况
+JSON 输出可直接在不同提交之间 diff。
+
+被测服务在独立子进程中启动，所有数据目录都指向临时目录，不会影响本地缓存和视频。
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import signal
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import httpx
+import uvicorn
+import websockets
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+STAGES = ["queue", "intent", "generator", "analyzer", "improver", "render", "package"]
+
+DEFAULT_PROMPTS = [
+    "画出 y=x^2 在 [-3,3] 上的图像",
+    "画出正弦函数 y=sin(x) 在一个周期内的图像",
+    "演示单位圆上角度变化时 sin 和 cos 的值",
+    "用正方形面积拼接证明勾股定理",
+    "演示导数的几何意义：割线逼近切线",
+    "演示定积分是曲线下方的面积",
+    "演示向量加法的平行四边形法则",
+    "画一个圆并标出半径、直径和圆心",
+]
+
+
+# ================= 🤖 模拟 LLM =================
+def mock_scene_code(seed_text):
+    """根据输入生成一个可渲染的简单场景 (不同指令产生不同视频)"""
+    digest = int(hashlib.md5(seed_text.encode("utf-8")).hexdigest(), 16)
+    a = 1 + digest % 5 / 4
+    color = ["BLUE", "RED", "GREEN", "YELLOW", "PURPLE"][digest % 5]
+    return f"""```python
+from manim import *
+import math
+import numpy as np
+
+class MathScene(Scene):
+    def construct(self):
+        axes = Axes(x_range=[-3, 3, 1], y_range=[-1, 9, 2], x_length=6, y_length=4)
+        graph = axes.plot(lambda x: {a} * x ** 2, x_range=[-2.5, 2.5], color={color})
+        label = Text("bench", font_size=28).to_corner(UL)
+        self.play(Create(axes), run_time=0.5)
+        self.play(Create(graph), FadeIn(label), run_time=1)
+        self.wait(0.3)
+```"""
+
+
+def build_mock_llm(latency, jitter, calls):
+    from prompts import SYSTEM_PROMPTS
+
+    stage_by_prompt = {text: name for name, text in SYSTEM_PROMPTS.items() if isinstance(text, str)}
+    rng = random.Random(7)
+
+    async def completions(request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        stage = stage_by_prompt.get(system, "other")
+        calls[stage] = calls.get(stage, 0) + 1
+
+        if stage == "intent_analyzer":
+            content = json.dumps({"intent": "CREATE", "confidence": 0.9, "reason": "benchmark"})
+        elif stage == "analyzer":
+            content = "布局合理，没有发现问题。"
+        elif stage == "review_improver":
+            code = mock_scene_code(user).removeprefix("```python\n").removesuffix("```")
+            content = json.dumps({"rating": "PASS", "issues": [], "code": code}, ensure_ascii=False)
+        else:
+            content = mock_scene_code(user)
+
+        await asyncio.sleep(max(latency + rng.uniform(-jitter, jitter), 0))
+        prompt_tokens = (len(system) + len(user)) // 2
+        completion_tokens = len(content) // 2
+        return JSONResponse({
+            "id": f"chatcmpl-bench-{sum(calls.values())}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+# ================= 🖥️ 被测服务 (子进程) =================
+def configure_sandbox(sandbox):
+    """把所有数据目录改到沙箱 (须在 import main 之前调用)"""
+    import config
+
+    config.DATA_DIR = os.path.join(sandbox, "data")
+    config.TEMP_DIR = os.path.join(sandbox, "temp_gen")
+    config.STATIC_DIR = os.path.join(sandbox, "static")
+    config.HLS_DIR = os.path.join(config.STATIC_DIR, "hls")
+    config.ENCODED_DIR = os.path.join(config.STATIC_DIR, "enc")
+    config.ARTIFACT_BLOB_DIR = os.path.join(config.DATA_DIR, "blobs")
+    config.STATE_DIR = os.path.join(config.DATA_DIR, "state")
+    config.STATE_SQLITE_PATH = os.path.join(config.DATA_DIR, "state.sqlite3")
+    config.RENDER_BROKER_PATH = os.path.join(config.DATA_DIR, "render_queue.sqlite3")
+    config.RENDER_OUTPUT_DIR = os.path.join(config.DATA_DIR, "render_output")
+    os.makedirs(config.STATIC_DIR, exist_ok=True)
+    return config
+
+
+def serve(args):
+    """--serve 模式：把所有数据目录改到沙箱，接上模拟 LLM 后启动 main:app"""
+    config = configure_sandbox(args.sandbox)
+    config.PIPELINE_PROFILE = args.profile
+
+    import main
+
+    main.llm_router.configure_endpoint("primary", args.llm_url, "bench")
+    if args.fallback_url:
+        main.llm_router.configure_endpoint("fallback", args.fallback_url, "bench")
+        for route in main.llm_router.routes.values():
+            route["candidates"].append(("fallback", route["candidates"][0][1]))
+    if args.llm_slo:
+        for route in main.llm_router.routes.values():
+            route["slo"] = args.llm_slo / 1000
+    try:
+        uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+    finally:
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with open(args.usage_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "self": {"utime": self_usage.ru_utime, "stime": self_usage.ru_stime, "maxrss_kb": self_usage.ru_maxrss},
+                "children": {"utime": child_usage.ru_utime, "stime": child_usage.ru_stime, "maxrss_kb": child_usage.ru_maxrss},
+            }, f)
+
+
+# ================= 📈 统计 =================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_cpu_seconds(pid):
+    """读取进程 (含已回收子进程) 累计 CPU 时间，仅 Linux 可用，否则返回 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return sum(int(v) for v in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def percentile(sorted_samples, pct):
+    index = max(math.ceil(pct / 100 * len(sorted_samples)) - 1, 0)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(samples) * 1000, 1),
+    }
+
+
+def build_workload(prompts, total, unique, seed):
+    """从指令池中取 unique 条，按固定随机种子生成 total 个请求 (重复的指令会命中缓存或被合并)"""
+    pool = prompts[:unique] if unique else prompts
+    rng = random.Random(seed)
+    return [rng.choice(pool) for _ in range(total)]
+
+
+# ================= 🚗 负载驱动 =================
+async def drive_one(ws, prompt):
+    """发送一条指令，按进度事件的切换时间计算各阶段耗时"""
+    start = time.perf_counter()
+    await ws.send(json.dumps({"prompt": prompt}))
+    stages, current, current_start, kind, first_event = {}, None, start, "generated", None
+
+    while True:
+        message = json.loads(await ws.recv())
+        if message.get("type") == "job":
+            # 任务受理回执，不算作进度事件
+            continue
+        now = time.perf_counter()
+        if first_event is None:
+            first_event = now - start
+        if message.get("type") == "progress":
+            step = message.get("step")
+            if step == "cache":
+                kind = "cached"
+            elif step == "coalesced":
+                kind = "coalesced"
+            if step != current:
+                if current in STAGES:
+                    stages[current] = stages.get(current, 0) + now - current_start
+                current, current_start = step, now
+            continue
+        if current in STAGES:
+            stages[current] = stages.get(current, 0) + now - current_start
+        ok = message.get("type") == "result" and message.get("status") == "success"
+        return {
+            "prompt": prompt,
+            "kind": kind if ok else "failed",
+            "total": now - start,
+            "first_event": first_event,
+            "stages": stages,
+            "error": None if ok else message.get("details") or message.get("message"),
+        }
+
+
+async def drive(url, workload, concurrency):
+    queue = asyncio.Queue()
+    for prompt in workload:
+        queue.put_nowait(prompt)
+    results = []
+
+    async def client_loop():
+        async with websockets.connect(url, max_size=None, ping_interval=None) as ws:
+            while True:
+                try:
+                    prompt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await drive_one(ws, prompt))
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return results
+
+
+def build_report(results, wall, usage, startup_cpu, llm_calls, args):
+    generated = [r for r in results if r["kind"] == "generated"]
+    kinds = {kind: sum(1 for r in results if r["kind"] == kind) for kind in ("generated", "cached", "coalesced", "failed")}
+    succeeded = len(results) - kinds["failed"]
+
+    cpu_seconds = None
+    peak_rss_mb = None
+    if usage:
+        cpu_seconds = sum(usage[who]["utime"] + usage[who]["stime"] for who in ("self", "children"))
+        # 扣除服务启动 (导入模块等) 消耗的 CPU，只统计压测期间
+        cpu_seconds -= startup_cpu or 0
+        peak_rss_mb = {who: round(usage[who]["maxrss_kb"] / 1024, 1) for who in ("self", "children")}
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "meta": {
+            "commit": commit,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if v is not None and k not in ("json", "serve")},
+        },
+        "requests": len(results),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(succeeded / wall, 3) if wall else None,
+        "outcomes": kinds,
+        "cache_hit_rate": round(kinds["cached"] / len(results), 3) if results else None,
+        "coalesce_rate": round(kinds["coalesced"] / len(results), 3) if results else None,
+        "end_to_end": {
+            kind: summarize([r["total"] for r in results if r["kind"] == kind])
+            for kind in ("generated", "cached", "coalesced")
+        },
+        "first_event": summarize([r["first_event"] for r in results]),
+        # 只统计完整跑完流水线的请求 (合并请求的进度是补发的，不代表真实阶段耗时)
+        "stages": {stage: summarize([r["stages"][stage] for r in generated if stage in r["stages"]]) for stage in STAGES},
+        "server": {
+            "cpu_seconds": round(cpu_seconds, 2) if cpu_seconds is not None else None,
+            "cpu_utilization": round(cpu_seconds / wall, 3) if cpu_seconds is not None and wall else None,
+            "peak_rss_mb": peak_rss_mb,
+        },
+        "llm_calls": dict(sorted(llm_calls.items())),
+        "errors": [r["error"] for r in results if r["kind"] == "failed"][:10],
+    }
+
+
+def load_prompts(path):
+    if not path:
+        return DEFAULT_PROMPTS
+    from precompute import load_catalog
+    return load_catalog(path)
+
+
+def start_mock_llm(latency_ms, jitter_ms, calls):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        build_mock_llm(latency_ms / 1000, jitter_ms / 1000, calls),
+        host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}/v1"
+
+
+def run_benchmark(args):
+    llm_calls, fallback_calls = {}, {}
+    app_port = free_port()
+    mock_llms = [start_mock_llm(args.llm_latency, args.llm_jitter, llm_calls)]
+    serve_args = ["--llm-url", mock_llms[0][2], "--profile", args.profile]
+    if args.fallback_latency is not None:
+        mock_llms.append(start_mock_llm(args.fallback_latency, args.llm_jitter, fallback_calls))
+        serve_args += ["--fallback-url", mock_llms[1][2]]
+    if args.llm_slo:
+        serve_args += ["--llm-slo", str(args.llm_slo)]
+
+    router_stats = None
+    with tempfile.TemporaryDirectory(prefix="mathspace_bench_") as sandbox:
+        usage_file = os.path.join(sandbox, "usage.json")
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve",
+             "--port", str(app_port), "--sandbox", sandbox, "--usage-file", usage_file] + serve_args,
+            cwd=ROOT_DIR, stdout=subprocess.DEVNULL if args.quiet else None
+        )
+        try:
+            deadline = time.time() + 60
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError("被测服务启动失败")
+                try:
+                    if httpx.get(f"http://127.0.0.1:{app_port}/api/ready", timeout=1).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.time() > deadline:
+                    raise RuntimeError("等待被测服务启动超时")
+                time.sleep(0.2)
+
+            startup_cpu = process_cpu_seconds(server.pid)
+            workload = build_workload(load_prompts(args.prompts), args.requests, args.unique, args.seed)
+            start = time.perf_counter()
+            results = asyncio.run(drive(f"ws://127.0.0.1:{app_port}/ws/chat", workload, args.concurrency))
+            wall = time.perf_counter() - start
+            router_stats = httpx.get(f"http://127.0.0.1:{app_port}/api/llm/router", timeout=5).json()
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+        usage = None
+        if os.path.exists(usage_file):
+            with open(usage_file, encoding="utf-8") as f:
+                usage = json.load(f)
+
+    for llm_server, llm_thread, _ in mock_llms:
+        llm_server.should_exit = True
+        llm_thread.join()
+    report = build_report(results, wall, usage, startup_cpu, llm_calls, args)
+    if args.fallback_latency is not None:
+        report["llm_calls_fallback"] = dict(sorted(fallback_calls.items()))
+    report["llm_router"] = router_stats
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=12, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=3, help="并发 WebSocket 连接数")
+    parser.add_argument("--unique", type=int, default=4, help="指令池大小 (越小缓存命中越多，0 = 全部)")
+    parser.add_argument("--prompts", help="指令目录文件 (格式同 precompute.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency", type=float, default=300, help="模拟 LLM 每次调用的延迟 (毫秒)")
+    parser.add_argument("--llm-jitter", type=float, default=50, help="延迟抖动 (毫秒)")
+    parser.add_argument("--fallback-latency", type=float, help="启动备用模拟 LLM 并设置其延迟 (毫秒)")
+    parser.add_argument("--llm-slo", type=float, help="覆盖所有阶段的延迟 SLO (毫秒)")
+    parser.add_argument("--profile", default="classic", choices=["classic", "merged"],
+                        help="流水线档位 (merged = 质检与改进合并为一次调用)")
+    parser.add_argument("--quiet", action="store_true", help="隐藏被测服务的日志")
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    # 内部使用：被测服务子进程
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--llm-url", help=argparse.SUPPRESS)
+    parser.add_argument("--fallback-url", help=argparse.SUPPRESS)
+    parser.add_argument("--sandbox", help=argparse.SUPPRESS)
+    parser.add_argument("--usage-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    report = run_benchmark(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
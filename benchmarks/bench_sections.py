@@ -0,0 +1,95 @@
+# benchmarks/bench_sections.py
+"""
+分段并行渲染基准测试：同一个长场景分别用 1 / 2 / 4 ... 个分段进程渲染，对比墙钟时间
+
+用法:
+    python benchmarks/bench_sections.py --animations 24 --run-time 2 --workers 1,2,4 --json result.json
+    python benchmarks/bench_sections.py --scene my_scene.py --workers 1,4
+
+测试场景默认是合成的多步动画 (公式 + 图形变换，每步 --run-time 秒)，
+--scene 可指定真实的场景文件 (场景类名为 MathScene)。
+workers=1 即原来的整段渲染；报告每种配置的墙钟时间、CPU 秒数和相对整段渲染的加速比。
+需要本机安装 Manim 和 ffmpeg。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_jobs
+
+
+def synthetic_scene(animations, run_time):
+    steps = []
+    for i in range(animations):
+        steps.append(f"""
+        square = Square(side_length=1.5, color=BLUE).shift(LEFT * 3)
+        formula = MathTex(r"x_{{{i}}} = {i}^2 = {i * i}").to_edge(UP)
+        self.play(Create(square), Write(formula), run_time={run_time / 2})
+        self.play(square.animate.shift(RIGHT * 6).rotate(PI), FadeOut(formula), run_time={run_time / 2})
+        self.remove(square)""")
+    return """from manim import *
+
+
+class MathScene(Scene):
+    def construct(self):""" + "".join(steps) + "\n"
+
+
+def render_once(code, workers, quality):
+    render_jobs.RENDER_SECTION_WORKERS = workers
+    messages = []
+    with tempfile.TemporaryDirectory(prefix="mathspace_bench_sections_") as output_dir:
+        job = render_jobs.new_render_job("bench", code, "MathScene", "bench_sections", quality=quality)
+        start = time.perf_counter()
+        result = render_jobs.execute_render_job(job, output_dir, emit=messages.append)
+        wall = time.perf_counter() - start
+        size = os.path.getsize(result["video_path"]) if result.get("video_path") else 0
+    usage = result.get("usage") or {}
+    return {
+        "workers": workers,
+        "returncode": result.get("returncode"),
+        "wall_seconds": round(wall, 2),
+        "cpu_seconds": usage.get("cpu_seconds"),
+        "sections": usage.get("sections", 1),
+        "video_bytes": size,
+        "events": messages,
+        "stderr": (result.get("stderr") or "")[-300:],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--animations", type=int, default=24, help="合成场景的步骤数")
+    parser.add_argument("--run-time", type=float, default=2.0, help="合成场景每步的动画秒数")
+    parser.add_argument("--scene", help="使用真实场景文件代替合成场景")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的分段进程数")
+    parser.add_argument("--quality", default="-ql")
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    args = parser.parse_args()
+
+    if args.scene:
+        with open(args.scene, "r", encoding="utf-8") as f:
+            code = f.read()
+    else:
+        code = synthetic_scene(args.animations, args.run_time)
+
+    runs = [render_once(code, int(w), args.quality) for w in args.workers.split(",")]
+    baseline = next((r["wall_seconds"] for r in runs if r["workers"] == 1 and r["returncode"] == 0), None)
+    for run in runs:
+        if baseline and run["returncode"] == 0:
+            run["speedup"] = round(baseline / run["wall_seconds"], 2)
+
+    report = {"cpu_count": os.cpu_count(), "quality": args.quality, "runs": runs}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/bench_startup.py
+"""
+服务启动基准测试：从启动进程到 /api/ready 返回 200 的时间 (重启 / 扩容时新实例多快能接流量)
+
+用法:
+    python benchmarks/bench_startup.py --stale-dirs 0,200,2000 --files-per-dir 20 --repeat 3
+    python benchmarks/bench_startup.py --stale-dirs 2000 --sync-cleanup --json before.json
+
+每次运行前在沙箱的 temp_gen 下造出指定数量的 req_* 残留目录 (模拟崩溃后的现场)，然后启动被测服务并轮询就绪探针。
+报告内容 (多次重复取中位数):
+    - ready_seconds:   启动进程 → 就绪探针返回 200 (后台的视频仓库对账和 LLM 客户端预热已完成)
+    - import_seconds:  import main 的耗时
+    - startup_seconds: 启动清理 (lifespan) 的耗时
+    - settled_seconds: 启动进程 → 残留目录后台删除也完成
+--sync-cleanup 关闭后台删除 (启动时同步 rmtree)，用于对比。
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from bench_pipeline import ROOT_DIR, configure_sandbox, free_port
+
+RESULT_KEYS = ["ready_seconds", "import_seconds", "startup_seconds", "settled_seconds"]
+
+
+def serve(args):
+    """--serve 模式：数据目录指向沙箱后启动 main:app，并记录 import main 的耗时"""
+    import uvicorn
+
+    config = configure_sandbox(args.sandbox)
+    config.STARTUP_BACKGROUND_CLEANUP = not args.sync_cleanup
+    start = time.perf_counter()
+    import main
+    with open(os.path.join(args.sandbox, "import.json"), "w", encoding="utf-8") as f:
+        json.dump({"import_seconds": time.perf_counter() - start}, f)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def make_stale_dirs(temp_dir, count, files_per_dir):
+    """模拟崩溃后留下的请求目录 (每个目录里有几个小文件和一层子目录)"""
+    for i in range(count):
+        path = os.path.join(temp_dir, f"req_{i:06d}", "media")
+        os.makedirs(path)
+        for j in range(files_per_dir):
+            with open(os.path.join(path, f"part_{j}.bin"), "wb") as f:
+                f.write(b"\0" * 4096)
+
+
+def start_once(stale_dirs, files_per_dir, sync_cleanup, quiet):
+    with tempfile.TemporaryDirectory(prefix="mathspace_bench_startup_") as sandbox:
+        temp_dir = os.path.join(sandbox, "temp_gen")
+        os.makedirs(temp_dir)
+        make_stale_dirs(temp_dir, stale_dirs, files_per_dir)
+
+        port = free_port()
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--sandbox", sandbox]
+        if sync_cleanup:
+            cmd.append("--sync-cleanup")
+        start = time.perf_counter()
+        server = subprocess.Popen(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL if quiet else None)
+        result = {"stale_dirs": stale_dirs}
+        try:
+            deadline = start + 300
+            ready = None
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError("被测服务启动失败")
+                try:
+                    response = httpx.get(f"http://127.0.0.1:{port}/api/ready", timeout=1)
+                    if response.status_code == 200:
+                        ready = response.json()
+                        if "ready_seconds" not in result:
+                            result["ready_seconds"] = time.perf_counter() - start
+                            result["startup_seconds"] = ready["startup_seconds"]
+                        if ready["scratch_purge_pending"] == 0:
+                            result["settled_seconds"] = time.perf_counter() - start
+                            break
+                except httpx.HTTPError:
+                    pass
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("等待被测服务就绪超时")
+                time.sleep(0.01)
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+        with open(os.path.join(sandbox, "import.json"), encoding="utf-8") as f:
+            result.update(json.load(f))
+        result["leftover_dirs"] = sum(1 for name in os.listdir(temp_dir) if not name.startswith("worker_"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stale-dirs", default="0,200,2000", help="逗号分隔的残留目录数")
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="每种配置重复次数 (取中位数)")
+    parser.add_argument("--sync-cleanup", action="store_true", help="启动时同步删除残留目录 (对比用)")
+    parser.add_argument("--quiet", action="store_true", help="隐藏被测服务的日志")
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    # 内部使用：被测服务子进程
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--sandbox", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    runs = []
+    for count in (int(c) for c in args.stale_dirs.split(",")):
+        samples = [start_once(count, args.files_per_dir, args.sync_cleanup, args.quiet) for _ in range(args.repeat)]
+        run = {"stale_dirs": count, "leftover_dirs": max(s["leftover_dirs"] for s in samples)}
+        for key in RESULT_KEYS:
+            run[key] = round(statistics.median(s[key] for s in samples), 3)
+        runs.append(run)
+
+    report = {
+        "cleanup": "sync" if args.sync_cleanup else "background",
+        "files_per_dir": args.files_per_dir,
+        "repeat": args.repeat,
+        "runs": runs,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# benchmarks/bench_video_serving.py
+"""
+视频分发基准测试：对比通用 StaticFiles 挂载 (/static) 与视频专用接口 (/video)
+
+用法:
+    python benchmarks/bench_video_serving.py --size-mb 20 --seeks 50 --json result.json
+
+测试场景:
+    1. full        整文件下载
+    2. seek        随机拖动 (Range 请求 256KB)
+    3. revalidate  携带 ETag 的条件请求 (浏览器/CDN 回源校验)
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from artifact_store import file_sha256
+from video_serving import build_video_response
+
+
+def build_app(media_dir, name, content_hash):
+    async def video(request):
+        return build_video_response(request, os.path.join(media_dir, name), content_hash)
+
+    return Starlette(routes=[
+        Route("/video/{name}", video, methods=["GET", "HEAD"]),
+        Mount("/static", StaticFiles(directory=media_dir)),
+    ])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_samples, pct):
+    index = max(math.ceil(pct / 100 * len(sorted_samples)) - 1, 0)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def run_scenarios(client, url, file_size, args):
+    result = {}
+
+    timings, transferred = [], 0
+    for _ in range(args.full):
+        start = time.perf_counter()
+        r = client.get(url)
+        timings.append(time.perf_counter() - start)
+        transferred += len(r.content)
+    result["full"] = {**summarize(timings), "bytes": transferred}
+
+    rng = random.Random(42)
+    timings, transferred, statuses = [], 0, set()
+    for _ in range(args.seeks):
+        offset = rng.randrange(0, max(file_size - args.seek_bytes, 1))
+        start = time.perf_counter()
+        r = client.get(url, headers={"range": f"bytes={offset}-{offset + args.seek_bytes - 1}"})
+        timings.append(time.perf_counter() - start)
+        transferred += len(r.content)
+        statuses.add(r.status_code)
+    result["seek"] = {**summarize(timings), "bytes": transferred, "statuses": sorted(statuses)}
+
+    first = client.get(url, headers={"range": "bytes=0-0"})
+    etag = first.headers.get("etag")
+    timings, statuses = [], set()
+    for _ in range(args.seeks):
+        start = time.perf_counter()
+        r = client.get(url, headers={"if-none-match": etag} if etag else {})
+        timings.append(time.perf_counter() - start)
+        statuses.add(r.status_code)
+    result["revalidate"] = {
+        **summarize(timings),
+        "statuses": sorted(statuses),
+        "cache_control": first.headers.get("cache-control"),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--full", type=int, default=5)
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--seek-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--json", help="结果输出路径 (JSON)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as media_dir:
+        name = "video_bench.mp4"
+        path = os.path.join(media_dir, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+        file_size = os.path.getsize(path)
+
+        port = free_port()
+        config = uvicorn.Config(build_app(media_dir, name, file_sha256(path)),
+                                host="127.0.0.1", port=port, log_level="warning")
+        server = uvicorn.Server(config)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        report = {"file_bytes": file_size, "endpoints": {}}
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            for label, url in (("static_mount", f"/static/{name}"), ("video_endpoint", f"/video/{name}")):
+                report["endpoints"][label] = run_scenarios(client, url, file_size, args)
+
+        server.should_exit = True
+        thread.join()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
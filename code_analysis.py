@@ -0,0 +1,290 @@
+# code_analysis.py
+"""
+MathSpace 场景代码分析器
+一次 ast.NodeVisitor 遍历同时提取：场景类、方法、变量、带构造类型的命名对象、
+self.play 的动画与作用对象、坐标系使用情况，以及上下文摘要需要的源码片段。
+结果按源码哈希缓存，同一份代码在一次请求的多个阶段 (状态分析 / 上下文构建 / 渲染) 只解析一次。
+"""
+
+import re
+import ast
+import hashlib
+from collections import OrderedDict
+
+from llm_parsing import extract_objects_from_code
+
+AXES_TYPES = {"Axes", "ThreeDAxes", "NumberPlane", "ComplexPlane", "PolarPlane", "NumberLine"}
+SCENE_ACTIONS = ("play", "wait", "add", "remove", "move_camera", "set_camera_orientation")
+MAX_SEGMENT_CHARS = 120
+TEX_CLASSES = {"MathTex", "Tex"}
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+
+
+def _shorten(text, limit=MAX_SEGMENT_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _call_name(func):
+    """调用目标的可读名称：Circle / axes.plot / self.camera.frame.animate.scale"""
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if isinstance(func, ast.Name):
+        parts.append(func.id)
+    elif isinstance(func, ast.Call):
+        parts.append(_call_name(func.func) + "()")
+    else:
+        return ""
+    return ".".join(reversed(parts))
+
+
+def _root_name(node):
+    """表达式最左侧的变量名 (circle.animate.shift → circle，self.dot → dot)"""
+    while True:
+        if isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Attribute):
+            if isinstance(node.value, ast.Name) and node.value.id == "self":
+                return node.attr
+            node = node.value
+        elif isinstance(node, ast.Subscript):
+            node = node.value
+        elif isinstance(node, ast.Starred):
+            node = node.value
+        else:
+            break
+    return node.id if isinstance(node, ast.Name) and node.id != "self" else None
+
+
+def _target_name(target):
+    if isinstance(target, ast.Name):
+        return target.id
+    if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == "self":
+        return target.attr
+    return None
+
+
+class SceneAnalyzer(ast.NodeVisitor):
+    """单次遍历的分析器，构造后调用 run() 得到结果"""
+
+    def __init__(self, code):
+        self.code = code
+        # ast 的列偏移是 UTF-8 字节偏移；预先计算行首偏移，取源码片段是 O(片段长度)
+        # (ast.get_source_segment 每次调用都会重新切分整份源码)
+        self.source = code.encode("utf-8")
+        self.line_starts = [0]
+        for line in self.source.splitlines(keepends=True):
+            self.line_starts.append(self.line_starts[-1] + len(line))
+
+        self.class_stack = []
+        self.function_depth = 0
+        self.scene_node = None
+        self.result = {
+            "scene_class": None,
+            "scene_bases": [],
+            "classes": [],
+            "methods": [],
+            "variables": [],
+            "mobjects": [],
+            "animations": [],
+            "plays": [],
+            "has_axes": False,
+            "axes": [],
+            "objects": [],
+            "line_count": code.count("\n") + 1,
+            # 上下文摘要用的源码片段 (不写入对话记录)
+            "context": {"imports": [], "helpers": [], "mobjects": [], "actions": []},
+        }
+        self._objects_seen = set()
+
+    def run(self):
+        self.visit(ast.parse(self.code))
+        return self.result
+
+    # ---------- 工具 ----------
+    def segment(self, node):
+        start = self.line_starts[node.lineno - 1] + node.col_offset
+        end = self.line_starts[node.end_lineno - 1] + node.end_col_offset
+        return self.source[start:end].decode("utf-8", errors="replace")
+
+    def add_object(self, name):
+        if name and name not in self._objects_seen:
+            self._objects_seen.add(name)
+            self.result["objects"].append(name)
+
+    def in_scene(self):
+        return self.scene_node is not None and self.class_stack and self.class_stack[-1] is self.scene_node
+
+    # ---------- 节点 ----------
+    def visit_Import(self, node):
+        if not self.class_stack and not self.function_depth:
+            self.result["context"]["imports"].append(self.segment(node))
+
+    visit_ImportFrom = visit_Import
+
+    def visit_ClassDef(self, node):
+        self.result["classes"].append(node.name)
+        base_names = [_call_name(b).rsplit(".", 1)[-1] for b in node.bases]
+        if self.scene_node is None and any("Scene" in b for b in base_names):
+            self.scene_node = node
+            self.result["scene_class"] = node.name
+            self.result["scene_bases"] = [self.segment(b) for b in node.bases]
+
+        self.class_stack.append(node)
+        self.generic_visit(node)
+        self.class_stack.pop()
+
+    def visit_FunctionDef(self, node):
+        self.result["methods"].append(node.name)
+        if self.in_scene() and not self.function_depth and node.name != "construct":
+            args = ", ".join(a.arg for a in node.args.args)
+            self.result["context"]["helpers"].append(f"{node.name}({args})")
+
+        self.function_depth += 1
+        self.generic_visit(node)
+        self.function_depth -= 1
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node):
+        value = node.value
+        ctor = _call_name(value.func) if isinstance(value, ast.Call) else ""
+        # 构造器 (Circle(...)) 或对象方法 (axes.plot(...))；跳过 len/range 等内置函数
+        is_mobject = bool(ctor) and ("." in ctor or ctor[:1].isupper())
+
+        for target in node.targets:
+            name = _target_name(target)
+            if isinstance(target, ast.Name):
+                self.result["variables"].append(target.id)
+            if not is_mobject:
+                continue
+            if name:
+                self.result["mobjects"].append({"name": name, "type": ctor, "line": node.lineno})
+                self.add_object(name)
+                if ctor in AXES_TYPES:
+                    self.result["axes"].append(name)
+            if self.in_scene():
+                self.result["context"]["mobjects"].append(f"{self.segment(target)} = {_shorten(self.segment(value))}")
+
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in AXES_TYPES:
+            self.result["has_axes"] = True
+
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == "self":
+            action = func.attr
+            if action == "play":
+                self._record_play(node)
+            elif action == "add":
+                for arg in node.args:
+                    self.add_object(_root_name(arg))
+            if action in SCENE_ACTIONS and self.in_scene():
+                self.result["context"]["actions"].append(_shorten(self.segment(node)))
+
+        self.generic_visit(node)
+
+    def _record_play(self, node):
+        animations, targets = [], []
+        for arg in node.args:
+            if isinstance(arg, ast.Call):
+                name = _call_name(arg.func)
+                if ".animate" in name:
+                    # circle.animate.shift(UP)
+                    animations.append("animate." + name.rsplit(".", 1)[-1])
+                    targets.append(_root_name(arg))
+                else:
+                    animations.append(name)
+                    targets.extend(_root_name(a) for a in arg.args)
+            else:
+                targets.append(_root_name(arg))
+
+        targets = [t for t in targets if t]
+        play = {"line": node.lineno, "animations": animations, "targets": targets}
+        for keyword in node.keywords:
+            if keyword.arg == "run_time" and isinstance(keyword.value, ast.Constant):
+                play["run_time"] = keyword.value.value
+        self.result["plays"].append(play)
+        self.result["animations"].extend(animations)
+        for target in targets:
+            self.add_object(target)
+
+
+class CodeAnalyzer:
+    """按源码哈希缓存分析结果 (返回值在多处共享，调用方不要修改)"""
+
+    def __init__(self, cache_size=64):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def analyze(self, code):
+        """分析场景代码；无法解析时返回 {"error": ...}"""
+        key = hashlib.sha1(code.encode("utf-8")).hexdigest()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        try:
+            result = SceneAnalyzer(code).run()
+        except (SyntaxError, ValueError):
+            result = {"error": "代码解析失败"}
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def lint(self, code):
+        """
+        渲染前的廉价静态检查 (修复候选的第一道筛选)，返回问题描述列表，空列表表示通过：
+        语法错误、缺少场景类、缺少 manim 导入、使用了未导入的 np / math、MathTex 中含中文
+        """
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return [f"语法错误 (第 {e.lineno} 行): {e.msg}"]
+        problems = []
+        if not self.analyze(code).get("scene_class"):
+            problems.append("没有找到 Scene 子类")
+
+        imported = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imported.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                imported.update(alias.asname or alias.name for alias in node.names)
+                if node.module and node.module.split(".")[0] == "manim":
+                    imported.add("manim")
+        if "manim" not in imported:
+            problems.append("缺少 from manim import *")
+        # from manim import * 会一并带入 np 等名字，此时不做判断
+        used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+        for name, statement in (("np", "import numpy as np"), ("math", "import math")):
+            if name in used and name not in imported and "*" not in imported:
+                problems.append(f"使用了 {name} 但没有 {statement}")
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and _call_name(node.func) in TEX_CLASSES:
+                for arg in node.args:
+                    if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and CJK_PATTERN.search(arg.value):
+                        problems.append(f"第 {node.lineno} 行 {_call_name(node.func)} 中包含中文，应改用 Text()")
+                        break
+        return problems
+
+    def objects(self, code):
+        """静态提取对象名 (动态侦探的备份方案)；代码无法解析时退化为正则扫描"""
+        analysis = self.analyze(code)
+        if "error" in analysis:
+            return extract_objects_from_code(code)
+        return list(analysis["objects"])
+
+    @staticmethod
+    def record(analysis):
+        """写入对话记录的精简版本 (去掉源码片段)"""
+        return {k: v for k, v in analysis.items() if k != "context"}
+
+
+code_analyzer = CodeAnalyzer()
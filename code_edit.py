@@ -0,0 +1,122 @@
+# code_edit.py
+"""
+MathSpace 增量编辑协议
+MODIFY / ADD 意图下，LLM 只返回针对当前场景的 unified diff，
+由本地解析、定位、应用并做语法校验，避免整文件重写带来的输出 token 开销。
+"""
+
+import re
+import ast
+
+from llm_parsing import iter_fenced_blocks
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    """补丁无法解析、定位或应用后代码不合法"""
+    pass
+
+
+class EmptyPatch(PatchError):
+    """
+    diff 中没有任何修改：对改进器表示无需改动；
+    对生成器 (用户要求修改场景) 说明指令没有落实，与其他 PatchError 一样按失败处理
+    """
+    pass
+
+
+def extract_diff_from_response(text):
+    """从 LLM 回复中取出 diff 文本（优先取 ```diff 代码块）"""
+    for language, body in iter_fenced_blocks(text):
+        if language in ("", "diff", "patch") and "@@" in body:
+            return body
+    if "@@" in text:
+        return text
+    raise PatchError("回复中没有找到 diff")
+
+
+def parse_unified_diff(diff_text):
+    """
+    解析 unified diff，返回 hunk 列表：
+    {"hint": 原文件起始行号 (0-based) 或 None, "lines": [(op, text), ...]}，op 为 ' ' / '-' / '+'
+    """
+    hunks = []
+    current = None
+    for raw in diff_text.splitlines():
+        if raw.startswith("---") or raw.startswith("+++"):
+            continue
+        if raw.startswith("@@"):
+            header = HUNK_HEADER_PATTERN.match(raw)
+            current = {"hint": int(header.group(1)) - 1 if header else None, "lines": []}
+            hunks.append(current)
+            continue
+        if current is None:
+            continue
+        if raw.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        op, text = (raw[0], raw[1:]) if raw else (" ", "")
+        if op not in (" ", "-", "+"):
+            # LLM 常会漏掉上下文行的前导空格，按上下文行处理
+            op, text = " ", raw
+        current["lines"].append((op, text))
+
+    hunks = [h for h in hunks if any(op != " " for op, _ in h["lines"])]
+    if not hunks:
+        raise EmptyPatch("diff 中没有任何修改")
+    return hunks
+
+
+def _find_block(lines, block, hint, normalize):
+    """在 lines 中查找 block，多处匹配时取离 hint 最近的一处"""
+    if not block:
+        return hint if hint is not None else len(lines)
+    target = [normalize(x) for x in block]
+    candidates = [
+        i for i in range(len(lines) - len(block) + 1)
+        if normalize(lines[i]) == target[0]
+        and [normalize(x) for x in lines[i:i + len(block)]] == target
+    ]
+    if not candidates:
+        return None
+    if hint is None:
+        if len(candidates) > 1:
+            raise PatchError(f"补丁上下文不唯一: {block[0].strip()}")
+        return candidates[0]
+    return min(candidates, key=lambda i: abs(i - hint))
+
+
+def apply_unified_diff(source, diff_text):
+    """把 diff 应用到 source 上，返回新代码；失败抛出 PatchError"""
+    hunks = parse_unified_diff(diff_text)
+    lines = source.splitlines()
+    offset = 0
+
+    for hunk in hunks:
+        old_block = [text for op, text in hunk["lines"] if op in (" ", "-")]
+        new_block = [text for op, text in hunk["lines"] if op in (" ", "+")]
+        hint = hunk["hint"] + offset if hunk["hint"] is not None else None
+
+        position = _find_block(lines, old_block, hint, lambda x: x.rstrip())
+        if position is None:
+            # 放宽匹配：忽略缩进差异 (LLM 偶尔会弄乱上下文行的缩进)
+            position = _find_block(lines, old_block, hint, lambda x: x.strip())
+        if position is None:
+            preview = old_block[0].strip() if old_block else ""
+            raise PatchError(f"无法在当前代码中定位补丁: {preview}")
+
+        lines[position:position + len(old_block)] = new_block
+        offset += len(new_block) - len(old_block)
+
+    return "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+
+
+def apply_llm_patch(source, response_text):
+    """解析 LLM 回复中的补丁并应用，结果必须能通过语法检查"""
+    new_code = apply_unified_diff(source, extract_diff_from_response(response_text))
+    try:
+        ast.parse(new_code)
+    except SyntaxError as e:
+        raise PatchError(f"应用补丁后代码语法错误: 第 {e.lineno} 行 {e.msg}")
+    return new_code
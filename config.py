@@ -15,9 +15,18 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMP_DIR = os.path.join(BASE_DIR, "temp_gen") 
-SCENE_FILE = os.path.join(TEMP_DIR, "current_scene.py") 
-HISTORY_FILE = os.path.join(TEMP_DIR, "context_history.txt")
-CONVERSATION_FILE = os.path.join(TEMP_DIR, "conversation.json")
+DATA_DIR = os.path.join(BASE_DIR, "data")  # 持久化数据（重启不清理）
+ARTIFACT_BLOB_DIR = os.path.join(DATA_DIR, "blobs")
+HLS_DIR = os.path.join(STATIC_DIR, "hls")
+ENCODED_DIR = os.path.join(STATIC_DIR, "enc")   # 转码产物 (按视频分目录)
+
+# ================= 🗃️ 状态后端配置 =================
+# 缓存 / 对话记录 / 当前场景 / 视频索引的存放位置
+# - "local":  本地文件 (单机，可多 worker)
+# - "sqlite": SQLite 数据库，多机部署时放在共享卷上
+STATE_BACKEND = "local"
+STATE_DIR = os.path.join(DATA_DIR, "state")
+STATE_SQLITE_PATH = os.path.join(DATA_DIR, "state.sqlite3")
 
 # ================= ⚙️ 系统配置 =================
 MAX_RETRIES = 2
@@ -25,6 +34,171 @@ MAX_HISTORY_ENTRIES = 15
 REQUEST_TIMEOUT = 120.0
 MANIM_TIMEOUT = 300
 
+# ================= 🚀 启动配置 =================
+STARTUP_BACKGROUND_CLEANUP = True   # 残留临时目录先原子改名，再由后台线程删除，不阻塞启动
+STARTUP_PREWARM_LLM = True          # 就绪后在后台线程导入 openai SDK，首个请求不用等待导入
+
+# ================= 🧩 上下文预算配置 =================
+# 各阶段发送给 LLM 的"当前场景"上下文 token 上限
+CONTEXT_TOKEN_BUDGETS = {
+    "intent": 300,
+    "generator": 1500,
+    "default": 600,
+}
+CONTEXT_RECENT_ANIMATIONS = 5  # 摘要中保留最近 K 个动画
+
+# ================= ✂️ 增量编辑配置 =================
+EDIT_MODE_ENABLED = True                 # MODIFY/ADD 时让 LLM 返回 diff 而不是整文件
+EDIT_MODE_INTENTS = ["MODIFY", "ADD"]
+
+# ================= 🧪 流水线档位配置 =================
+# - "classic": 质检 (analyzer) 与改进 (improver) 两次调用
+# - "merged":  一次调用同时完成质检和改进，输出 JSON {rating, issues, code}，解析失败时退回 classic
+#   (增量编辑 diff 模式下仍走 classic，保持只输出 diff 的 token 优势)
+PIPELINE_PROFILE = "classic"
+
+# ================= 🧠 阶段记忆与断点配置 =================
+# 确定性的低温阶段 (意图识别 / 质检)：(阶段, 模型, 温度, 系统提示词, 用户输入) 完全相同时直接复用上次输出
+STAGE_MEMO_STAGES = ["intent", "analyzer"]
+STAGE_MEMO_MAX_TEMPERATURE = 0.2     # 实际温度高于该值的调用不记忆 (输出本身带随机性)
+STAGE_MEMO_TTL = 24 * 3600           # 记忆有效期 (秒)
+STAGE_MEMO_MAX_ENTRIES = 300         # 超出后淘汰最早的记忆
+STAGE_MEMO_MAX_CHARS = 8000          # 单条输出超过该长度不记忆
+STAGE_MEMO_REFRESH_INTERVAL = 30     # 内存中的记忆副本多久从共享状态重新读取一次 (秒)
+# 断点：每个请求的生成器 / 改进器输出按 (指令, 当前场景代码) 保存，失败后重新提交从最后完成的阶段继续
+CHECKPOINT_ENABLED = True
+CHECKPOINT_TTL = 3600
+CHECKPOINT_MAX_ENTRIES = 100
+
+# ================= 🏭 渲染集群配置 =================
+# - "inline": API 进程内直接渲染 (单机默认)
+# - "broker": 渲染任务写入队列，由 render_worker.py 独立进程/其他机器执行
+RENDER_MODE = "inline"
+RENDER_BROKER_PATH = os.path.join(DATA_DIR, "render_queue.sqlite3")
+RENDER_OUTPUT_DIR = os.path.join(DATA_DIR, "render_output")  # worker 产出的视频 (多机时放共享卷)
+RENDER_POLL_INTERVAL = 0.5
+RENDER_JOB_TIMEOUT = MANIM_TIMEOUT + 300   # 含排队等待时间
+RENDER_HEARTBEAT_TIMEOUT = 60              # worker 心跳超时后任务重新排队
+RENDER_MAX_ATTEMPTS = 2
+
+# ================= 🧭 模型路由配置 =================
+LLM_ENDPOINTS = {               # OpenAI 兼容端点
+    "primary": {"base_url": BASE_URL, "api_key": API_KEY},
+}
+# 每个阶段按优先级排列的候选 (端点, 模型)、生成参数和延迟 SLO (秒)
+# 意图识别和质检是简单任务，可以换成更小更快的模型；temperature 为 None 时使用模型默认值
+# 输出因 max_tokens 被截断 (finish_reason == "length") 时，按 LLM_LENGTH_RETRY_FACTOR 放大上限重试一次
+LLM_STAGE_ROUTES = {
+    "intent":    {"candidates": [("primary", MODEL_NAME)], "temperature": 0.1, "max_tokens": 512, "slo": 15},
+    "generator": {"candidates": [("primary", MODEL_NAME)], "temperature": 0.7, "max_tokens": 4096, "slo": 60},
+    "analyzer":  {"candidates": [("primary", MODEL_NAME)], "temperature": 0.1, "max_tokens": 2048, "slo": 30},
+    "improver":  {"candidates": [("primary", MODEL_NAME)], "temperature": 0.3, "max_tokens": 4096, "slo": 60},
+    "reviewer":  {"candidates": [("primary", MODEL_NAME)], "temperature": 0.3, "max_tokens": 4096, "slo": 60},
+    "fixer":     {"candidates": [("primary", MODEL_NAME)], "temperature": None, "max_tokens": 4096, "slo": 60},
+}
+LLM_LENGTH_RETRY_FACTOR = 2       # 截断重试时 max_tokens 的放大倍数
+LLM_LENGTH_RETRY_MAX_TOKENS = 8192   # 截断重试的 max_tokens 上限
+LLM_ROUTER_WINDOW = 20            # 每个候选统计最近 N 次调用
+LLM_ROUTER_MAX_ERROR_RATE = 0.5   # 错误率超过该值进入冷却
+LLM_ROUTER_COOLDOWN = 60          # 冷却时间 (秒)，期间排到备选之后
+
+# ================= 🚦 公平调度配置 =================
+# LLM 调用和渲染前的名额数 (每个进程)，超出的任务按会话公平 + 成本排队
+SCHEDULER_SLOTS = {"llm": 8, "render": 2}
+SCHEDULER_SESSION_WEIGHTS = {"precompute": 0.25}   # 会话权重 (缓存预热只占 1/4 份额)
+SCHEDULER_ETA_INTERVAL = 2.0                       # 排队时刷新预计等待时间的间隔 (秒)
+SCHEDULER_SECONDS_PER_COST = {"llm": 8.0, "render": 20.0}  # 每单位成本的初始耗时估计，运行后按实测修正
+RENDER_QUALITY_COST = {"-ql": 1.0, "-qm": 2.0, "-qh": 4.0, "-qp": 6.0, "-qk": 8.0}
+
+# ================= 💰 用量与预算配置 =================
+LLM_PRICE_CURRENCY = "¥"
+LLM_PRICE_PER_MILLION = {       # (输入, 输出) 每百万 token 的价格
+    "deepseek-chat": (2.0, 8.0),
+    "default": (2.0, 8.0),
+}
+BUDGET_SESSION_DAILY = 2.0      # 单个会话每日费用预算，0 = 不限制
+BUDGET_GLOBAL_DAILY = 100.0     # 全站每日费用预算，0 = 不限制
+BUDGET_ECONOMY_RATIO = 0.8      # 用到该比例后跳过质检分析器
+BUDGET_FALLBACK_MODEL = ""      # 超出预算后改用的便宜模型 (需在 LLM_PRICE_PER_MILLION 中定价)，空 = 不换模型
+
+# ================= 📮 任务事件日志配置 =================
+JOB_EVENT_LOG_SIZE = 200      # 每个任务保留的最近事件数 (供断线重连补发)
+JOB_RETENTION_SECONDS = 600   # 任务结束后在内存中保留的时间
+JOB_HISTORY_LIMIT = 100       # 共享状态中保存的已结束任务数 (跨 worker 重连)
+
+# ================= 🔎 请求追踪配置 =================
+TRACE_BUFFER_SIZE = 200       # 内存中保留最近多少条请求的 trace
+TRACE_EXPORT_FILE = ""        # OTLP/JSON 导出文件 (每行一条 trace)，留空不导出
+TRACE_SERVICE_NAME = "mathspace"
+
+# ================= 🧰 场景模板配置 =================
+TEMPLATE_ENABLED = True           # 常见指令直接套用参数化模板，跳过所有 LLM 阶段
+TEMPLATE_MIN_CONFIDENCE = 0.75    # 低于该置信度 (指令被模板解释的比例) 时走完整流水线
+TEMPLATE_MATCH_TIMEOUT = 2.0      # 模板匹配 (含表达式采样) 在线程里执行的超时 (秒)，超时走完整流水线
+
+# ================= 🛡️ 渲染资源限制 =================
+# 每个 Manim 渲染进程 (连同其 ffmpeg / latex 子进程) 的资源上限，0 / None 表示不限制
+RENDER_MEMORY_LIMIT_MB = 4096     # cgroup: memory.max；否则为 RLIMIT_AS (虚拟地址空间，需留足余量)
+RENDER_CPU_LIMIT_SECONDS = MANIM_TIMEOUT   # RLIMIT_CPU (每个进程的 CPU 秒数)
+RENDER_CPU_QUOTA = 1.0            # cgroup: cpu.max，最多占用的核数
+RENDER_PIDS_LIMIT = 64            # cgroup: pids.max
+RENDER_NICE = 10                  # 渲染进程降低调度优先级
+RENDER_IONICE_LEVEL = 7           # best-effort 类中的 IO 优先级 (0-7)，None 表示不设置
+RENDER_KILL_GRACE = 5             # 超时后 SIGTERM 到 SIGKILL 的等待秒数
+# cgroups v2：由管理员预先创建并委派给服务用户的目录，存在且可写时自动启用，否则退回 rlimit
+RENDER_CGROUP_ROOT = "/sys/fs/cgroup/mathspace"
+
+# ================= 🎞️ 分段并行渲染配置 =================
+# 长场景切成多段，各段在独立 Manim 进程中并行渲染后用 ffmpeg 无损拼接
+# 默认按 CPU 核数平分给同时进行的渲染任务 (每个进程受 RENDER_CPU_QUOTA 限制约占一核)，小于 2 表示关闭
+RENDER_SECTION_WORKERS = max(1, (os.cpu_count() or 1) // SCHEDULER_SLOTS["render"])
+RENDER_SECTION_MIN_SECONDS = 10   # 每段至少多少秒动画，动画总时长不足两段时整段渲染
+
+# ================= 🩹 并行修复配置 =================
+# 渲染失败时按这些温度同时请求多个修复候选，先校验通过并渲染成功的胜出，其余取消
+# 只保留一个温度即退回串行修复 (修复 → 渲染 → 再修复)
+FIXER_CANDIDATE_TEMPERATURES = [0.2, 0.6, 1.0]
+FIXER_DRY_RUN = True              # 候选通过静态检查后先空跑 construct (跳过全部动画)，仅 inline 模式
+
+# ================= 🗄️ 视频仓库配置 =================
+ARTIFACT_QUOTA_MB = 2048      # 视频总磁盘配额，超出后按 LRU 淘汰
+ARTIFACT_MAX_AGE_DAYS = 30    # 超过该天数未被访问的视频会被清理 (0 = 不限制)
+ARTIFACT_ACCESS_FLUSH_INTERVAL = 60   # 访问时间先记在内存，每隔该秒数 (或淘汰前) 批量写回索引
+
+# ================= 📺 视频分发配置 =================
+VIDEO_CACHE_MAX_AGE = 31536000   # 视频文件名唯一且内容不变，可长期缓存 (1 年)
+VIDEO_CHUNK_SIZE = 256 * 1024    # 无 sendfile 时的分块大小
+
+# ================= 📦 视频封装配置 =================
+FFMPEG_BIN = "ffmpeg"
+FFPROBE_BIN = "ffprobe"
+PACKAGING_WORKERS = 2         # 后台封装队列的并发数
+PACKAGING_TIMEOUT = 120
+PACKAGING_FASTSTART = True    # moov 前置，边下边播
+HLS_ENABLED = False           # 长视频额外生成 HLS 切片
+HLS_MIN_DURATION = 20         # 超过该时长 (秒) 才切片
+HLS_SEGMENT_SECONDS = 4
+
+# ================= 🗜️ 视频转码配置 =================
+# 渲染完成后在封装队列里按档位生成更省流量的版本，档位列表记录在缓存条目中，播放端按顺序挑第一个支持的格式
+# 数学动画大多是纯色块 + 线条，x264 的 animation 调优配合较高的 CRF 几乎看不出损失
+# target_bytes > 0 时按目标大小两遍编码 (码率 = 目标字节 × 8 / 时长)，忽略 crf
+ENCODING_PROFILES = {
+    "h264": {"format": "mp4", "crf": 28, "preset": "slow", "tune": "animation", "target_bytes": 0},
+    "vp9":  {"format": "webm", "crf": 42, "cpu_used": 2, "target_bytes": 0},
+    # 动画 WebP 只用于短片段 (可当图片内联、自动循环)
+    "webp": {"format": "webp", "quality": 60, "fps": 15, "max_width": 640, "max_duration": 8},
+}
+ENCODING_ENABLED_PROFILES = ["h264", "webp"]   # 按顺序生成，空列表 = 关闭 (VP9 编码较慢，按需开启)
+ENCODING_MIN_SAVING = 0.1      # 至少比原始视频小 10% 才保留该版本
+ENCODING_TIMEOUT = 600         # 单个档位的转码超时 (秒)
+ENCODING_WORKERS = 1           # 转码队列的并发数 (与封装队列分开，慢速转码不阻塞请求等待的 faststart / HLS)
+
+# ================= 🔥 缓存预热配置 =================
+PRECOMPUTE_CATALOG_FILE = os.path.join(BASE_DIR, "catalog", "textbook_prompts.txt")
+PRECOMPUTE_CONCURRENCY = 2    # 预热时同时运行的工作流数 (避免挤占在线请求)
+ADMIN_TOKEN = ""              # 管理接口口令 (请求头 X-Admin-Token)，留空则禁用管理接口
+
 # ================= 🎯 默认值 =================
 DEFAULT_SCENE_NAME = "MathScene"
 DEFAULT_QUALITY = "-ql"  # 低质量，快速渲染
\ No newline at end of file
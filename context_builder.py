@@ -0,0 +1,118 @@
+# context_builder.py
+"""
+MathSpace 场景上下文构建器
+从当前场景代码的 AST 中提炼紧凑摘要（场景类、辅助方法、命名对象、最近 K 个动画），
+并按各阶段的 token 预算裁剪，替代按字符数硬截断的 code_preview。
+"""
+
+from config import CONTEXT_TOKEN_BUDGETS, CONTEXT_RECENT_ANIMATIONS
+from code_analysis import code_analyzer
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff" or "\u3000" <= ch <= "\u303f" or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class SceneContextBuilder:
+    """基于 code_analysis 的单次遍历结果 (已按源码哈希缓存) 组装摘要"""
+
+    def __init__(self, recent_animations=CONTEXT_RECENT_ANIMATIONS):
+        self.recent_animations = recent_animations
+
+    def summarize(self, code):
+        """提取场景结构，返回 dict；无法解析时返回 None"""
+        analysis = code_analyzer.analyze(code)
+        if "error" in analysis:
+            return None
+
+        context = analysis["context"]
+        actions = context["actions"]
+        return {
+            "imports": context["imports"],
+            "scene_class": analysis["scene_class"] or (analysis["classes"][0] if analysis["classes"] else None),
+            "scene_bases": analysis["scene_bases"],
+            "helpers": context["helpers"],
+            "mobjects": context["mobjects"],
+            "actions": actions[-self.recent_animations:] if self.recent_animations else [],
+            "line_count": analysis["line_count"],
+        }
+
+    def render_summary(self, summary, budget_tokens):
+        """按优先级拼装摘要文本，超出预算的部分省略"""
+        header = [f"代码共 {summary['line_count']} 行（以下为结构摘要，非完整代码）"]
+        if summary["scene_class"]:
+            header.append(f"场景类: {summary['scene_class']}({', '.join(summary['scene_bases'])})")
+        if summary["imports"]:
+            header.append("导入: " + "; ".join(summary["imports"]))
+        if summary["helpers"]:
+            header.append("辅助方法: " + ", ".join(summary["helpers"]))
+
+        sections = [
+            ("已命名对象:", summary["mobjects"]),
+            (f"最近 {len(summary['actions'])} 个动画/操作:", summary["actions"]),
+        ]
+
+        lines = []
+        used = 0
+        for line in header:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget_tokens:
+                break
+            lines.append(line)
+            used += cost
+
+        for title, items in sections:
+            if not items:
+                continue
+            title_cost = estimate_tokens(title) + 1
+            if used + title_cost > budget_tokens:
+                break
+            lines.append(title)
+            used += title_cost
+            # 对象优先保留最新定义的，动画保留最近的
+            kept = []
+            for item in reversed(items):
+                cost = estimate_tokens(item) + 3
+                if used + cost > budget_tokens:
+                    break
+                kept.append(f"- {item}")
+                used += cost
+            omitted = len(items) - len(kept)
+            if omitted:
+                lines.append(f"- ... (另有 {omitted} 项已省略)")
+            lines.extend(reversed(kept))
+
+        return "\n".join(lines)
+
+    def build(self, code, budget_tokens):
+        """
+        预算内放得下完整代码时直接给完整代码（修改场景时信息无损），
+        否则给 AST 结构摘要；代码无法解析时退化为按行截断
+        """
+        if not code:
+            return "无现有代码"
+        if estimate_tokens(code) <= budget_tokens:
+            return f"```python\n{code}\n```"
+
+        summary = self.summarize(code)
+        if summary:
+            return self.render_summary(summary, budget_tokens)
+
+        kept, used = [], 0
+        for line in code.splitlines():
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget_tokens:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(kept) + "\n# ... (代码过长，已截断)"
+
+    def build_for_stage(self, code, stage):
+        return self.build(code, CONTEXT_TOKEN_BUDGETS.get(stage, CONTEXT_TOKEN_BUDGETS["default"]))
+
+
+context_builder = SceneContextBuilder()
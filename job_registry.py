@@ -0,0 +1,174 @@
+# job_registry.py
+"""
+MathSpace 可恢复任务
+任务的生命周期与 WebSocket 连接解耦：
+- 每个任务有 job_id 和一份有界的事件日志 (每条事件带递增的 seq)
+- 连接断开不会取消任务；客户端重连后发送 {"type": "resume", "job_id", "cursor"}，
+  服务端补发 seq > cursor 的事件，之后继续实时推送
+- 一条长连接可以同时订阅多个任务 (所有事件都带 job_id)
+- 已结束任务的事件日志写入共享状态后端 (键 "jobs")，重连落到其他 worker 也能拿到结果
+"""
+
+import time
+import uuid
+import asyncio
+from collections import deque
+
+from config import JOB_EVENT_LOG_SIZE, JOB_RETENTION_SECONDS, JOB_HISTORY_LIMIT
+from state_backend import state
+
+TERMINAL_TYPES = ("result", "error")
+
+
+class JobSubscriber:
+    """包装一条 WebSocket：多个任务并发推送时串行发送"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.lock = asyncio.Lock()
+        self.jobs = set()
+
+    async def send_json(self, message):
+        async with self.lock:
+            await self.websocket.send_json(message)
+
+
+class Job:
+    """
+    单个任务的事件日志；对工作流伪装成一个 websocket (只实现 send_json)，
+    可以直接作为订阅者挂到请求合并的广播通道上
+    """
+
+    def __init__(self, job_id, prompt, session):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.session = session
+        self.events = deque(maxlen=JOB_EVENT_LOG_SIZE)
+        self.seq = 0
+        self.status = "running"
+        self.created = time.time()
+        self.finished = None
+        self.subscribers = []
+        self.task = None
+
+    async def send_json(self, message):
+        self.seq += 1
+        event = {**message, "job_id": self.job_id, "seq": self.seq}
+        self.events.append(event)
+        if message.get("type") in TERMINAL_TYPES:
+            self.status = "done" if message.get("type") == "result" else "error"
+            self.finished = time.time()
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber.send_json(event)
+            except Exception:
+                self.unsubscribe(subscriber)
+
+    def events_after(self, cursor):
+        """cursor 之后的事件；日志已滚动丢掉部分事件时 truncated 为 True"""
+        events = [e for e in self.events if e["seq"] > cursor]
+        truncated = bool(self.events) and self.events[0]["seq"] > cursor + 1
+        return events, truncated
+
+    async def subscribe(self, subscriber, cursor=0):
+        # 逐条补发直到追上最新事件；循环结束与加入订阅之间没有 await，不会漏消息
+        while True:
+            events, _ = self.events_after(cursor)
+            if not events:
+                break
+            for event in events:
+                await subscriber.send_json(event)
+                cursor = event["seq"]
+        if subscriber not in self.subscribers:
+            self.subscribers.append(subscriber)
+        subscriber.jobs.add(self.job_id)
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+        subscriber.jobs.discard(self.job_id)
+
+    def to_record(self):
+        return {
+            "job_id": self.job_id,
+            "prompt": self.prompt,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "seq": self.seq,
+            "events": list(self.events),
+        }
+
+
+class JobRegistry:
+    def __init__(self, backend=state, state_key="jobs"):
+        self.backend = backend
+        self.state_key = state_key
+        self.jobs = {}
+
+    def create(self, prompt, session, runner):
+        """
+        新建任务并立即在后台运行 runner(job)；任务不随任何连接结束而取消
+        """
+        self._prune()
+        job = Job(f"job_{uuid.uuid4().hex[:12]}", prompt, session)
+        self.jobs[job.job_id] = job
+
+        async def run():
+            try:
+                await runner(job)
+            except Exception as e:
+                print(f"💥 [任务] {job.job_id} 异常: {e}")
+                if job.status == "running":
+                    await job.send_json({"type": "error", "message": f"系统异常: {str(e)}"})
+            finally:
+                if job.status == "running":
+                    # 工作流没有给出结果就结束了 (例如被取消)
+                    job.status = "error"
+                    job.finished = time.time()
+                self._persist(job)
+
+        job.task = asyncio.create_task(run())
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def load_record(self, job_id):
+        """本进程没有该任务时，从共享状态中读取已结束任务的事件日志"""
+        return self.backend.get_json(self.state_key, {}).get(job_id)
+
+    def _persist(self, job):
+        try:
+            with self.backend.transaction(self.state_key, {}) as jobs:
+                jobs[job.job_id] = job.to_record()
+                if len(jobs) > JOB_HISTORY_LIMIT:
+                    oldest = sorted(jobs, key=lambda j: jobs[j].get("finished") or 0)
+                    for stale in oldest[:len(jobs) - JOB_HISTORY_LIMIT]:
+                        jobs.pop(stale, None)
+        except Exception as e:
+            print(f"⚠️ [任务] 保存事件日志失败 {job.job_id}: {e}")
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and now - job.finished > JOB_RETENTION_SECONDS:
+                self.jobs.pop(job_id, None)
+
+    def detach(self, subscriber):
+        """连接断开：只取消订阅，任务继续运行"""
+        for job_id in list(subscriber.jobs):
+            job = self.jobs.get(job_id)
+            if job:
+                job.unsubscribe(subscriber)
+
+    def stats(self):
+        running = [j for j in self.jobs.values() if j.status == "running"]
+        return {
+            "tracked": len(self.jobs),
+            "running": len(running),
+            "subscribers": sum(len(j.subscribers) for j in self.jobs.values()),
+        }
+
+
+job_registry = JobRegistry()
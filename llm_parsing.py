@@ -0,0 +1,197 @@
+# llm_parsing.py
+"""
+MathSpace LLM 回复解析
+每次请求 (以及每次自动修复) 都要从 LLM 回复中取代码块 / JSON，这里的提取器全部是线性时间的：
+- 代码块：单趟扫描 ``` 围栏 (str.find 只向前推进，不回溯)
+- JSON：括号配对扫描 (识别字符串和转义)，只对配对完整的候选调用 json.loads
+- 对象名：预编译、锚定的正则，不再对整个文件做非贪婪跨行匹配
+性能对比见 benchmarks/bench_parsing.py
+"""
+
+import re
+import json
+
+FENCE = "```"
+LANGUAGE_TAG_PATTERN = re.compile(r"[\w+#.-]*")
+LEADING_PYTHON_PATTERN = re.compile(r"python\s*", re.IGNORECASE)
+JSON_TOKEN_PATTERN = re.compile(r'[{}"\\]')
+PAREN_PATTERN = re.compile(r"[()]")
+REVIEW_RATINGS = ("PASS", "WARN", "FAIL")
+
+MOBJECT_ASSIGN_PATTERN = re.compile(
+    r"^[ \t]*(\w+)[ \t]*=[ \t]*(?:Circle|Square|Triangle|Rectangle|Line|Dot|Text|MathTex|VGroup|Axes|NumberPlane|Sphere|Cube)\b",
+    re.MULTILINE
+)
+SELF_ADD_PATTERN = re.compile(r"self\.add\((\w+)\)")
+SELF_PLAY_PATTERN = re.compile(r"self\.play\(")
+PLAY_ARG_NAME_PATTERN = re.compile(r"(?<![=.])\b([A-Za-z_]\w*)\b(?![ \t]*[(=])")
+CONSTRUCT_PATTERN = re.compile(r"def construct\(self\):")
+ASSIGN_PATTERN = re.compile(r"^[ \t]*(\w+)[ \t]*=(?!=)", re.MULTILINE)
+IGNORED_NAMES = {"self", "Scene", "run_time", "PI", "True", "False", "None", "lambda"}
+
+
+# ================= 📄 代码块 =================
+def iter_fenced_blocks(text):
+    """
+    单趟扫描 markdown 代码块，依次产出 (语言标记, 内容)
+    未闭合的最后一个代码块 (回复被截断) 视为延伸到文本末尾
+    """
+    pos = 0
+    while True:
+        start = text.find(FENCE, pos)
+        if start == -1:
+            return
+        body_start = start + len(FENCE)
+        end = text.find(FENCE, body_start)
+        body_end = len(text) if end == -1 else end
+
+        # 第一行是语言标记 (```python\n...)，否则整段都是内容
+        newline = text.find("\n", body_start, body_end)
+        tag = text[body_start:newline].strip() if newline != -1 else None
+        if tag is not None and LANGUAGE_TAG_PATTERN.fullmatch(tag):
+            yield tag.lower(), text[newline + 1:body_end]
+        else:
+            yield "", text[body_start:body_end]
+
+        if end == -1:
+            return
+        pos = end + len(FENCE)
+
+
+def extract_code_from_markdown(text):
+    """从文本中提取代码块：优先 ```python 块，其次第一个代码块，再次 <code> 标签"""
+    first_block = None
+    for language, body in iter_fenced_blocks(text):
+        if language in ("python", "py", "python3"):
+            return body.strip()
+        if first_block is None:
+            first_block = body
+
+    if first_block is None:
+        start = text.find("<code>")
+        end = text.find("</code>", start + 6) if start != -1 else -1
+        if end != -1:
+            first_block = text[start + 6:end]
+
+    if first_block is not None:
+        code = first_block.strip()
+        match = LEADING_PYTHON_PATTERN.match(code)
+        return code[match.end():] if match else code
+
+    return text.strip().replace(FENCE, "")
+
+
+# ================= 🧾 JSON =================
+def iter_balanced_objects(text):
+    """
+    括号配对扫描，依次产出顶层 {...} 片段 (字符串内的括号和转义字符会被正确跳过)
+    只在结构字符上停留 (由预编译正则在 C 层跳过普通字符)，总耗时与文本长度成正比
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    skip_to = 0
+    for match in JSON_TOKEN_PATTERN.finditer(text):
+        i = match.start()
+        if i < skip_to:
+            continue
+        ch = text[i]
+        if depth == 0:
+            if ch == "{":
+                depth, start = 1, i
+        elif in_string:
+            if ch == "\\":
+                skip_to = i + 2
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+
+def extract_json_from_response(text):
+    """从响应中提取第一个合法的 JSON 对象，没有则返回 None"""
+    for candidate in iter_balanced_objects(text):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def extract_review_from_response(text):
+    """
+    解析合并质检 + 改进阶段的结构化输出，返回 {"rating", "issues", "code"}
+    逐个尝试顶层 JSON 对象 (允许字符串里出现未转义的换行)，取第一个带非空 code 字段的；
+    解析失败返回 None，由调用方退回质检 + 改进两次调用
+    """
+    for candidate in iter_balanced_objects(text):
+        try:
+            data = json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or not isinstance(data.get("code"), str) or not data["code"].strip():
+            continue
+        rating = str(data.get("rating", "")).strip().upper()
+        issues = data.get("issues") or []
+        if not isinstance(issues, list):
+            issues = [issues]
+        return {
+            "rating": rating if rating in REVIEW_RATINGS else "WARN",
+            "issues": [str(issue) for issue in issues],
+            # 有的模型会在 code 字段里再包一层 ```python
+            "code": extract_code_from_markdown(data["code"]) if FENCE in data["code"] else data["code"].strip(),
+        }
+    return None
+
+
+# ================= 🔤 对象名 (静态备份方案) =================
+def _matching_paren(text, open_index):
+    """返回与 text[open_index] 处 '(' 配对的 ')' 下标，找不到时返回文本末尾"""
+    depth = 0
+    for match in PAREN_PATTERN.finditer(text, open_index):
+        depth += 1 if match.group() == "(" else -1
+        if depth == 0:
+            return match.start()
+    return len(text)
+
+
+def extract_objects_from_code(code):
+    """静态提取已定义的图形对象（作为动态侦探的备份方案）"""
+    objects = []
+    seen = set(IGNORED_NAMES)
+
+    def add(name):
+        if name and name not in seen:
+            seen.add(name)
+            objects.append(name)
+
+    for match in MOBJECT_ASSIGN_PATTERN.finditer(code):
+        add(match.group(1))
+    for match in SELF_ADD_PATTERN.finditer(code):
+        add(match.group(1))
+
+    # self.play(...) 的参数里直接引用的变量名 (跳过函数调用、关键字参数及其取值、属性名)
+    pos = 0
+    while True:
+        match = SELF_PLAY_PATTERN.search(code, pos)
+        if not match:
+            break
+        close = _matching_paren(code, match.end() - 1)
+        for arg in PLAY_ARG_NAME_PATTERN.finditer(code, match.end(), close):
+            add(arg.group(1))
+        pos = close + 1
+
+    # construct 方法里的第一个赋值
+    construct = CONSTRUCT_PATTERN.search(code)
+    if construct:
+        first_assign = ASSIGN_PATTERN.search(code, construct.end())
+        if first_assign:
+            add(first_assign.group(1))
+
+    return objects
@@ -0,0 +1,241 @@
+# llm_router.py
+"""
+MathSpace 模型路由
+每个阶段 (intent / generator / analyzer / improver / fixer) 有自己的候选模型、温度和 max_tokens
+(config.LLM_STAGE_ROUTES)，意图识别、质检这类简单任务可以交给更小更快的模型：
+- 按 (阶段, 端点, 模型) 记录最近 N 次调用的延迟与成败 (各阶段输出长度差别大，延迟分开统计)
+- 单次调用超过阶段 SLO 且还有备选时，放弃这次调用转到下一个候选；最后一个候选使用完整超时。
+  被放弃的请求不取消 (服务端照样计费)，在后台等它返回后通过 on_abandoned 回调补记用量
+- 输出因 max_tokens 被截断时放大上限重试一次 (截断的 JSON / 代码解析失败时不会有任何提示)，
+  被截断的那次调用同样交给 on_abandoned 记账
+- 最近延迟 p90 超过 SLO、错误率过高或刚超时的候选进入冷却期，冷却期内排到后面，
+  冷却结束后的第一次调用即为探测，恢复正常则重新排回原位
+所有端点都是 OpenAI 兼容接口，可以用本地模拟服务测试 (benchmarks/bench_pipeline.py --fallback-latency)。
+openai SDK 导入很慢 (约占服务启动时间的一半)，首次创建客户端时才导入，启动后可由 warm_up 在后台预热。
+"""
+
+import time
+import asyncio
+import importlib
+from collections import deque
+
+from config import (
+    LLM_ENDPOINTS, LLM_STAGE_ROUTES, LLM_ROUTER_WINDOW,
+    LLM_ROUTER_MAX_ERROR_RATE, LLM_ROUTER_COOLDOWN, REQUEST_TIMEOUT,
+    LLM_LENGTH_RETRY_FACTOR, LLM_LENGTH_RETRY_MAX_TOKENS
+)
+from tracing import tracer
+
+MIN_SAMPLES = 3
+
+
+def truncated(response):
+    """输出是否因 max_tokens 被截断"""
+    choices = getattr(response, "choices", None) or []
+    return bool(choices) and getattr(choices[0], "finish_reason", None) == "length"
+
+
+class CandidateStats:
+    """单个阶段下某个 (端点, 模型) 的滚动统计"""
+
+    def __init__(self, window=LLM_ROUTER_WINDOW):
+        self.samples = deque(maxlen=window)  # (延迟秒数, 是否成功)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cooldown_until = 0.0
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_p90(self):
+        latencies = sorted(latency for latency, _ in self.samples)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * 0.9), len(latencies) - 1)]
+
+    def cooling(self):
+        return time.time() < self.cooldown_until
+
+    def start_cooldown(self):
+        # 清空样本：冷却结束后的探测结果不受旧数据影响
+        self.cooldown_until = time.time() + LLM_ROUTER_COOLDOWN
+        self.samples.clear()
+
+    def record(self, latency, ok, slo, timed_out=False):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.timeouts += 1 if timed_out else 0
+        self.samples.append((latency, ok))
+        if timed_out:
+            self.start_cooldown()
+        elif len(self.samples) >= MIN_SAMPLES and (
+            self.error_rate() > LLM_ROUTER_MAX_ERROR_RATE or self.latency_p90() > slo
+        ):
+            self.start_cooldown()
+
+    def to_dict(self):
+        p90 = self.latency_p90()
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "error_rate": round(self.error_rate(), 2),
+            "latency_p90": round(p90, 2) if p90 is not None else None,
+            "cooling_seconds": round(max(self.cooldown_until - time.time(), 0), 1),
+        }
+
+
+class ModelRouter:
+    def __init__(self, endpoints=LLM_ENDPOINTS, routes=LLM_STAGE_ROUTES):
+        self.endpoints = {name: dict(conf) for name, conf in endpoints.items()}
+        self.routes = {stage: {**conf, "candidates": list(conf["candidates"])} for stage, conf in routes.items()}
+        self.clients = {}
+        self.stats_by_candidate = {}
+        self._abandoned = set()  # 超过 SLO 被放弃、仍在等待返回的请求
+
+    def configure_endpoint(self, name, base_url, api_key):
+        """新增或替换端点 (测试时指向本地模拟服务)"""
+        self.endpoints[name] = {"base_url": base_url, "api_key": api_key}
+        self.clients.pop(name, None)
+
+    def client(self, endpoint):
+        if endpoint not in self.clients:
+            from openai import AsyncOpenAI
+
+            conf = self.endpoints[endpoint]
+            self.clients[endpoint] = AsyncOpenAI(
+                api_key=conf["api_key"],
+                base_url=conf["base_url"],
+                timeout=REQUEST_TIMEOUT
+            )
+        return self.clients[endpoint]
+
+    def warm_up(self):
+        """预先导入 openai SDK (在线程中调用)，避免第一个请求承担导入耗时"""
+        start = time.perf_counter()
+        importlib.import_module("openai")
+        return time.perf_counter() - start
+
+    def _stats(self, stage, endpoint, model):
+        key = f"{stage}:{endpoint}/{model}"
+        if key not in self.stats_by_candidate:
+            self.stats_by_candidate[key] = CandidateStats()
+        return self.stats_by_candidate[key]
+
+    def route(self, stage, model=None):
+        """
+        本次调用的候选顺序：未冷却的按配置顺序在前，冷却中的按冷却结束时间排在后面
+        model 不为空时 (预算降级) 在各端点上统一换成该模型
+        """
+        candidates = self.routes.get(stage, self.routes["generator"])["candidates"]
+        if model:
+            candidates = list(dict.fromkeys((endpoint, model) for endpoint, _ in candidates))
+        ready = [c for c in candidates if not self._stats(stage, *c).cooling()]
+        cooling = sorted((c for c in candidates if c not in ready), key=lambda c: self._stats(stage, *c).cooldown_until)
+        return ready + cooling
+
+    def effective_temperature(self, stage, temperature=None):
+        """调用方未指定温度时使用阶段配置"""
+        if temperature is not None:
+            return temperature
+        return self.routes.get(stage, self.routes["generator"]).get("temperature")
+
+    def configured_models(self, stage):
+        """阶段配置的候选 (端点/模型) 列表 (不受冷却排序影响，用于阶段记忆的键)"""
+        return [f"{endpoint}/{model}" for endpoint, model in self.routes.get(stage, self.routes["generator"])["candidates"]]
+
+    def _abandon(self, stage, model, task, on_abandoned):
+        """放弃等待的请求：返回后交给 on_abandoned(model, response) 补记用量"""
+        def finished(task):
+            self._abandoned.discard(task)
+            if task.cancelled() or task.exception() is not None or on_abandoned is None:
+                return
+            try:
+                on_abandoned(model, task.result())
+            except Exception as e:
+                print(f"⚠️ [路由] {stage} 放弃的调用补记用量失败: {e}")
+
+        self._abandoned.add(task)
+        task.add_done_callback(finished)
+
+    async def complete(self, stage, messages, temperature=None, model=None, on_abandoned=None):
+        """
+        按路由顺序调用，返回 (response, 实际使用的模型)；全部失败时抛出最后一个异常
+        on_abandoned: 被放弃的调用 (超过 SLO 后才返回的、输出被截断而重试的) 的回调 (model, response)，用于补记用量
+        """
+        route_conf = self.routes.get(stage, self.routes["generator"])
+        kwargs = {}
+        temperature = self.effective_temperature(stage, temperature)
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if route_conf.get("max_tokens"):
+            kwargs["max_tokens"] = route_conf["max_tokens"]
+
+        response, used_model = await self._complete_once(stage, messages, kwargs, model, on_abandoned)
+        if truncated(response) and kwargs.get("max_tokens"):
+            retry_tokens = min(kwargs["max_tokens"] * LLM_LENGTH_RETRY_FACTOR, LLM_LENGTH_RETRY_MAX_TOKENS)
+            if retry_tokens > kwargs["max_tokens"]:
+                print(f"✂️ [路由] {stage} 输出被截断 (max_tokens={kwargs['max_tokens']})，以 {retry_tokens} 重试一次")
+                if on_abandoned is not None:
+                    on_abandoned(used_model, response)
+                response, used_model = await self._complete_once(
+                    stage, messages, {**kwargs, "max_tokens": retry_tokens}, model, on_abandoned
+                )
+        return response, used_model
+
+    async def _complete_once(self, stage, messages, kwargs, model, on_abandoned):
+        slo = self.routes.get(stage, self.routes["generator"]).get("slo") or REQUEST_TIMEOUT
+        candidates = self.route(stage, model)
+        last_error = None
+        for index, (endpoint, candidate_model) in enumerate(candidates):
+            stats = self._stats(stage, endpoint, candidate_model)
+            request = asyncio.ensure_future(self.client(endpoint).chat.completions.create(
+                model=candidate_model,
+                messages=messages,
+                stream=False,
+                **kwargs
+            ))
+            has_fallback = index < len(candidates) - 1
+            span = tracer.start_span("llm.call", endpoint=endpoint, model=candidate_model, attempt=index)
+            start = time.time()
+            try:
+                if has_fallback:
+                    done, _ = await asyncio.wait({request}, timeout=slo)
+                    if not done:
+                        stats.record(time.time() - start, False, slo, timed_out=True)
+                        span.end(error=f"超过 SLO ({slo}s)")
+                        print(f"⏱️ [路由] {stage} 调用 {endpoint}/{candidate_model} 超过 SLO ({slo}s)，切换备选")
+                        self._abandon(stage, candidate_model, request, on_abandoned)
+                        last_error = asyncio.TimeoutError(f"超过 SLO ({slo}s)")
+                        continue
+                response = await request
+            except Exception as e:
+                stats.record(time.time() - start, False, slo)
+                span.end(error=e)
+                print(f"⚠️ [路由] {stage} 调用 {endpoint}/{candidate_model} 失败: {e}")
+                last_error = e
+                continue
+            except BaseException:
+                request.cancel()
+                span.end(error="cancelled")
+                raise
+            stats.record(time.time() - start, True, slo)
+            span.end()
+            return response, candidate_model
+
+        raise last_error or RuntimeError(f"阶段 {stage} 没有可用的模型")
+
+    def stats(self):
+        return {
+            "routes": {
+                stage: [f"{endpoint}/{model}" for endpoint, model in self.route(stage)]
+                for stage in self.routes
+            },
+            "candidates": {key: stats.to_dict() for key, stats in self.stats_by_candidate.items()},
+        }
+
+
+llm_router = ModelRouter()
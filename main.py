@@ -4,28 +4,28 @@ import sys
 import shutil
 import asyncio
 import uuid
-import re
-import subprocess
 import time
 import json
-import ast
 import hashlib
+from typing import List, Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse, HTMLResponse
 from pydantic import BaseModel
-from openai import AsyncOpenAI 
 
 # ================= 📦 导入配置和提示词 =================
 from config import (
-    API_KEY, BASE_URL, MODEL_NAME,
-    STATIC_DIR, TEMPLATES_DIR, TEMP_DIR, 
-    SCENE_FILE, HISTORY_FILE, CONVERSATION_FILE,
+    STATIC_DIR, TEMPLATES_DIR, TEMP_DIR, HLS_DIR, ENCODED_DIR, STATE_BACKEND,
     MAX_RETRIES, MAX_HISTORY_ENTRIES,
-    REQUEST_TIMEOUT, MANIM_TIMEOUT,
-    DEFAULT_SCENE_NAME, DEFAULT_QUALITY
+    RENDER_MODE,
+    DEFAULT_SCENE_NAME,
+    EDIT_MODE_ENABLED, EDIT_MODE_INTENTS, BUDGET_FALLBACK_MODEL,
+    ADMIN_TOKEN, PRECOMPUTE_CATALOG_FILE, PRECOMPUTE_CONCURRENCY,
+    TEMPLATE_ENABLED, TEMPLATE_MIN_CONFIDENCE, TEMPLATE_MATCH_TIMEOUT,
+    FIXER_CANDIDATE_TEMPERATURES, FIXER_DRY_RUN, PIPELINE_PROFILE,
+    STARTUP_BACKGROUND_CLEANUP, STARTUP_PREWARM_LLM, ENCODING_ENABLED_PROFILES
 )
 
 from prompts import (
@@ -34,137 +34,168 @@ from prompts import (
     PROMPT_IMPROVER,
     PROMPT_INTENT_ANALYZER,
     PROMPT_EMERGENCY_FIXER,
+    PROMPT_DIFF_EDITOR,
+    PROMPT_DIFF_IMPROVER,
+    PROMPT_REVIEW_IMPROVER,
     SYSTEM_PROMPTS,
-    RESPONSE_TEMPLATES,
     MONITOR_HTML
 )
 
-# ================= 📝 缓存系统 (MD5指纹) =================
-CACHE_FILE = os.path.join(TEMP_DIR, "cache.json")
+from state_backend import state
+from workspace import worker_id, worker_scratch_dir, cleanup_worker_scratch, scratch_purger
+from artifact_store import artifact_store
+from context_builder import context_builder
+from code_edit import apply_llm_patch, PatchError, EmptyPatch
+from llm_parsing import extract_code_from_markdown, extract_json_from_response, extract_review_from_response
+from code_analysis import code_analyzer
+from render_jobs import new_render_job, run_render_job, run_dry_run, get_broker
+from singleflight import request_coalescer
+from scheduler import scheduler, estimate_llm_cost, estimate_render_cost
+from usage_ledger import usage_ledger, RequestUsage, BUDGET_LEVELS
+from job_registry import job_registry, JobSubscriber
+from llm_router import llm_router
+from tracing import tracer
+from scene_templates import template_library
+from stage_memo import stage_memo, checkpoint_store, memoized_response
+from precompute import PrecomputeRunner, load_catalog
+from video_serving import VIDEO_NAME_PATTERN, build_video_response
+from video_packaging import (
+    packaging_queue, remux_faststart, segment_hls,
+    hls_url_for, remove_hls_outputs
+)
+from video_encoding import (
+    FORMAT_MIME_TYPES, ENCODED_NAME_PATTERN, encoding_queue,
+    encode_video, encoded_dir_for, list_encoded, remove_encoded_outputs
+)
 
+# ================= 📝 缓存系统 (MD5指纹) =================
 def load_cache():
-    """加载缓存文件"""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    """加载缓存 (存放在共享状态后端中)"""
+    return state.get_json("cache", {})
+
+def prompt_cache_key(prompt):
+    """使用 Prompt 的 MD5 作为键，避免特殊字符问题，确保唯一性"""
+    return hashlib.md5(prompt.strip().encode('utf-8')).hexdigest()
+
+def video_name_from_url(video_url):
+    return video_url.rsplit("/", 1)[-1]
+
+def cache_entry(value):
+    """缓存条目：{"video": 原始视频地址, "formats": 转码版本列表}；兼容旧版只存地址字符串的条目"""
+    if isinstance(value, str):
+        return {"video": value, "formats": []}
+    return value
 
 def save_cache_entry(prompt, video_url):
-    """保存缓存条目，使用MD5作为键"""
-    cache = load_cache()
-    # 使用 Prompt 的 MD5 作为键，避免特殊字符问题，确保唯一性
-    key = hashlib.md5(prompt.strip().encode('utf-8')).hexdigest()
-    cache[key] = video_url
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"⚠️ 缓存保存失败: {e}")
+    """保存缓存条目，使用MD5作为键，并在视频仓库中登记引用"""
+    key = prompt_cache_key(prompt)
+    with tracer.span("cache.save", key=key):
+        try:
+            with state.transaction("cache", {}) as cache:
+                previous = cache.get(key)
+                cache[key] = {"video": video_url, "formats": []}
+        except Exception as e:
+            print(f"⚠️ 缓存保存失败: {e}")
+            return
+        artifact_store.add_ref(video_name_from_url(video_url), key)
+        # 条目被替换：旧视频不再被这个键引用
+        if previous and cache_entry(previous)["video"] != video_url:
+            artifact_store.remove_ref(video_name_from_url(cache_entry(previous)["video"]), key)
+
+def save_cache_formats(key, video_url, formats):
+    """转码完成后把格式列表写回缓存条目 (条目已指向别的视频或已作废时不写)"""
+    with state.transaction("cache", {}) as cache:
+        entry = cache.get(key)
+        if entry is None or cache_entry(entry)["video"] != video_url:
+            return False
+        cache[key] = {"video": video_url, "formats": formats}
+        return True
+
+def get_cached_entry(prompt):
+    """尝试获取缓存条目（视频已被淘汰时自动作废该条目）"""
+    key = prompt_cache_key(prompt)
+    with tracer.span("cache.lookup", key=key) as span:
+        entry = load_cache().get(key)
+        if not entry:
+            span.set(hit=False)
+            return None
+        entry = cache_entry(entry)
+        if not artifact_store.touch(video_name_from_url(entry["video"])):
+            with state.transaction("cache", {}) as cache:
+                cache.pop(key, None)
+            artifact_store.remove_ref(video_name_from_url(entry["video"]), key)
+            span.set(hit=False, evicted=True)
+            return None
+        span.set(hit=True, formats=len(entry["formats"]))
+        return entry
 
 def get_cached_video(prompt):
     """尝试获取缓存的视频链接"""
-    cache = load_cache()
-    key = hashlib.md5(prompt.strip().encode('utf-8')).hexdigest()
-    return cache.get(key)
+    entry = get_cached_entry(prompt)
+    return entry["video"] if entry else None
 
-# ================= 🔍 代码分析器 (静态AST) =================
-def analyze_code_structure(code: str):
-    """分析代码结构，提取重要信息（类名、方法、变量等）"""
-    try:
-        tree = ast.parse(code)
-        analysis = {
-            "scene_class": None,
-            "methods": [],
-            "variables": [],
-            "animations": [],
-            "has_axes": False,
-            "objects": []
-        }
-        
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef):
-                # 智能识别继承自 Scene 的类
-                base_ids = [base.id for base in node.bases if hasattr(base, 'id')]
-                # 只要继承链里有 Scene 相关的都算
-                if any(b in ['Scene', 'ThreeDScene', 'MovingCameraScene', 'ZoomedScene', 'LinearTransformationScene'] for b in base_ids):
-                    analysis["scene_class"] = node.name
-            elif isinstance(node, ast.FunctionDef):
-                analysis["methods"].append(node.name)
-            elif isinstance(node, ast.Assign):
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        analysis["variables"].append(target.id)
-            elif isinstance(node, ast.Call):
-                if hasattr(node.func, 'attr'):
-                    if node.func.attr in ['Create', 'Play', 'Transform', 'FadeIn', 'FadeOut', 'Rotate', 'Write']:
-                        analysis["animations"].append(node.func.attr)
-                if hasattr(node.func, 'id'):
-                    if node.func.id in ['Axes', 'ThreeDAxes', 'NumberPlane']:
-                        analysis["has_axes"] = True
-        return analysis
-    except:
-        return {"error": "代码解析失败"}
-
-def extract_objects_from_code(code: str):
-    """静态提取已定义的图形对象（作为动态侦探的备份方案）"""
-    objects = []
-    # 匹配常见的Manim对象创建模式
-    patterns = [
-        r'(\w+)\s*=\s*(Circle|Square|Triangle|Rectangle|Line|Dot|Text|MathTex|VGroup|Axes|NumberPlane|Sphere|Cube)',
-        r'self\.add\((\w+)\)',
-        r'self\.play\([^)]*(\w+)[^)]*\)',
-        r'def construct\(self\):[\s\S]*?(\w+)\s*='
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, code)
-        for match in matches:
-            if isinstance(match, tuple):
-                obj_name = match[0] if match[0] else match[1]
-            else:
-                obj_name = match
-            if obj_name and obj_name not in ['self', 'Scene', 'run_time', 'PI'] and obj_name not in objects:
-                objects.append(obj_name)
-    
-    return objects
+def drop_cache_entries_for_videos(names):
+    """视频被仓库淘汰后，删除所有指向它们的缓存条目"""
+    names = set(names)
+    with state.transaction("cache", {}) as cache:
+        stale = [k for k, value in cache.items() if video_name_from_url(cache_entry(value)["video"]) in names]
+        for k in stale:
+            cache.pop(k, None)
+    if stale:
+        print(f"🧹 已作废 {len(stale)} 条失效缓存")
+
+artifact_store.add_evict_listener(drop_cache_entries_for_videos)
+artifact_store.add_evict_listener(remove_hls_outputs)
+artifact_store.add_evict_listener(remove_encoded_outputs)
+
+def encode_cached_video(key, video_url):
+    """封装队列任务：按转码档位生成省流量的版本，并把格式列表写回缓存条目"""
+    name = video_name_from_url(video_url)
+    formats = encode_video(os.path.join(STATIC_DIR, name), name)
+    if formats:
+        save_cache_formats(key, video_url, formats)
+    return formats
 
 # ================= 🧹 自清洁启动逻辑 (持久化版) =================
+# 就绪状态 (供 /api/ready 探针)：启动清理、后台的视频仓库对账和 LLM 客户端预热都完成后置为 True，开始停机时置回 False
+startup_status = {"ready": False, "startup_seconds": None, "reconcile_seconds": None, "llm_prewarm_seconds": None}
+
 def cleanup_workspace_startup():
-    """系统启动时的清理：只清理临时文件，保留生成的视频"""
+    """系统启动时的清理：只清理本 worker 的临时文件，保留生成的视频和共享状态"""
     print("-" * 50)
-    print("🧹 [系统] 正在初始化环境 (保留历史视频)...")
+    print(f"🧹 [系统] 正在初始化环境 (worker {worker_id()}, 状态后端: {STATE_BACKEND})...")
     
-    # 1. 清理临时文件夹 (temp_gen)，这是做饭的边角料，可以扔
-    if os.path.exists(TEMP_DIR):
-        try: 
-            shutil.rmtree(TEMP_DIR)
-        except: 
-            pass
+    # 1. 清理本 worker 的临时目录 (以及本机已退出 worker 的残留)
+    #    其他 worker 正在使用的目录绝对不碰，多 worker / 多机部署时互不干扰
+    #    残留目录只做原子改名，删除交给后台线程，崩溃后留下大量目录也不拖慢启动
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    removed = cleanup_worker_scratch(background=STARTUP_BACKGROUND_CLEANUP)
+    if removed and STARTUP_BACKGROUND_CLEANUP:
+        print(f"🧹 [系统] 已移走 {removed} 个残留临时目录，后台删除中")
+    elif removed:
+        print(f"🧹 [系统] 已清理 {removed} 个残留临时目录")
             
     # 2. 【关键】绝对不碰 STATIC_DIR 里的 .mp4 文件！
     # 这样您重启程序后，之前的视频依然存在
     
-    # 3. 重建目录结构
+    # 3. 重建目录结构 (视频仓库对账要计算未登记视频的哈希，放到后台预热里做)
     os.makedirs(STATIC_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
     os.makedirs(TEMPLATES_DIR, exist_ok=True)
     
-    print("✨ [系统] 状态：就绪。")
+    print("✨ [系统] 启动清理完成，后台对账 / 预热中...")
     print("-" * 50)
 
 def hard_reset_system():
     """彻底重置：清理所有文件，包括视频和历史记录（核按钮）"""
     print("⚠️ [系统] 执行彻底重置...")
     
-    # 1. 清理临时目录
-    if os.path.exists(TEMP_DIR):
-        try: shutil.rmtree(TEMP_DIR)
-        except: pass
+    # 1. 清理本 worker 的临时目录 (其他 worker 的在途任务不受影响)
+    cleanup_worker_scratch()
         
-    # 2. 清理所有视频文件
+    # 2. 清理所有视频文件 (仓库 + HLS 切片 + 残留文件)
+    artifact_store.reset()
+    shutil.rmtree(HLS_DIR, ignore_errors=True)
+    shutil.rmtree(ENCODED_DIR, ignore_errors=True)
     if os.path.exists(STATIC_DIR):
         for filename in os.listdir(STATIC_DIR):
             if filename.endswith(".mp4"):
@@ -173,40 +204,69 @@ def hard_reset_system():
                 except: 
                     pass
     
-    # 3. 清理记忆文件
-    for f in [HISTORY_FILE, CONVERSATION_FILE, SCENE_FILE]:
-        if os.path.exists(f):
-            try: os.remove(f)
-            except: pass
+    # 3. 清理共享状态 (缓存、对话记录、当前场景)
+    try:
+        state.clear()
+    except Exception as e:
+        print(f"⚠️ [系统] 状态清理失败: {e}")
+    stage_memo.reset()
             
     # 4. 重建目录
     os.makedirs(STATIC_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+
+def reconcile_artifacts():
+    """后台线程：视频仓库对账 (收录旧视频 + 执行配额/保留策略)"""
+    start = time.perf_counter()
+    try:
+        artifact_store.reconcile()
+    except Exception as e:
+        print(f"⚠️ [系统] 视频仓库对账失败: {e}")
+    startup_status["reconcile_seconds"] = round(time.perf_counter() - start, 3)
+
+def prewarm_llm_client():
+    """后台线程：导入 openai SDK (启动时不导入，避免拖慢启动)"""
+    try:
+        seconds = llm_router.warm_up()
+    except Exception as e:
+        print(f"⚠️ [系统] LLM 客户端预热失败: {e}")
+        return
+    startup_status["llm_prewarm_seconds"] = round(seconds, 3)
+    print(f"🔥 [系统] LLM 客户端预热完成 ({seconds:.2f}s)")
+
+async def background_prewarm():
+    """对账和 LLM 客户端预热并行进行，都完成后才标记就绪"""
+    steps = [asyncio.to_thread(reconcile_artifacts)]
+    if STARTUP_PREWARM_LLM:
+        steps.append(asyncio.to_thread(prewarm_llm_client))
+    await asyncio.gather(*steps)
+    startup_status["ready"] = True
+    print("✨ [系统] 状态：就绪。")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 启动时只执行轻量清理，保护视频
+    # 启动时只执行轻量清理，保护视频；残留目录删除、仓库对账和 SDK 导入都在后台进行，完成后才就绪
+    started = time.perf_counter()
     cleanup_workspace_startup()
+    startup_status["startup_seconds"] = round(time.perf_counter() - started, 3)
+    prewarm_task = asyncio.create_task(background_prewarm())
     yield
+    startup_status["ready"] = False
+    prewarm_task.cancel()
+    await asyncio.gather(prewarm_task, return_exceptions=True)
+    await packaging_queue.stop()
+    await encoding_queue.stop()
+    artifact_store.flush_access()
 
 app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-client = AsyncOpenAI(
-    api_key=API_KEY, 
-    base_url=BASE_URL, 
-    timeout=REQUEST_TIMEOUT
-)
-
 # ================= 📝 智能上下文管理器 =================
 class SmartContextManager:
     """智能上下文管理器，深度理解代码结构"""
     
     def __init__(self):
-        self.conversation_path = CONVERSATION_FILE
-        self.history_path = HISTORY_FILE
-        self.scene_path = SCENE_FILE
+        self.state = state
         self.max_history_entries = MAX_HISTORY_ENTRIES
         
     def save_conversation(self, user_prompt: str, response_data: dict, code_analysis: dict = None):
@@ -220,26 +280,26 @@ class SmartContextManager:
             "success": response_data.get("success", False),
             "video_url": response_data.get("video_url", ""),
             "code_analysis": code_analysis or {},
-            "intent_analysis": response_data.get("intent_analysis", "")
+            "intent_analysis": response_data.get("intent_analysis", ""),
+            "edit_modes": response_data.get("edit_modes", {}),
+            "render_usage": response_data.get("render_usage", []),
+            "usage": response_data.get("usage", {}),
+            "budget_level": response_data.get("budget_level", "normal")
         }
         
-        conversation = self.load_conversation()
-        conversation.append(entry)
-        
-        if len(conversation) > self.max_history_entries:
-            conversation = conversation[-self.max_history_entries:]
-            
-        with open(self.conversation_path, "w", encoding="utf-8") as f:
-            json.dump(conversation, f, ensure_ascii=False, indent=2)
+        # 原子追加，多个 worker 同时写入也不会丢记录
+        with self.state.transaction("conversation", []) as conversation:
+            conversation.append(entry)
+            if len(conversation) > self.max_history_entries:
+                del conversation[:-self.max_history_entries]
     
     def load_conversation(self):
-        if not os.path.exists(self.conversation_path):
-            return []
-        try:
-            with open(self.conversation_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            return []
+        conversation = self.state.get_json("conversation", [])
+        return conversation if isinstance(conversation, list) else []
+    
+    def save_scene_code(self, code: str):
+        """渲染成功后更新全局当前场景"""
+        self.state.set_text("scene", code)
     
     def get_context_summary(self):
         """生成智能上下文摘要"""
@@ -287,22 +347,31 @@ class SmartContextManager:
             "current_style": styles[0] if styles else "无特定风格"
         }
     
+    def read_scene_code(self):
+        """读取当前场景代码，没有时返回空字符串"""
+        try:
+            return self.state.get_text("scene", "")
+        except Exception:
+            return ""
+    
+    def build_scene_context(self, stage: str):
+        """按阶段 token 预算构建当前场景上下文 (完整代码或 AST 摘要)"""
+        return context_builder.build_for_stage(self.read_scene_code(), stage)
+    
     def analyze_current_code(self):
         """分析当前代码状态"""
-        if not os.path.exists(self.scene_path):
-            return {"status": "no_code", "objects": [], "has_axes": False}
-        
         try:
-            with open(self.scene_path, "r", encoding="utf-8") as f:
-                code = f.read()
+            code = self.state.get_text("scene")
+            if code is None:
+                return {"status": "no_code", "objects": [], "has_axes": False}
             
-            analysis = analyze_code_structure(code)
-            objects = extract_objects_from_code(code)
+            analysis = code_analyzer.analyze(code)
+            objects = code_analyzer.objects(code)
             
             return {
                 "status": "has_code",
                 "code_preview": code[:500] + "..." if len(code) > 500 else code,
-                "analysis": analysis,
+                "analysis": code_analyzer.record(analysis),
                 "objects": objects,
                 "object_count": len(objects),
                 "has_axes": analysis.get("has_axes", False)
@@ -312,62 +381,117 @@ class SmartContextManager:
 
 context_manager = SmartContextManager()
 
-def extract_code_from_markdown(text):
-    """从文本中提取代码块"""
-    patterns = [
-        r"```python(.*?)```",
-        r"```(.*?)```",
-        r"<code>(.*?)</code>"
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            code = match.group(1).strip()
-            code = re.sub(r'^python\s*', '', code, flags=re.IGNORECASE)
-            return code
-    
-    return text.strip().replace("```", "")
-
-def extract_json_from_response(text):
-    """从响应中提取JSON"""
-    try:
-        json_pattern = r'\{[\s\S]*\}'
-        match = re.search(json_pattern, text)
-        if match:
-            return json.loads(match.group())
-    except:
-        pass
-    return None
-
-def run_manim_safe(cmd):
-    """安全运行Manim命令"""
+def record_llm_usage(sched, stage, model, response):
+    """记入本次请求的明细和会话 / 全局账本，返回该次调用的记录 (没有 RequestUsage 时返回 None)"""
+    if sched.get("usage") is None:
+        return None
+    record = sched["usage"].add(stage, model, response)
     try:
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            encoding='utf-8',
-            errors='ignore',
-            timeout=MANIM_TIMEOUT
-        )
-        return result.returncode, result.stdout, result.stderr
-    except subprocess.TimeoutExpired:
-        return -1, "", "渲染超时"
+        usage_ledger.record(sched.get("budget") or sched.get("session") or "anonymous", record)
     except Exception as e:
-        return -1, "", str(e)
-
-async def find_video_file(search_dir, filename_prefix):
-    """查找视频文件"""
-    for root, dirs, files in os.walk(search_dir):
-        for file in files:
-            if file.endswith(".mp4") and filename_prefix in file:
-                return os.path.join(root, file)
-    return None
+        print(f"⚠️ 用量记账失败: {e}")
+    return record
+
+async def call_llm(sched, stage, messages, temperature=None):
+    """
+    所有 LLM 调用的统一入口：先经公平调度器拿到名额，再由模型路由按阶段选择模型请求，返回后记账
+    sched: {"session": 会话标识, "budget": 预算记账标识 (缺省同 session), "on_wait": 排队回调,
+            "edit_mode": 是否 diff 模式, "model": 强制使用的模型 (None = 按阶段路由), "usage": 本次请求的 RequestUsage}
+    temperature 为 None 时使用阶段配置；低温阶段的相同输入直接复用阶段记忆，不占名额也不计费
+    每次调用前重新检查预算：超出预算且配置了 BUDGET_FALLBACK_MODEL 时换用便宜模型
+    """
+    cost = estimate_llm_cost(stage, edit_mode=sched.get("edit_mode", False))
+    memo_key = None
+    forced_model = sched.get("model")
+    if not forced_model and BUDGET_FALLBACK_MODEL \
+            and usage_ledger.budget_level(sched.get("budget") or sched.get("session") or "anonymous") == "minimal":
+        forced_model = BUDGET_FALLBACK_MODEL
+    with tracer.span(stage, edit_mode=sched.get("edit_mode", False), cost=cost) as span:
+        effective_temperature = llm_router.effective_temperature(stage, temperature)
+        if stage_memo.eligible(stage, effective_temperature):
+            models = forced_model or llm_router.configured_models(stage)
+            memo_key = stage_memo.make_key(stage, models, effective_temperature, messages)
+            memo = stage_memo.get(memo_key)
+            if memo:
+                span.set(memo="hit", model=memo["model"])
+                return memoized_response(memo["content"])
+        async with scheduler.slot("llm", sched.get("session"), cost, sched.get("on_wait")) as ticket:
+            span.set(queued_ms=round((ticket.started - ticket.enqueued) * 1000, 1))
+            # 超过 SLO 被放弃的调用照样计费，返回后补记
+            response, model = await llm_router.complete(
+                stage, messages, temperature, forced_model,
+                on_abandoned=lambda abandoned_model, abandoned: record_llm_usage(
+                    sched, f"{stage}.abandoned", abandoned_model, abandoned
+                )
+            )
+        span.set(model=model)
+        record = record_llm_usage(sched, stage, model, response)
+        if record:
+            span.set(prompt_tokens=record["prompt_tokens"], completion_tokens=record["completion_tokens"],
+                     cost_amount=record["cost"])
+    if memo_key:
+        try:
+            stage_memo.put(memo_key, stage, model, response.choices[0].message.content)
+        except Exception as e:
+            print(f"⚠️ 阶段记忆保存失败: {e}")
+    return response
+
+async def request_code_patch(request_id, sched, stage, system_prompt, user_input, base_code, allow_empty=False):
+    """
+    增量编辑：让 LLM 返回 diff 并在本地应用，失败时返回 None 以便退回整文件重写
+    allow_empty: 空补丁是否表示"无需改动" (改进器) —— 否则 (生成器) 空补丁同样视为失败
+    """
+    response = await call_llm({**sched, "edit_mode": True}, stage, [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input}
+    ])
+    with tracer.span("patch.apply", stage=stage) as span:
+        try:
+            return apply_llm_patch(base_code, response.choices[0].message.content)
+        except EmptyPatch as e:
+            span.set(empty=True)
+            if allow_empty:
+                return base_code
+            span.fail(e)
+            print(f"[{request_id}] ⚠️ 增量补丁为空，退回整文件重写")
+            return None
+        except PatchError as e:
+            span.fail(e)
+            print(f"[{request_id}] ⚠️ 增量补丁无法应用，退回整文件重写: {e}")
+            return None
+
+async def request_merged_review(request_id, sched, prompt, draft_code):
+    """合并档位：一次调用完成质检 + 改进，返回 {"rating", "issues", "code"}；输出无法解析时返回 None"""
+    response = await call_llm(sched, "reviewer", [
+        {"role": "system", "content": PROMPT_REVIEW_IMPROVER},
+        {"role": "user", "content": f"""
+【用户指令】: {prompt}
+【生成器初稿】:
+```python
+{draft_code}
+```
+请完成质检并以 JSON 输出评级、问题列表和修复后的完整代码。
+"""}
+    ])
+    with tracer.span("review.parse") as span:
+        review = extract_review_from_response(response.choices[0].message.content)
+        if review is None:
+            span.fail("结构化输出无法解析")
+            print(f"[{request_id}] ⚠️ 合并质检输出无法解析，退回质检 + 改进两次调用")
+            return None
+        span.set(rating=review["rating"], issues=len(review["issues"]))
+    print(f"[{request_id}] 🧪 合并质检: {review['rating']}，{len(review['issues'])} 个问题")
+    return review
 
 # ================= 🚀 核心工作流逻辑 (完整4步 + WebSocket + 侦探) =================
-async def process_chat_workflow(prompt: str, websocket: WebSocket):
-    """处理核心业务逻辑，通过 WebSocket 发送实时进度"""
+async def process_chat_workflow(prompt: str, websocket: WebSocket, standalone: bool = False,
+                                session_id: str = None, budget_key: str = None):
+    """
+    处理核心业务逻辑，通过 WebSocket 发送实时进度
+    standalone=True 时视为独立的新建请求：不读取也不改写全局场景和对话记录 (用于批量预计算)
+    session_id 用于公平调度 (同一会话的任务共享一份份额)
+    budget_key 用于会话预算记账，由服务端决定 (WebSocket 连接 ID)；缺省时同 session_id
+    """
     request_id = str(uuid.uuid4())[:8]
     output_filename = f"video_{request_id}"
     
@@ -381,45 +505,184 @@ async def process_chat_workflow(prompt: str, websocket: WebSocket):
                 "message": message
             })
 
+    # 排队时把位置和预计等待时间推送给客户端
+    async def notify_queue(position, eta):
+        print(f"[{request_id}] ⏳ 排队中：前面 {position} 个任务，预计 {eta:.0f}s")
+        if websocket:
+            await websocket.send_json({
+                "type": "progress",
+                "step": "queue",
+                "message": f"排队中：前面还有 {position} 个任务，预计等待 {eta:.0f} 秒...",
+                "queue": {"position": position, "eta_seconds": eta}
+            })
+
+    # 用量记账与预算：超过阈值时逐级降级
+    request_usage = RequestUsage()
+    session_key = session_id or request_id
+    budget_session = budget_key or session_key
+    budget_level = usage_ledger.budget_level(budget_session)
+    sched = {
+        "session": session_key,
+        "budget": budget_session,
+        "on_wait": notify_queue,
+        "usage": request_usage,
+        "model": None
+    }
+
+    def budget_notice(level):
+        if level == "economy":
+            return "今日用量已接近预算，已切换为节省模式 (跳过质检，只尝试一个修复方案)"
+        if BUDGET_FALLBACK_MODEL:
+            return "今日用量已超出预算，已切换为经济模型"
+        return "今日用量已超出预算，已停止调用 AI (仅模板指令和已完成的初稿可以继续渲染)"
+
+    def llm_blocked(level):
+        """超出预算又没有配置便宜模型：生成器、改进器、修复器都不再调用 LLM"""
+        return level == "minimal" and not BUDGET_FALLBACK_MODEL
+
+    async def check_budget():
+        """重新检查预算 (并行修复、合并质检等会让用量在请求中途越过阈值)，返回本次请求到目前为止的最高级别"""
+        nonlocal budget_level
+        level = usage_ledger.budget_level(budget_session)
+        if BUDGET_LEVELS.index(level) > BUDGET_LEVELS.index(budget_level):
+            budget_level = level
+            await send_status("budget", budget_notice(level))
+        return budget_level
+
     await send_status("init", f"收到指令: {prompt}")
+    if budget_level != "normal":
+        await send_status("budget", budget_notice(budget_level))
     
+    # 请求追踪：WebSocket 任务下挂在任务的 trace 里，预热等独立调用时新建 trace
+    workflow_span = tracer.start_span("workflow", new_trace=True, request_id=request_id,
+                                      prompt=prompt, session=session_key, budget_level=budget_level)
     try:
         # =======================================================
         # 🔍 第0步：分析当前状态和用户意图
         # =======================================================
-        current_state = context_manager.analyze_current_code()
-        context_summary = context_manager.get_context_summary()
+        if standalone:
+            current_state = {"status": "no_code", "objects": [], "has_axes": False}
+            context_summary = {"text": "无历史对话", "objects": [], "current_style": "无"}
+        else:
+            current_state = context_manager.analyze_current_code()
+            context_summary = context_manager.get_context_summary()
+        has_scene = current_state.get("status") == "has_code"
+        intent_state = {k: current_state.get(k) for k in ("status", "objects", "has_axes")}
         
-        await send_status("intent", "正在分析您的意图...")
-        intent_analysis = None
-        try:
-            intent_response = await client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": PROMPT_INTENT_ANALYZER},
-                    {"role": "user", "content": f"""
+        # =======================================================
+        # 🧰 模板直出：常见指令套用参数化场景，跳过所有 LLM 阶段
+        # =======================================================
+        template_match = None
+        if TEMPLATE_ENABLED:
+            with tracer.span("template.match") as match_span:
+                # 匹配时要对表达式采样，放到线程里并限时，避免刁钻的表达式卡住事件循环
+                try:
+                    candidate = await asyncio.wait_for(
+                        asyncio.to_thread(template_library.match, prompt), TEMPLATE_MATCH_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    print(f"[{request_id}] ⏱️ 模板匹配超过 {TEMPLATE_MATCH_TIMEOUT}s，走完整流水线")
+                    candidate = None
+                match_span.set(template=candidate.name if candidate else None,
+                               confidence=candidate.confidence if candidate else 0)
+            if candidate and candidate.confidence >= TEMPLATE_MIN_CONFIDENCE:
+                template_match = candidate
+            elif candidate:
+                print(f"[{request_id}] 🧰 模板 {candidate.name} 置信度 {candidate.confidence} 过低，走完整流水线")
+
+        if template_match:
+            await send_status("template", f"命中模板「{template_match.title}」，跳过 AI 生成直接渲染")
+            start_time = time.time()
+            draft_code = final_code = template_match.code()
+            critique = "（模板直出，未调用 LLM）"
+            intent_analysis = {"intent": "CREATE", "confidence": template_match.confidence,
+                               "reason": f"template:{template_match.name}"}
+            edit_modes = {"generator": "template", "improver": "template"}
+            gen_time = ana_time = imp_time = 0.0
+            checkpoint_key = None
+            resumed_render = None
+        else:
+            # 断点续跑：同一指令在同一场景上失败过，直接复用已完成阶段的输出
+            checkpoint_key = checkpoint_store.make_key(
+                prompt, context_manager.read_scene_code() if has_scene else "", PIPELINE_PROFILE
+            )
+            resumed = checkpoint_store.load(checkpoint_key)
+            if resumed:
+                if "render" in resumed:
+                    await send_status("checkpoint", "发现上次未完成的相同请求，直接修复上次渲染失败的代码...")
+                else:
+                    last_stage = "改进" if "improver" in resumed else "初稿生成"
+                    await send_status("checkpoint", f"发现上次未完成的相同请求，从「{last_stage}」之后继续...")
+                workflow_span.set(resumed_from=list(resumed))
+            elif llm_blocked(await check_budget()):
+                # 没有可续跑的初稿，生成器必须调用 LLM：直接拒绝，不再产生费用
+                print(f"[{request_id}] 💰 已超出预算，拒绝生成新代码")
+                workflow_span.set(success=False, refused="budget")
+                if websocket:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": "今日用量已超出预算，暂时无法生成新动画 (模板支持的指令仍可使用)"
+                    })
+                return
+
+            intent_analysis = None
+            if resumed:
+                intent_analysis = resumed["generator"]["intent"]
+            else:
+                await send_status("intent", "正在分析您的意图...")
+                try:
+                    intent_response = await call_llm(sched, "intent", [
+                        {"role": "system", "content": PROMPT_INTENT_ANALYZER},
+                        {"role": "user", "content": f"""
 用户指令: {prompt}
-当前状态: {json.dumps(current_state, ensure_ascii=False)}
+当前状态: {json.dumps(intent_state, ensure_ascii=False)}
+当前场景: {context_manager.build_scene_context("intent") if has_scene else "无现有代码"}
 上下文摘要: {context_summary['text']}
 
 请分析用户的真实意图。
 """}
-                ],
-                stream=False,
-                temperature=0.1
-            )
-            intent_analysis = extract_json_from_response(intent_response.choices[0].message.content)
-            print(f"[{request_id}] 🎯 意图分析: {intent_analysis}")
-        except Exception as e:
-            print(f"[{request_id}] ⚠️ 意图分析失败: {e}")
-        
-        # =======================================================
-        # 🎨 第一步：生成器 - 上下文感知初稿
-        # =======================================================
-        await send_status("generator", "正在构思动画代码...")
-        start_time = time.time()
+                    ])
+                    intent_analysis = extract_json_from_response(intent_response.choices[0].message.content)
+                    print(f"[{request_id}] 🎯 意图分析: {intent_analysis}")
+                except Exception as e:
+                    print(f"[{request_id}] ⚠️ 意图分析失败: {e}")
+
+            # =======================================================
+            # 🎨 第一步：生成器 - 上下文感知初稿
+            # =======================================================
+            start_time = time.time()
+
+            # MODIFY / ADD：增量编辑 (LLM 只返回 diff)，输出 token 不随场景长度增长
+            intent_type = (intent_analysis or {}).get("intent")
+            edit_mode = EDIT_MODE_ENABLED and has_scene and intent_type in EDIT_MODE_INTENTS
+            edit_modes = {"generator": "rewrite", "improver": "rewrite"}
+            draft_code = None
+            if resumed:
+                draft_code = resumed["generator"]["code"]
+                edit_modes = dict(resumed["generator"]["edit_modes"])
+            else:
+                await send_status("generator", "正在构思动画代码...")
+
+            if edit_mode and draft_code is None:
+                current_code = context_manager.read_scene_code()
+                edit_input = f"""
+【用户指令】:
+{prompt}
+
+【意图分析】:
+{json.dumps(intent_analysis, ensure_ascii=False)}
+
+【当前代码】(current_scene.py):
+```python
+{current_code}
+```
+"""
+                draft_code = await request_code_patch(request_id, sched, "generator", PROMPT_DIFF_EDITOR, edit_input, current_code)
+                if draft_code is not None:
+                    edit_modes["generator"] = "diff"
         
-        generator_input = f"""
+            if draft_code is None:
+                generator_input = f"""
 【用户指令】:
 {prompt}
 
@@ -427,7 +690,7 @@ async def process_chat_workflow(prompt: str, websocket: WebSocket):
 {json.dumps(intent_analysis, ensure_ascii=False) if intent_analysis else "未分析"}
 
 【当前代码状态】:
-{current_state.get('code_preview', '无现有代码')}
+{context_manager.build_scene_context("generator") if has_scene else '无现有代码'}
 
 【已存在的对象】:
 {', '.join(current_state.get('objects', [])) if current_state.get('objects') else '无'}
@@ -441,201 +704,339 @@ async def process_chat_workflow(prompt: str, websocket: WebSocket):
 3. 如果是修改或添加，请基于当前代码进行；如果是新建，可以完全重写
 4. 确保所有内容都在屏幕内
 """
+            
+                gen_response = await call_llm(sched, "generator", [
+                    {"role": "system", "content": PROMPT_GENERATOR},
+                    {"role": "user", "content": generator_input}
+                ])
+            
+                draft_code = extract_code_from_markdown(gen_response.choices[0].message.content)
         
-        gen_response = await client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": PROMPT_GENERATOR},
-                {"role": "user", "content": generator_input}
-            ],
-            stream=False,
-            temperature=0.7
-        )
-        
-        draft_code = extract_code_from_markdown(gen_response.choices[0].message.content)
-        gen_time = time.time() - start_time
-        
-        # =======================================================
-        # ⚖️ 第二步：分析器 - 上下文感知质检
-        # =======================================================
-        await send_status("analyzer", "正在检查代码质量...")
-        ana_start = time.time()
+            gen_time = time.time() - start_time
+            if not resumed:
+                checkpoint_store.save(checkpoint_key, "generator", {
+                    "intent": intent_analysis, "code": draft_code, "edit_modes": dict(edit_modes)
+                })
         
-        analyzer_input = f"""
+            # =======================================================
+            # ⚖️ 第二步：分析器 - 上下文感知质检
+            # =======================================================
+            ana_start = time.time()
+            review = None
+            resumed_improver = resumed.get("improver")
+            budget_now = await check_budget()
+            if PIPELINE_PROFILE == "merged" and edit_modes["generator"] != "diff" and not resumed_improver \
+                    and budget_now == "normal":
+                # 合并档位：一次调用同时完成质检和改进，解析失败时退回下面的两次调用
+                await send_status("analyzer", "正在检查并优化代码...")
+                review = await request_merged_review(request_id, sched, prompt, draft_code)
+            if resumed_improver:
+                critique = resumed_improver["critique"]
+            elif review is not None:
+                critique = f"[总体评级] {review['rating']}\n" + (
+                    "\n".join(f"{i}. {issue}" for i, issue in enumerate(review["issues"], 1)) or "未发现问题"
+                )
+            elif budget_now != "normal":
+                # 节省模式：跳过质检，改进器只按通用规范整理初稿
+                await send_status("analyzer", "节省模式：跳过质检")
+                critique = "（节省模式：未进行质检，请按通用布局规范检查初稿）"
+            else:
+                await send_status("analyzer", "正在检查代码质量...")
+                # 质检 / 改进 / 修复都要逐行检查或改写初稿，只给摘要会看不到要改的代码，
+                # 所以这几个阶段始终拿完整初稿；初稿本身已包含现有场景，不再额外附场景摘要
+                analyzer_input = f"""
 【用户指令】: {prompt}
 【生成器初稿】: {draft_code}
 请检查布局、遮挡和 MathTex 中文问题。
 """
+            
+                ana_response = await call_llm(sched, "analyzer", [
+                    {"role": "system", "content": PROMPT_ANALYZER},
+                    {"role": "user", "content": analyzer_input}
+                ])
+            
+                critique = ana_response.choices[0].message.content
+            ana_time = time.time() - ana_start
         
-        ana_response = await client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": PROMPT_ANALYZER},
-                {"role": "user", "content": analyzer_input}
-            ],
-            stream=False,
-            temperature=0.1
-        )
-        
-        critique = ana_response.choices[0].message.content
-        ana_time = time.time() - ana_start
+            # =======================================================
+            # 🔧 第三步：改进器 - 智能优化
+            # =======================================================
+            imp_start = time.time()
+            final_code = None
+            if resumed_improver:
+                final_code = resumed_improver["code"]
+                edit_modes = dict(resumed_improver["edit_modes"])
+            elif review is not None:
+                final_code = review["code"]
+                edit_modes["improver"] = "merged"
+            elif llm_blocked(budget_now):
+                # 请求中途超出预算又没有便宜模型：不调用改进器，直接渲染初稿
+                await send_status("improver", "已超出预算，跳过优化直接渲染初稿")
+                final_code = draft_code
+                edit_modes["improver"] = "skipped"
+            else:
+                await send_status("improver", "正在优化代码细节...")
         
-        # =======================================================
-        # 🔧 第三步：改进器 - 智能优化
-        # =======================================================
-        await send_status("improver", "正在优化代码细节...")
-        imp_start = time.time()
+            if edit_modes["generator"] == "diff" and final_code is None:
+                improver_input = f"""
+【用户指令】: {prompt}
+【质检报告】: {critique}
+【当前代码】:
+```python
+{draft_code}
+```
+请以 diff 形式修复所有问题，特别是 MathTex 中文和 import math。
+"""
+                final_code = await request_code_patch(request_id, sched, "improver", PROMPT_DIFF_IMPROVER, improver_input,
+                                                      draft_code, allow_empty=True)
+                if final_code is not None:
+                    edit_modes["improver"] = "diff"
         
-        improver_input = f"""
+            if final_code is None:
+                improver_input = f"""
 【用户指令】: {prompt}
 【初稿】: {draft_code}
 【质检报告】: {critique}
 请修复所有问题，特别是 MathTex 中文和 import math。
 """
+            
+                imp_response = await call_llm(sched, "improver", [
+                    {"role": "system", "content": PROMPT_IMPROVER},
+                    {"role": "user", "content": improver_input}
+                ])
+            
+                final_code = extract_code_from_markdown(imp_response.choices[0].message.content)
         
-        imp_response = await client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": PROMPT_IMPROVER},
-                {"role": "user", "content": improver_input}
-            ],
-            stream=False,
-            temperature=0.3
-        )
-        
-        final_code = extract_code_from_markdown(imp_response.choices[0].message.content)
-        imp_time = time.time() - imp_start
+            imp_time = time.time() - imp_start
+            if not resumed_improver:
+                checkpoint_store.save(checkpoint_key, "improver", {
+                    "code": final_code, "critique": critique, "edit_modes": dict(edit_modes)
+                })
+            resumed_render = resumed.get("render")
+            if resumed_render:
+                final_code = resumed_render["code"]
         
         # =======================================================
         # 🎬 第四步：渲染执行 (并发隔离 + 动态侦探)
         # =======================================================
         await send_status("render", "正在渲染视频 (可能需要几分钟)...")
         
-        # 3.1 动态代码分析 (Scene Name Detection)
-        code_analysis = analyze_code_structure(final_code)
-        scene_name = code_analysis.get("scene_class") or DEFAULT_SCENE_NAME
-        
         video_url = None
         error_details = None
         final_objects = []
+        render_usage = []  # 每次渲染尝试的资源用量 (CPU 秒数 / 峰值内存 / 是否被限制终止)
         
-        # 1. 创建本次请求的专属临时目录 (并发隔离)
-        request_dir = os.path.join(TEMP_DIR, f"req_{request_id}")
-        os.makedirs(request_dir, exist_ok=True)
-        
-        # 2. 专属场景文件路径
-        local_scene_file = os.path.join(request_dir, "current_scene.py")
-        dump_file = os.path.join(request_dir, "objects_dump.json").replace("\\", "/")
-        
-        # 🔥【关键】注入 Inspector 代码 (侦探) 🔥
-        # 这是一个继承自用户 Scene 的子类，专门用于在 tear_down 时窃取对象列表
-        inspector_class_name = f"Inspector_{request_id}"
-        inspector_code = f"""
-import json
-class {inspector_class_name}({scene_name}):
-    def tear_down(self):
-        try:
-            detected_objects = []
-            # 1. 扫描属性 (self.xxx)
-            for name, value in self.__dict__.items():
-                if isinstance(value, Mobject):
-                    detected_objects.append(name)
-            # 2. 扫描屏幕上的对象 (self.mobjects)
-            for mobj in self.mobjects:
-                name = mobj.__class__.__name__
-                if name not in detected_objects:
-                    detected_objects.append(name)
+        async def relay_render_event(message):
+            await send_status("render", message)
+
+        async def render_code(code, attempt, candidate=None, output_dir=None, on_abandoned=None):
+            """渲染一份代码 (先经公平调度拿到渲染名额)，返回渲染结果；后两个参数见 run_render_job"""
+            # 动态代码分析 (Scene Name Detection)，修复后类名可能变化，每次重新识别
+            analysis = code_analyzer.analyze(code)
+            scene_name = analysis.get("scene_class") or DEFAULT_SCENE_NAME
             
-            # 将检测到的对象写入临时文件
-            with open(r"{dump_file}", "w", encoding="utf-8") as f:
-                json.dump(list(set(detected_objects)), f, ensure_ascii=False)
-        except Exception as e:
-            print(f"Inspector Error: {{e}}")
-        finally:
-            super().tear_down()
-"""
+            # 渲染任务 (inline 在本机线程池执行；broker 模式交给独立渲染 worker)
+            job = new_render_job(request_id, code, scene_name, output_filename)
+            render_cost = estimate_render_cost(analysis, job["quality"])
+            with tracer.span("render", attempt=attempt, candidate=candidate, scene=scene_name,
+                             quality=job["quality"], cost=render_cost, mode=RENDER_MODE) as render_span:
+                async with scheduler.slot("render", sched["session"], render_cost, notify_queue) as ticket:
+                    render_span.set(queued_ms=round((ticket.started - ticket.enqueued) * 1000, 1))
+                    render_result = await run_render_job(job, on_event=relay_render_event,
+                                                         output_dir=output_dir, on_abandoned=on_abandoned)
+                render_span.set(exit_code=render_result.get("returncode"),
+                                **{f"usage.{k}": v for k, v in (render_result.get("usage") or {}).items()})
+                if render_result.get("returncode") != 0:
+                    render_span.fail((render_result.get("stderr") or "未知错误")[-200:])
+            return render_result
+
+        async def validate_fix_candidate(code):
+            """修复候选的廉价校验：静态检查 + 空跑 construct (仅 inline 模式)；通过时返回 None，否则返回问题描述"""
+            problems = code_analyzer.lint(code)
+            if problems:
+                return "；".join(problems)
+            if FIXER_DRY_RUN and RENDER_MODE != "broker":
+                scene_name = code_analyzer.analyze(code).get("scene_class") or DEFAULT_SCENE_NAME
+                with tracer.span("fixer.dry_run") as dry_span:
+                    dry_run = await run_dry_run(new_render_job(request_id, code, scene_name, output_filename))
+                    dry_span.set(exit_code=dry_run["returncode"])
+                    if dry_run["returncode"] != 0:
+                        dry_span.fail((dry_run["stderr"] or "空跑失败")[-200:])
+                        return (dry_run["stderr"] or "空跑失败")[-500:]
+            return None
+
+        async def race_fix_candidates(attempt, broken_code, error_details):
+            """
+            并行修复：用不同温度同时请求多个修复候选，每个候选校验通过后立即开始渲染；
+            第一个渲染成功的候选胜出，其余仍在进行的 LLM 调用 / 空跑 / 渲染全部取消。
+            每个候选渲染到自己的临时目录，结束后整个删除 (胜出的视频先移出)；
+            所有候选的渲染用量都记入 render_usage (被取消的在渲染线程收尾后补记)。
+            返回 (代码, 渲染结果)；全部失败时返回最有参考价值的失败 (渲染失败优先于校验失败)
+            """
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPTS["code_fixer"]},
+                {"role": "user", "content": PROMPT_EMERGENCY_FIXER.format(
+                    error_details=error_details,
+                    final_code=broken_code
+                )}
+            ]
+
+            candidate_dirs = [os.path.join(worker_scratch_dir(), f"fix_{request_id}_{attempt}_{i}")
+                              for i in range(len(FIXER_CANDIDATE_TEMPERATURES))]
+
+            def record_candidate_usage(index, result):
+                if result.get("usage"):
+                    render_usage.append({"attempt": attempt, "candidate": index, **result["usage"]})
 
+            def abandoned_render(index, result):
+                record_candidate_usage(index, result)
+                shutil.rmtree(candidate_dirs[index], ignore_errors=True)
+
+            async def try_candidate(index, temperature):
+                response = await call_llm(sched, "fixer", messages, temperature=temperature)
+                code = extract_code_from_markdown(response.choices[0].message.content)
+                problem = await validate_fix_candidate(code)
+                if problem:
+                    print(f"[{request_id}] 🩹 修复候选 {index} 未通过校验: {problem[:100]}")
+                    return code, {"returncode": -1, "stderr": problem, "video_path": None, "objects": None}, False
+                result = await render_code(code, attempt, candidate=index, output_dir=candidate_dirs[index],
+                                           on_abandoned=lambda late: abandoned_render(index, late))
+                record_candidate_usage(index, result)
+                return code, result, True
+
+            tasks = [asyncio.create_task(try_candidate(i, t)) for i, t in enumerate(FIXER_CANDIDATE_TEMPERATURES)]
+            winner, fallback, last_error = None, None, None
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    try:
+                        code, result, rendered = await finished
+                    except Exception as e:
+                        print(f"[{request_id}] ⚠️ 修复候选失败: {e}")
+                        last_error = e
+                        continue
+                    if result.get("returncode") == 0:
+                        winner = (code, result)
+                        break
+                    if fallback is None or (rendered and not fallback[2]):
+                        fallback = (code, result, rendered)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+                # 落败但同样渲染成功的候选：删除多余的视频 (broker 模式下输出不在候选目录里)
+                for outcome in outcomes:
+                    if isinstance(outcome, tuple) and outcome[1].get("video_path") \
+                            and (winner is None or outcome[1] is not winner[1]):
+                        try:
+                            os.remove(outcome[1]["video_path"])
+                        except OSError:
+                            pass
+                # 胜出的视频移出候选目录，候选目录整个删除
+                if winner is not None and winner[1].get("video_path"):
+                    kept_path = os.path.join(worker_scratch_dir(), os.path.basename(winner[1]["video_path"]))
+                    shutil.move(winner[1]["video_path"], kept_path)
+                    winner[1]["video_path"] = kept_path
+                for candidate_dir in candidate_dirs:
+                    shutil.rmtree(candidate_dir, ignore_errors=True)
+
+            if winner:
+                print(f"[{request_id}] 🩹 并行修复成功 (候选 {len(FIXER_CANDIDATE_TEMPERATURES)} 个)")
+                return winner
+            if fallback:
+                return fallback[0], fallback[1]
+            raise last_error or RuntimeError("没有可用的修复候选")
+
+        pending_result = None  # 并行修复中已经渲染过的候选结果，下一轮直接使用
+        if resumed_render:
+            # 断点续跑：上次渲染失败的代码不再重渲染，带着上次的错误直接进入修复
+            pending_result = {"returncode": 1, "stderr": resumed_render["error"], "video_path": None, "objects": None}
         for attempt in range(MAX_RETRIES + 1):
-            if attempt > 0:
+            if attempt > 0 and pending_result is None:
                 await send_status("render", f"渲染出错，正在第 {attempt} 次自动修复...")
             
-            # 写入带侦探的代码 (源代码 + 侦探代码)
-            with open(local_scene_file, "w", encoding="utf-8") as f:
-                f.write(final_code + "\n" + inspector_code)
-            
-            # 运行 Manim (运行的是 Inspector 类，而不是原类)
-            cmd = [
-                sys.executable, "-m", "manim",
-                DEFAULT_QUALITY,
-                "--media_dir", request_dir,
-                "-o", output_filename,
-                local_scene_file,
-                inspector_class_name # <--- 运行侦探
-            ]
-            
-            returncode, stdout, stderr = await asyncio.to_thread(run_manim_safe, cmd)
+            code_analysis = code_analyzer.analyze(final_code)
+            if pending_result is not None:
+                # 并行修复的候选结果 (用量已在 race_fix_candidates 中记录) 或断点续跑时上次的渲染错误
+                render_result, pending_result = pending_result, None
+            else:
+                render_result = await render_code(final_code, attempt)
+                if render_result.get("usage"):
+                    render_usage.append({"attempt": attempt, **render_result["usage"]})
+            video_path = render_result.get("video_path")
             
-            if returncode == 0:
-                # 5. 查找视频
-                video_path = await find_video_file(request_dir, output_filename)
-                
+            if render_result.get("returncode") == 0:
                 if video_path:
                     target_name = f"{output_filename}.mp4"
-                    target_path = os.path.join(STATIC_DIR, target_name)
                     
-                    shutil.move(video_path, target_path)
-                    video_url = f"/static/{target_name}"
+                    # 封装队列：faststart remux (在收录前完成，保证内容哈希/ETag 稳定)
+                    await send_status("package", "正在优化视频封装...")
+                    with tracer.span("package.faststart") as package_span:
+                        try:
+                            video_path = await packaging_queue.submit("faststart", remux_faststart, video_path)
+                        except Exception as e:
+                            package_span.fail(e)
+                            print(f"[{request_id}] ⚠️ faststart 封装失败，使用原始视频: {e}")
+                    
+                    # 收录进视频仓库 (内容哈希去重 + 配额淘汰)
+                    with tracer.span("artifact.ingest", target=target_name,
+                                     bytes=os.path.getsize(video_path)):
+                        await asyncio.to_thread(artifact_store.ingest, video_path, target_name)
+                    video_url = f"/video/{target_name}"
+                    
+                    # 长视频的 HLS 切片在后台进行，不阻塞本次结果返回
+                    packaging_queue.submit_background(
+                        "hls", segment_hls, os.path.join(STATIC_DIR, target_name), target_name
+                    )
                     
                     # 🔥 读取侦探的报告 (100% 准确的运行时数据)
-                    try:
-                        if os.path.exists(dump_file):
-                            with open(dump_file, "r", encoding="utf-8") as f:
-                                final_objects = json.load(f)
-                            print(f"[{request_id}] 🕵️ 侦探报告: {final_objects}")
-                        else:
-                            # 如果侦探失败，降级为静态正则分析
-                            print(f"[{request_id}] ⚠️ 侦探未生成报告，降级为静态分析")
-                            final_objects = extract_objects_from_code(final_code)
-                    except:
-                        final_objects = extract_objects_from_code(final_code)
+                    if render_result.get("objects") is not None:
+                        final_objects = render_result["objects"]
+                        print(f"[{request_id}] 🕵️ 侦探报告: {final_objects}")
+                    else:
+                        # 如果侦探失败，降级为静态 AST 分析
+                        print(f"[{request_id}] ⚠️ 侦探未生成报告，降级为静态分析")
+                        final_objects = code_analyzer.objects(final_code)
 
                     print(f"[{request_id}] 🎉 渲染成功!")
                     
                     # 成功后更新全局状态
-                    try:
-                        with open(SCENE_FILE, "w", encoding="utf-8") as f:
-                            f.write(final_code)
-                    except Exception as e:
-                        print(f"[{request_id}] ⚠️ 全局状态更新警告: {e}")
+                    if not standalone:
+                        with tracer.span("context.save_scene", bytes=len(final_code.encode("utf-8"))) as scene_span:
+                            try:
+                                context_manager.save_scene_code(final_code)
+                            except Exception as e:
+                                scene_span.fail(e)
+                                print(f"[{request_id}] ⚠️ 全局状态更新警告: {e}")
                         
                     break
             else:
+                stderr = render_result.get("stderr")
                 error_details = stderr[-500:] if stderr else "未知错误"
                 print(f"[{request_id}] ❌ 渲染失败: {error_details[:100]}...")
+                if checkpoint_key:
+                    checkpoint_store.save(checkpoint_key, "render", {"code": final_code, "error": error_details})
                 
-                if attempt < MAX_RETRIES:
+                # 每次修复重试前重新检查预算：超出预算又没有便宜模型时停止自动修复，接近预算时只用一个修复候选
+                budget_now = await check_budget() if attempt < MAX_RETRIES else budget_level
+                if attempt < MAX_RETRIES and llm_blocked(budget_now):
+                    print(f"[{request_id}] 💰 已超出预算，停止自动修复")
+                    break
+                if attempt < MAX_RETRIES and len(FIXER_CANDIDATE_TEMPERATURES) > 1 and budget_now == "normal":
+                    await send_status("render", f"渲染出错，正在并行尝试 {len(FIXER_CANDIDATE_TEMPERATURES)} 个修复方案 "
+                                                f"(第 {attempt + 1} 次自动修复)...")
+                    final_code, pending_result = await race_fix_candidates(attempt + 1, final_code, error_details)
+                elif attempt < MAX_RETRIES:
                     fixer_prompt = PROMPT_EMERGENCY_FIXER.format(
                         error_details=error_details,
                         final_code=final_code
                     )
                     
-                    fix_response = await client.chat.completions.create(
-                        model=MODEL_NAME,
-                        messages=[
-                            {"role": "system", "content": SYSTEM_PROMPTS["code_fixer"]},
-                            {"role": "user", "content": fixer_prompt}
-                        ],
-                        stream=False
-                    )
+                    fix_response = await call_llm(sched, "fixer", [
+                        {"role": "system", "content": SYSTEM_PROMPTS["code_fixer"]},
+                        {"role": "user", "content": fixer_prompt}
+                    ])
                     
                     final_code = extract_code_from_markdown(fix_response.choices[0].message.content)
-
-        # 任务结束，清理临时目录
-        try:
-            shutil.rmtree(request_dir, ignore_errors=True)
-            print(f"[{request_id}] 🧹 临时工作区已清理")
-        except:
-            pass
         
         # =======================================================
         # 💾 第五步：保存结果与缓存
@@ -649,6 +1050,11 @@ class {inspector_class_name}({scene_name}):
             "success": bool(video_url),
             "video_url": video_url,
             "intent_analysis": intent_analysis,
+            "edit_modes": edit_modes,
+            "render_usage": render_usage,
+            "usage": request_usage.to_dict(),
+            "budget_level": budget_level,
+            "template": template_match.name if template_match else None,
             "timing": {
                 "generator": gen_time,
                 "analyzer": ana_time,
@@ -658,14 +1064,24 @@ class {inspector_class_name}({scene_name}):
         }
         
         # 这里保存的是侦探抓取到的真实对象列表
-        context_manager.save_conversation(prompt, response_data, {
-            **code_analysis,
-            "objects": final_objects # <--- 真实数据
-        })
+        if not standalone:
+            with tracer.span("context.save_conversation"):
+                context_manager.save_conversation(prompt, response_data, {
+                    **code_analyzer.record(code_analysis),
+                    "objects": final_objects # <--- 真实数据
+                })
+        workflow_span.set(success=bool(video_url), attempts=len(render_usage),
+                          template=template_match.name if template_match else None,
+                          prompt_tokens=request_usage.totals["prompt_tokens"],
+                          completion_tokens=request_usage.totals["completion_tokens"])
         
         if video_url:
-            # 存入缓存
+            # 存入缓存；转码在封装队列后台进行，完成后格式列表写回缓存条目
             save_cache_entry(prompt, video_url)
+            if checkpoint_key:
+                checkpoint_store.discard(checkpoint_key)
+            if ENCODING_ENABLED_PROFILES:
+                encoding_queue.submit_background("encode", encode_cached_video, prompt_cache_key(prompt), video_url)
             
             if websocket:
                 await websocket.send_json({
@@ -673,7 +1089,8 @@ class {inspector_class_name}({scene_name}):
                     "status": "success",
                     "video": video_url,
                     "code": final_code,
-                    "timing": response_data["timing"]
+                    "timing": response_data["timing"],
+                    "usage": {k: v for k, v in response_data["usage"].items() if k != "calls_detail"}
                 })
         else:
             if websocket:
@@ -685,64 +1102,270 @@ class {inspector_class_name}({scene_name}):
             
     except Exception as e:
         print(f"[{request_id}] 💥 系统异常: {str(e)}")
+        workflow_span.fail(e)
         if websocket:
             await websocket.send_json({
                 "type": "error",
                 "message": f"系统异常: {str(e)}"
             })
+    finally:
+        workflow_span.end()
+
+# ================= 🔥 缓存预热 =================
+async def run_precompute_prompt(prompt, collector):
+    """预热单条指令：与在线请求共用合并通道，避免同一指令被重复生成"""
+    await request_coalescer.run(
+        prompt_cache_key(prompt),
+        collector,
+        lambda channel: process_chat_workflow(prompt, channel, standalone=True, session_id="precompute")
+    )
+
+precompute_runner = PrecomputeRunner(run_precompute_prompt, get_cached_video, prompt_cache_key)
 
 # ================= 🔌 WebSocket 接口 =================
+async def run_chat_job(job, session_id, budget_key=None):
+    """
+    任务主体：事件全部写入任务的事件日志，由日志推送给当前订阅的连接
+    session_id 来自客户端，只用于公平调度；预算按服务端给的 budget_key 记账
+    """
+    prompt = job.prompt
+
+    job_span = tracer.start_span("chat_job", new_trace=True, job_id=job.job_id,
+                                 session=session_id, prompt=prompt)
+    try:
+        # 1. 检查缓存
+        cached_entry = get_cached_entry(prompt)
+        if cached_entry:
+            print(f"✨ 命中缓存: {prompt}")
+            await job.send_json({
+                "type": "progress",
+                "step": "cache",
+                "message": "发现相同灵感，正在调取记忆..."
+            })
+            # 稍微停顿展示一下缓存命中效果
+            await asyncio.sleep(0.5)
+        
+            await job.send_json({
+                "type": "result",
+                "status": "success",
+                "video": cached_entry["video"],
+                "formats": cached_entry["formats"],
+                "code": "（缓存内容）",
+                "cached": True
+            })
+            job_span.set(cached=True)
+            return
+
+        # 2. 无缓存：相同指令正在生成时直接挂上去，否则开始完整工作流
+        async def notify_joined(channel):
+            print(f"🔗 合并到进行中的相同请求: {prompt}")
+            await channel.send_json({
+                "type": "progress",
+                "step": "coalesced",
+                "message": "相同指令正在生成中，已为您加入等待..."
+            })
+
+        leader = await request_coalescer.run(
+            prompt_cache_key(prompt),
+            job,
+            lambda channel: process_chat_workflow(prompt, channel, session_id=session_id, budget_key=budget_key),
+            on_join=notify_joined
+        )
+        job_span.set(cached=False, coalesced=not leader)
+    except Exception as e:
+        job_span.fail(e)
+        raise
+    finally:
+        job_span.end()
+
+def parse_cursor(value):
+    """客户端发来的 cursor 不可信：无法解析或为负数时从头补发 (按 0 处理)"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+async def resume_job(subscriber, job_id, cursor):
+    """断线重连：补发 cursor 之后的事件，任务仍在运行时继续订阅"""
+    job = job_registry.get(job_id)
+    if job:
+        _, truncated = job.events_after(cursor)
+        if truncated:
+            await subscriber.send_json({"type": "progress", "job_id": job_id, "step": "resume",
+                                        "message": "部分早期进度已过期，从最近的进度继续"})
+        await job.subscribe(subscriber, cursor)
+        return
+
+    record = job_registry.load_record(job_id)
+    if record:
+        # 任务已在其他 worker 上结束：补发保存下来的事件
+        for event in record["events"]:
+            if event["seq"] > cursor:
+                await subscriber.send_json(event)
+        return
+
+    await subscriber.send_json({
+        "type": "error",
+        "job_id": job_id,
+        "code": "job_unknown",
+        "message": "任务不存在或已过期，请重新发送指令"
+    })
+
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    一条长连接可以复用多个任务：
+    - {"type": "submit", "prompt", "session_id", "client_ref"} → 回复 {"type": "job", "job_id", "client_ref"}
+      (不带 type 的旧格式 {"prompt", "session_id"} 同样视为 submit)
+    - {"type": "resume", "job_id", "cursor"} → 补发 seq > cursor 的事件后继续推送
+    - {"type": "unsubscribe", "job_id"} / {"type": "ping"}
+    所有任务事件都带 job_id 和 seq；连接断开只取消订阅，任务继续运行
+    """
     await websocket.accept()
     print("🔌 新的 WebSocket 连接建立")
+    connection_id = f"conn_{uuid.uuid4().hex[:8]}"
+    subscriber = JobSubscriber(websocket)
     
     try:
         while True:
             data = await websocket.receive_json()
+            kind = data.get("type", "submit")
+
+            if kind == "ping":
+                await subscriber.send_json({"type": "pong"})
+                continue
+
+            if kind == "resume":
+                job_id = str(data.get("job_id") or "")
+                cursor = parse_cursor(data.get("cursor"))
+                print(f"🔁 恢复任务 {job_id} (cursor={cursor})")
+                await resume_job(subscriber, job_id, cursor)
+                continue
+
+            if kind == "unsubscribe":
+                job = job_registry.get(str(data.get("job_id") or ""))
+                if job:
+                    job.unsubscribe(subscriber)
+                continue
+
             prompt = data.get("prompt")
+            # 前端会话 ID 用于公平调度；旧客户端没有时按连接区分
+            # 预算不能按客户端自报的会话 ID 记账 (换个 ID 就能绕过)，一律按服务端生成的连接 ID
+            session_id = str(data.get("session_id") or connection_id)
             
-            if not prompt:
+            if kind != "submit" or not prompt:
                 continue
 
             print(f"\n{'='*60}")
             print(f"⚡ WS 收到指令: {prompt}")
             print(f"{'='*60}")
 
-            # 1. 检查缓存
-            cached_video = get_cached_video(prompt)
-            if cached_video:
-                print(f"✨ 命中缓存: {prompt}")
-                await websocket.send_json({
-                    "type": "progress",
-                    "step": "cache",
-                    "message": "发现相同灵感，正在调取记忆..."
-                })
-                # 稍微停顿展示一下缓存命中效果
-                await asyncio.sleep(0.5)
-                
-                await websocket.send_json({
-                    "type": "result",
-                    "status": "success",
-                    "video": cached_video,
-                    "code": "（缓存内容）",
-                    "cached": True
-                })
-                continue
-
-            # 2. 无缓存，开始完整工作流
-            await process_chat_workflow(prompt, websocket)
+            job = job_registry.create(prompt, session_id,
+                                      lambda j, s=session_id: run_chat_job(j, s, budget_key=connection_id))
+            await subscriber.send_json({
+                "type": "job",
+                "job_id": job.job_id,
+                "client_ref": data.get("client_ref"),
+                "prompt": prompt
+            })
+            await job.subscribe(subscriber)
             
     except WebSocketDisconnect:
-        print("🔌 客户端断开连接")
+        print("🔌 客户端断开连接 (任务继续在后台运行)")
     except Exception as e:
         print(f"❌ WS异常: {e}")
+    finally:
+        job_registry.detach(subscriber)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_events(job_id: str, cursor: str = "0"):
+    """轮询方式获取任务事件 (WebSocket 不可用时的后备)"""
+    cursor = parse_cursor(cursor)
+    job = job_registry.get(job_id)
+    if job:
+        events, truncated = job.events_after(cursor)
+        return {"job_id": job_id, "status": job.status, "events": events, "truncated": truncated}
+    record = job_registry.load_record(job_id)
+    if record:
+        return {"job_id": job_id, "status": record["status"],
+                "events": [e for e in record["events"] if e["seq"] > cursor], "truncated": False}
+    return JSONResponse({"error": "任务不存在或已过期"}, status_code=404)
 
 # ================= 🌐 静态页面路由 =================
 @app.get("/")
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.api_route("/video/{name}", methods=["GET", "HEAD"])
+async def serve_video(name: str, request: Request):
+    """视频专用接口：Range 拖动播放 + 强 ETag + immutable 长缓存"""
+    if not VIDEO_NAME_PATTERN.match(name):
+        return JSONResponse({"error": "非法文件名"}, status_code=404)
+    path = os.path.join(STATIC_DIR, name)
+    if not os.path.isfile(path):
+        return JSONResponse({"error": "视频不存在"}, status_code=404)
+    return build_video_response(request, path, artifact_store.get_hash(name))
+
+@app.api_route("/video/enc/{stem}/{filename}", methods=["GET", "HEAD"])
+async def serve_encoded_video(stem: str, filename: str, request: Request):
+    """转码版本：文件名自带内容哈希，直接用作强 ETag"""
+    match = ENCODED_NAME_PATTERN.match(filename)
+    if not match or not VIDEO_NAME_PATTERN.match(f"{stem}.mp4"):
+        return JSONResponse({"error": "非法文件名"}, status_code=404)
+    path = os.path.join(encoded_dir_for(stem), filename)
+    if not os.path.isfile(path):
+        return JSONResponse({"error": "视频不存在"}, status_code=404)
+    return build_video_response(request, path, match.group(1), FORMAT_MIME_TYPES[match.group(2)])
+
+@app.get("/api/video/{name}/packaging")
+async def get_video_packaging(name: str):
+    """查询视频的封装产物 (HLS 播放列表和转码版本在后台生成，可能稍后才可用)"""
+    if not VIDEO_NAME_PATTERN.match(name):
+        return JSONResponse({"error": "非法文件名"}, status_code=404)
+    return {
+        "video": f"/video/{name}",
+        "hls": hls_url_for(name),
+        "formats": list_encoded(name),
+        "pending_jobs": packaging_queue.pending() + encoding_queue.pending()
+    }
+
+@app.get("/api/ready")
+async def get_readiness():
+    """就绪探针：启动清理、视频仓库对账和 SDK 预热完成后就绪 (残留目录的后台删除不影响就绪)，停机开始后返回 503"""
+    body = {**startup_status, "worker": worker_id(), "scratch_purge_pending": scratch_purger.pending}
+    return JSONResponse(body, status_code=200 if startup_status["ready"] else 503)
+
+@app.get("/api/queue")
+async def get_queue_status():
+    """各阶段的排队情况和新任务的预计等待时间 (秒)"""
+    return {
+        "estimated_wait": {stage: scheduler.estimate_wait(stage) for stage in scheduler.pools},
+        "stages": scheduler.stats()
+    }
+
+@app.get("/api/llm/router")
+async def get_llm_router():
+    """各阶段当前的模型路由顺序，以及每个候选的延迟 / 错误率 / 冷却状态"""
+    return llm_router.stats()
+
+@app.get("/api/traces")
+async def list_traces(limit: int = 20):
+    """最近结束的请求 trace 摘要 (新的在前)"""
+    return {"traces": tracer.recent(limit)}
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """单条 trace 的全部 span，供 /monitor 画瀑布图"""
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return JSONResponse({"error": "trace 不存在或已被淘汰"}, status_code=404)
+    return trace
+
+@app.get("/api/usage")
+async def get_usage():
+    """今日 LLM 用量与费用：全局合计、预算和用量最高的会话"""
+    return usage_ledger.snapshot()
+
 @app.get("/api/context")
 async def get_context():
     """获取完整上下文信息"""
@@ -763,8 +1386,21 @@ async def debug_info():
         "system": {
             "python_version": sys.version,
             "platform": sys.platform,
+            "worker_id": worker_id(),
+            "state_backend": STATE_BACKEND,
             "temp_dir_exists": os.path.exists(TEMP_DIR),
-            "scene_file_exists": os.path.exists(SCENE_FILE)
+            "scene_exists": state.get_text("scene") is not None
+        },
+        "artifacts": artifact_store.stats(),
+        "inflight_requests": request_coalescer.stats(),
+        "scheduler": scheduler.stats(),
+        "usage": usage_ledger.snapshot(top=3),
+        "jobs": job_registry.stats(),
+        "llm_router": llm_router.stats(),
+        "stage_memo": stage_memo.stats(),
+        "render": {
+            "mode": RENDER_MODE,
+            "queue": get_broker().stats() if RENDER_MODE == "broker" else None
         },
         "context": context_manager.get_context_summary()
     }
@@ -775,12 +1411,49 @@ async def reset_system():
     hard_reset_system()
     return {"message": "系统已彻底重置"}
 
+class PrecomputeRequest(BaseModel):
+    prompts: Optional[List[str]] = None
+    concurrency: int = PRECOMPUTE_CONCURRENCY
+
+def check_admin_token(token):
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "管理接口未启用 (config.ADMIN_TOKEN 为空)"}, status_code=403)
+    if token != ADMIN_TOKEN:
+        return JSONResponse({"error": "口令错误"}, status_code=401)
+    return None
+
+@app.post("/api/admin/precompute")
+async def start_precompute(body: PrecomputeRequest, x_admin_token: str = Header(default="")):
+    """触发缓存预热 (后台执行，通过 GET 查询进度)"""
+    denied = check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    if precompute_runner.running:
+        return JSONResponse({"error": "已有预热任务在运行", **precompute_runner.status()}, status_code=409)
+    prompts = body.prompts or load_catalog(PRECOMPUTE_CATALOG_FILE)
+    task = asyncio.create_task(precompute_runner.run(prompts, body.concurrency))
+
+    def report_failure(t):
+        if not t.cancelled() and t.exception():
+            print(f"❌ 预热任务异常: {t.exception()}")
+
+    task.add_done_callback(report_failure)
+    return {"message": "预热已开始", "total": len(prompts), "concurrency": body.concurrency}
+
+@app.get("/api/admin/precompute")
+async def get_precompute_status(x_admin_token: str = Header(default="")):
+    """查询预热进度与每条指令的耗时"""
+    denied = check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    return precompute_runner.status()
+
 @app.get("/api/code/current")
 async def get_current_code():
     """获取当前代码"""
-    if os.path.exists(SCENE_FILE):
-        with open(SCENE_FILE, "r", encoding="utf-8") as f:
-            return {"code": f.read()}
+    code = state.get_text("scene")
+    if code is not None:
+        return {"code": code}
     return {"code": "无当前代码"}
 
 # ================= 📊 智能监控面板 =================
@@ -0,0 +1,154 @@
+# precompute.py
+"""
+MathSpace 缓存预热
+读取常见教材题目的提示词目录，在高峰前批量跑完整工作流，把结果写入缓存。
+- 有界并发 (asyncio.Semaphore)
+- 可中断续跑：已在缓存中的题目直接跳过，进度记录在状态后端 (键 "precompute")
+- 输出每一项的耗时报告
+
+用法:
+    python precompute.py catalog/textbook_prompts.txt --concurrency 2 --report report.json
+也可以通过管理接口 POST /api/admin/precompute 触发。
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+
+from config import PRECOMPUTE_CATALOG_FILE, PRECOMPUTE_CONCURRENCY
+from state_backend import state
+
+
+def load_catalog(path):
+    """读取提示词目录：.json (字符串列表或 {"prompt": ...} 列表) 或纯文本 (每行一个，# 开头为注释)"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            items = json.load(f)
+            prompts = [item["prompt"] if isinstance(item, dict) else item for item in items]
+        else:
+            prompts = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+    # 去重但保持顺序
+    return list(dict.fromkeys(p.strip() for p in prompts if p and p.strip()))
+
+
+class ResultCollector:
+    """代替 websocket 接收工作流消息，只保留最终结果"""
+
+    def __init__(self):
+        self.result = None
+
+    async def send_json(self, message):
+        if message.get("type") in ("result", "error"):
+            self.result = message
+
+
+class PrecomputeRunner:
+    """
+    批量预计算执行器
+    run_prompt(prompt, collector): 执行一次完整工作流 (由 main 注入，避免循环导入)
+    """
+
+    def __init__(self, run_prompt, get_cached_video, cache_key):
+        self.run_prompt = run_prompt
+        self.get_cached_video = get_cached_video
+        self.cache_key = cache_key
+        self.running = False
+        self.current = None
+
+    def _record(self, key, item):
+        with state.transaction("precompute", {"items": {}}) as progress:
+            progress.setdefault("items", {})[key] = item
+            progress["updated"] = time.time()
+            if self.current is not None:
+                progress["current_run"] = self.current
+
+    async def _process(self, prompt, semaphore, report):
+        key = self.cache_key(prompt)
+        cached = await asyncio.to_thread(self.get_cached_video, prompt)
+        if cached:
+            item = {"prompt": prompt, "status": "cached", "seconds": 0.0, "video": cached}
+            report.append(item)
+            self.current["done"] += 1
+            return
+
+        async with semaphore:
+            start = time.time()
+            collector = ResultCollector()
+            item = {"prompt": prompt, "status": "failed", "video": None}
+            try:
+                await self.run_prompt(prompt, collector)
+                result = collector.result or {}
+                if result.get("type") == "result" and result.get("status") == "success":
+                    item.update(status="success", video=result.get("video"))
+                else:
+                    item["error"] = result.get("details") or result.get("message") or "无结果"
+            except Exception as e:
+                item["error"] = str(e)
+            item["seconds"] = round(time.time() - start, 2)
+            item["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        report.append(item)
+        self.current["done"] += 1
+        await asyncio.to_thread(self._record, key, item)
+        icon = "✅" if item["status"] == "success" else "❌"
+        print(f"{icon} [预热] {item['seconds']:.1f}s  {prompt}")
+
+    async def run(self, prompts, concurrency=PRECOMPUTE_CONCURRENCY):
+        if self.running:
+            raise RuntimeError("已有预热任务在运行")
+        self.running = True
+        self.current = {"total": len(prompts), "done": 0, "started": time.time()}
+        report = []
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        try:
+            print(f"🔥 [预热] 开始：{len(prompts)} 条提示词，并发 {concurrency}")
+            await asyncio.gather(*(self._process(p, semaphore, report) for p in prompts))
+        finally:
+            self.running = False
+            self.current["finished"] = time.time()
+
+        summary = {
+            "total": len(prompts),
+            "success": sum(1 for r in report if r["status"] == "success"),
+            "cached": sum(1 for r in report if r["status"] == "cached"),
+            "failed": sum(1 for r in report if r["status"] == "failed"),
+            "wall_seconds": round(self.current["finished"] - self.current["started"], 2),
+            "items": report,
+        }
+        print(f"🏁 [预热] 完成：成功 {summary['success']}，已缓存 {summary['cached']}，失败 {summary['failed']}")
+        return summary
+
+    def status(self):
+        progress = state.get_json("precompute", {"items": {}})
+        return {
+            "running": self.running,
+            "current_run": self.current,
+            "items": list(progress.get("items", {}).values()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MathSpace 缓存预热")
+    parser.add_argument("catalog", nargs="?", default=PRECOMPUTE_CATALOG_FILE, help="提示词目录文件")
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--report", help="把报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    # 延迟导入：main 会创建 FastAPI 应用和 LLM 客户端
+    import main as app_main
+    from workspace import cleanup_worker_scratch
+
+    cleanup_worker_scratch()
+    prompts = load_catalog(args.catalog)
+    summary = asyncio.run(app_main.precompute_runner.run(prompts, args.concurrency))
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"📄 报告已写入 {os.path.abspath(args.report)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -176,6 +176,33 @@ PROMPT_IMPROVER = """
 只输出最终的 Python 代码块。
 """
 
+# ================= 🧪 合并质检 + 改进 =================
+PROMPT_REVIEW_IMPROVER = """
+你是一个严格的 Manim 代码质检员兼改进工程师，需要在一次回答中完成质检和修复。
+
+【质检维度】
+1. **意图匹配度**：代码是否准确实现了用户要求？修改/添加请求是否与现有场景协调？
+2. **布局与边界**：所有对象是否都在屏幕内？元素是否重叠？**文字与图形是否分层显示、互不遮挡**？
+3. **动画质量**：转场是否流畅，动画序列是否有逻辑？
+4. **代码规范**：**MathTex 中是否包含中文？** 是否导入了 math / numpy？
+
+【改进策略】
+- PASS → 只做润色，保持代码逻辑不变
+- WARN → 针对性修复上述问题 (**MathTex 中的中文改用 Text 类**，补全导入)
+- FAIL → 基于用户意图重新实现，保留初稿中合理的部分
+
+【输出格式】
+只输出一个 JSON 对象，不要输出任何其他文字：
+{
+  "rating": "PASS" | "WARN" | "FAIL",
+  "issues": ["发现的问题 1", "发现的问题 2"],
+  "code": "修复后的完整 Python 代码"
+}
+- code 是完整文件 (包含 from manim import *、import math、import numpy as np 和 class MathScene(Scene):)
+- code 是 JSON 字符串：换行写成 \\n，双引号写成 \\"
+- 没有问题时 issues 为空数组
+"""
+
 # ================= 🔄 意图分析器 =================
 PROMPT_INTENT_ANALYZER = """
 你是一个专业的意图分析专家。
@@ -241,6 +268,44 @@ PROMPT_EMERGENCY_FIXER = """
 只输出修复后的完整Python代码。
 """
 
+# ================= ✂️ 增量编辑器 (diff 协议) =================
+DIFF_OUTPUT_RULES = """
+【输出格式：unified diff】
+- 只输出一个 ```diff 代码块，内容是针对【当前代码】的 unified diff
+- 每个修改块以 `@@ -起始行,行数 +起始行,行数 @@` 开头，行号可以是近似值
+- 上下文行以一个空格开头，删除行以 `-` 开头，新增行以 `+` 开头
+- 每个修改块前后各保留 2~3 行**与当前代码完全一致**的上下文，用于定位
+- 只改需要改的地方，不要重复输出未修改的代码，不要输出任何解释
+"""
+
+PROMPT_DIFF_EDITOR = """
+你是一个 Manim 动画师，正在对已有场景做增量修改。
+
+【任务】
+用户要修改或添加已有场景中的内容。你会拿到完整的当前代码，
+请只给出实现用户要求所需的最小改动。
+
+【编码要求】
+1. 保留已有对象和动画，除非用户明确要求删除或替换
+2. 新元素要与现有布局协调，所有内容必须在屏幕内
+3. **严禁在 MathTex 中使用中文**，中文必须用 Text() 类
+4. 如果新代码用到 math / np 而文件开头没有导入，要在 diff 中补上 `import math` / `import numpy as np`
+""" + DIFF_OUTPUT_RULES
+
+PROMPT_DIFF_IMPROVER = """
+你是一个智能的 Manim 代码改进工程师，根据质检报告对代码做最小化修复。
+
+【改进策略】
+1. PASS → 不需要修改时，输出一个只包含上下文、没有 +/- 行的空 diff 也可以
+2. WARN → 针对性修复布局、文字遮挡、MathTex 中文、缺失的 import
+3. FAIL → 在 diff 中重写有问题的部分，保持与现有场景协调
+
+【关键要求】
+- **确保导入语句完整：from manim import * 以及 import math**
+- **确保所有对象都在屏幕边界内，文字与图形不相互遮挡**
+- **严禁 MathTex 包含中文**
+""" + DIFF_OUTPUT_RULES
+
 # ================= 🎯 系统提示词 =================
 SYSTEM_PROMPTS = {
     "generator": PROMPT_GENERATOR,
@@ -248,6 +313,9 @@ SYSTEM_PROMPTS = {
     "improver": PROMPT_IMPROVER,
     "intent_analyzer": PROMPT_INTENT_ANALYZER,
     "emergency_fixer": PROMPT_EMERGENCY_FIXER,
+    "diff_editor": PROMPT_DIFF_EDITOR,
+    "diff_improver": PROMPT_DIFF_IMPROVER,
+    "review_improver": PROMPT_REVIEW_IMPROVER,
     
     "code_fixer": "你是一个代码修复专家",
     
@@ -411,6 +479,64 @@ MONITOR_HTML = """
         .loading {
             animation: pulse 1.5s infinite;
         }
+        .card-wide {
+            grid-column: 1 / -1;
+        }
+        .trace-row {
+            display: flex;
+            gap: 12px;
+            align-items: center;
+            padding: 8px 12px;
+            border-radius: 8px;
+            font-size: 12px;
+            color: #334155;
+            cursor: pointer;
+        }
+        .trace-row:hover, .trace-row.active {
+            background: #eef2ff;
+        }
+        .trace-name {
+            flex: 1;
+            overflow: hidden;
+            white-space: nowrap;
+            text-overflow: ellipsis;
+        }
+        .wf-row {
+            display: flex;
+            align-items: center;
+            gap: 8px;
+            font-size: 12px;
+            height: 22px;
+        }
+        .wf-label {
+            width: 220px;
+            flex-shrink: 0;
+            color: #334155;
+            overflow: hidden;
+            white-space: nowrap;
+            text-overflow: ellipsis;
+        }
+        .wf-track {
+            flex: 1;
+            position: relative;
+            height: 12px;
+            background: #f1f5f9;
+            border-radius: 3px;
+        }
+        .wf-bar {
+            position: absolute;
+            top: 0;
+            height: 12px;
+            border-radius: 3px;
+            background: #667eea;
+        }
+        .wf-bar.error { background: #ef4444; }
+        .wf-ms {
+            width: 80px;
+            flex-shrink: 0;
+            text-align: right;
+            color: #64748b;
+        }
     </style>
 </head>
 <body>
@@ -440,10 +566,21 @@ MONITOR_HTML = """
             <div id="recent-conversations"></div>
         </div>
         
+        <div class="card">
+            <h2>💰 用量与预算</h2>
+            <div id="usage-info"></div>
+        </div>
+        
         <div class="card">
             <h2>⚙️ 系统调试</h2>
             <div id="debug-info"></div>
         </div>
+        
+        <div class="card card-wide">
+            <h2>🔎 请求追踪</h2>
+            <div id="trace-list"></div>
+            <div id="trace-waterfall" style="margin-top: 16px;"></div>
+        </div>
     </div>
     
     <div class="refresh-btn" onclick="loadAllData()">
@@ -520,11 +657,46 @@ MONITOR_HTML = """
                                     意图: ${conv.intent_analysis.intent || '未知'}
                                 </div>
                             ` : ''}
+                            ${conv.usage && conv.usage.calls ? `
+                                <div style="font-size: 11px; color: #64748b;">
+                                    用量: ${conv.usage.prompt_tokens + conv.usage.completion_tokens} tokens · ${conv.usage.currency}${conv.usage.cost.toFixed(4)}
+                                    ${conv.budget_level && conv.budget_level !== 'normal' ? '<span class="badge badge-warning" style="font-size: 10px;">节省模式</span>' : ''}
+                                </div>
+                            ` : ''}
                         </div>
                     `).join('') : '<div style="color: #94a3b8; text-align: center;">暂无交互记录</div>';
                 
                 document.getElementById('recent-conversations').innerHTML = recentHTML;
                 
+                const usageRes = await fetch('/api/usage');
+                const usage = await usageRes.json();
+                const budgetText = usage.global_budget ? ` / ${usage.currency}${usage.global_budget}` : '';
+                document.getElementById('usage-info').innerHTML = `
+                    <div class="status-item">
+                        <span class="status-label">今日调用</span>
+                        <span class="status-value">${usage.global.calls} 次</span>
+                    </div>
+                    <div class="status-item">
+                        <span class="status-label">今日 Token (输入 / 输出)</span>
+                        <span class="status-value">${usage.global.prompt_tokens} / ${usage.global.completion_tokens}</span>
+                    </div>
+                    <div class="status-item">
+                        <span class="status-label">今日费用</span>
+                        <span class="status-value">${usage.currency}${usage.global.cost.toFixed(4)}${budgetText}</span>
+                    </div>
+                    ${usage.top_sessions.length > 0 ? `
+                        <div style="margin-top: 12px; color: #666; font-size: 12px;">用量最高的会话 (共 ${usage.session_count} 个):</div>
+                        ${usage.top_sessions.slice(0, 5).map(s => `
+                            <div style="display: flex; justify-content: space-between; font-size: 12px; color: #334155; margin-top: 4px;">
+                                <span>${s.session}</span>
+                                <span>${usage.currency}${s.cost.toFixed(4)}</span>
+                            </div>
+                        `).join('')}
+                    ` : ''}
+                `;
+                
+                await loadTraces();
+                
             } catch (error) {
                 console.error('加载数据失败:', error);
             } finally {
@@ -532,6 +704,82 @@ MONITOR_HTML = """
             }
         }
         
+        // 🔎 请求追踪：列表 + 选中请求的瀑布图
+        let selectedTrace = null;
+        
+        async function loadTraces() {
+            const res = await fetch('/api/traces?limit=15');
+            const data = await res.json();
+            document.getElementById('trace-list').innerHTML = data.traces.length > 0 ?
+                data.traces.map(t => `
+                    <div class="trace-row ${t.trace_id === selectedTrace ? 'active' : ''}" onclick="showTrace('${t.trace_id}')">
+                        <span style="color: #94a3b8;">${new Date(t.start_ns / 1e6).toLocaleTimeString()}</span>
+                        <span class="trace-name">${t.attributes.prompt || t.name}</span>
+                        <span style="color: #64748b;">${t.span_count} spans</span>
+                        <span class="badge ${t.status === 'ok' ? 'badge-success' : 'badge-error'}" style="font-size: 10px;">
+                            ${(t.duration_ms || 0).toFixed(0)} ms
+                        </span>
+                    </div>
+                `).join('') : '<div style="color: #94a3b8; text-align: center;">暂无请求追踪</div>';
+            if (selectedTrace) await showTrace(selectedTrace);
+        }
+        
+        async function showTrace(traceId) {
+            selectedTrace = traceId;
+            const container = document.getElementById('trace-waterfall');
+            const res = await fetch(`/api/traces/${traceId}`);
+            if (!res.ok) {
+                selectedTrace = null;
+                container.innerHTML = '';
+                return;
+            }
+            const trace = await res.json();
+            const spans = trace.spans;
+            const start = Math.min(...spans.map(s => s.start_ns));
+            const end = Math.max(...spans.map(s => s.end_ns || s.start_ns));
+            const total = Math.max(end - start, 1);
+            
+            // 按父子关系深度优先排列，同级按开始时间
+            const ids = new Set(spans.map(s => s.span_id));
+            const children = {};
+            spans.forEach(s => {
+                const parent = s.parent_id && ids.has(s.parent_id) ? s.parent_id : 'root';
+                (children[parent] = children[parent] || []).push(s);
+            });
+            const rows = [];
+            const walk = (parent, depth) => {
+                (children[parent] || []).sort((a, b) => a.start_ns - b.start_ns).forEach(s => {
+                    rows.push([s, depth]);
+                    walk(s.span_id, depth + 1);
+                });
+            };
+            walk('root', 0);
+            
+            container.innerHTML = `
+                <div style="font-size: 12px; color: #64748b; margin-bottom: 8px;">
+                    trace ${trace.trace_id} · ${(total / 1e6).toFixed(0)} ms${trace.dropped_spans ? ` · 丢弃 ${trace.dropped_spans} 个 span` : ''}
+                </div>
+                ${rows.map(([s, depth]) => {
+                    const left = (s.start_ns - start) / total * 100;
+                    const width = ((s.end_ns || s.start_ns) - s.start_ns) / total * 100;
+                    const attrs = Object.entries(s.attributes).map(([k, v]) => `${k}=${v}`).join(' · ');
+                    const tip = (attrs + (s.error ? ` · 错误: ${s.error}` : '')).replace(/"/g, '&quot;');
+                    return `
+                        <div class="wf-row" title="${tip}">
+                            <div class="wf-label" style="padding-left: ${depth * 14}px;">${s.name}</div>
+                            <div class="wf-track">
+                                <div class="wf-bar ${s.status}" style="left: ${left}%; width: ${Math.max(width, 0.3)}%;"></div>
+                            </div>
+                            <div class="wf-ms">${s.duration_ms ?? '-'} ms</div>
+                        </div>
+                    `;
+                }).join('')}
+            `;
+            document.querySelectorAll('.trace-row').forEach(row => {
+                row.classList.toggle('active', row.getAttribute('onclick').includes(traceId));
+            });
+        }
+        
         loadAllData();
         setInterval(loadAllData, 5000);
     </script>
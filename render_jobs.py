@@ -0,0 +1,619 @@
+# render_jobs.py
+"""
+MathSpace 渲染任务协议
+把"写入场景 → 运行 Manim → 收集视频和侦探报告"封装成一个可序列化的渲染任务：
+- inline 模式：API 进程在线程池中直接执行 (默认，单机部署)
+- broker 模式：任务写入 SQLite 队列，由独立的 render_worker.py 进程 (可在其他机器上) 领取执行，
+  进度事件和结果写回队列，API 侧轮询并转发给客户端
+- 长场景按动画切分成多段，在多个 Manim 进程中并行渲染后无损拼接 (两种模式都适用)
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    MANIM_TIMEOUT, DEFAULT_QUALITY,
+    RENDER_MODE, RENDER_BROKER_PATH,
+    RENDER_POLL_INTERVAL, RENDER_JOB_TIMEOUT,
+    RENDER_HEARTBEAT_TIMEOUT, RENDER_MAX_ATTEMPTS,
+    RENDER_SECTION_WORKERS, RENDER_SECTION_MIN_SECONDS, FFMPEG_BIN
+)
+from workspace import worker_scratch_dir
+from render_limits import run_limited
+from code_analysis import code_analyzer
+from video_packaging import run_ffmpeg
+
+
+def new_render_job(request_id, code, scene_name, output_filename, quality=DEFAULT_QUALITY):
+    """构造渲染任务 (纯 JSON，可跨进程/跨机器传递)"""
+    return {
+        "job_id": uuid.uuid4().hex[:12],
+        "request_id": request_id,
+        "code": code,
+        "scene_name": scene_name,
+        "output_filename": output_filename,
+        "quality": quality,
+    }
+
+
+def build_inspector_code(inspector_class_name, scene_name, dump_file):
+    """
+    🔥【关键】注入 Inspector 代码 (侦探) 🔥
+    这是一个继承自用户 Scene 的子类，专门用于在 tear_down 时窃取对象列表
+    """
+    return f"""
+import json
+class {inspector_class_name}({scene_name}):
+    def tear_down(self):
+        try:
+            detected_objects = []
+            # 1. 扫描属性 (self.xxx)
+            for name, value in self.__dict__.items():
+                if isinstance(value, Mobject):
+                    detected_objects.append(name)
+            # 2. 扫描屏幕上的对象 (self.mobjects)
+            for mobj in self.mobjects:
+                name = mobj.__class__.__name__
+                if name not in detected_objects:
+                    detected_objects.append(name)
+
+            # 将检测到的对象写入临时文件
+            with open(r"{dump_file}", "w", encoding="utf-8") as f:
+                json.dump(list(set(detected_objects)), f, ensure_ascii=False)
+        except Exception as e:
+            print(f"Inspector Error: {{e}}")
+        finally:
+            super().tear_down()
+"""
+
+
+def run_manim_safe(cmd, cancel=None):
+    """在资源受限的独立进程组中运行 Manim，返回 (returncode, stdout, stderr, 资源用量)"""
+    try:
+        result = run_limited(cmd, MANIM_TIMEOUT, cancel=cancel)
+        return result["returncode"], result["stdout"], result["stderr"], result["usage"]
+    except Exception as e:
+        return -1, "", str(e), None
+
+
+def find_video_file(search_dir, filename_prefix):
+    """查找视频文件"""
+    for root, dirs, files in os.walk(search_dir):
+        for file in files:
+            if file.endswith(".mp4") and filename_prefix in file:
+                return os.path.join(root, file)
+    return None
+
+
+def execute_render_job(job, output_dir, emit=None, cancel=None):
+    """
+    执行一个渲染任务，返回结果 dict：
+    {"returncode", "stderr", "video_path" (位于 output_dir), "objects" (侦探报告，失败为 None),
+     "usage" (CPU 秒数 / 峰值内存等资源用量)}
+    cancel: threading.Event，被设置后终止正在运行的 Manim 进程
+    """
+    emit = emit or (lambda message: None)
+    job_dir = os.path.join(worker_scratch_dir(), f"job_{job['job_id']}")
+    os.makedirs(job_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    scene_file = os.path.join(job_dir, "current_scene.py")
+    dump_file = os.path.join(job_dir, "objects_dump.json").replace("\\", "/")
+    inspector_class_name = f"Inspector_{job['job_id']}"
+
+    result = {"returncode": -1, "stderr": "", "video_path": None, "objects": None, "usage": None}
+    try:
+        # 长场景：分段并行渲染 (不适用时返回 None，继续整段渲染)
+        sectioned = execute_sectioned_render(job, job_dir, output_dir, emit, cancel)
+        if sectioned is not None:
+            return sectioned
+
+        # 写入带侦探的代码 (源代码 + 侦探代码)
+        with open(scene_file, "w", encoding="utf-8") as f:
+            f.write(job["code"] + "\n" + build_inspector_code(inspector_class_name, job["scene_name"], dump_file))
+
+        # 运行 Manim (运行的是 Inspector 类，而不是原类)
+        cmd = [
+            sys.executable, "-m", "manim",
+            job["quality"],
+            "--media_dir", job_dir,
+            "-o", job["output_filename"],
+            scene_file,
+            inspector_class_name  # <--- 运行侦探
+        ]
+        emit("正在运行 Manim...")
+        returncode, stdout, stderr, usage = run_manim_safe(cmd, cancel)
+        result["returncode"] = returncode
+        result["usage"] = usage
+        result["stderr"] = stderr[-2000:] if stderr else ""
+
+        if returncode == 0 and not (cancel is not None and cancel.is_set()):
+            video_path = find_video_file(job_dir, job["output_filename"])
+            if video_path:
+                target_path = os.path.join(output_dir, f"{job['job_id']}.mp4")
+                shutil.move(video_path, target_path)
+                result["video_path"] = target_path
+            # 🔥 读取侦探的报告 (100% 准确的运行时数据)
+            try:
+                if os.path.exists(dump_file):
+                    with open(dump_file, "r", encoding="utf-8") as f:
+                        result["objects"] = json.load(f)
+            except Exception:
+                pass
+    finally:
+        # 任务结束，清理临时目录
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return result
+
+
+# ================= 🎞️ 分段并行渲染 =================
+# 0. 静态估算：按源码里 play 的 run_time (缺省 1 秒) 估算总时长，不足两段的场景直接整段渲染，不做探测
+# 1. 探测：跳过全部动画 (-n 一个极大值) 快速执行一遍 construct，记录每次 play/wait 的时长，
+#    同时把 LaTeX / 文字缓存预热到共享的 media 目录 (与整段渲染同一个目录，回退整段渲染时缓存仍可用)；
+#    探测本身报错说明场景代码有问题，直接返回失败，不再整段重跑一遍
+# 2. 按时长把动画序号切成若干连续区间，每段一个 Manim 进程 (-n 起,止)：
+#    区间之前的动画被快进 (不生成画面)，得到与串行渲染相同的起始状态
+# 3. ffmpeg concat 流复制拼接 (同一配置输出的分段编码参数一致，无需重新编码)
+SECTION_PROBE_START = 10 ** 9
+DEFAULT_PLAY_SECONDS = 1.0   # Manim 的 play 默认 run_time
+
+
+def estimate_duration(code):
+    """按源码静态估算动画总时长 (循环里的 play 只算一次，偏保守)"""
+    plays = code_analyzer.analyze(code).get("plays") or []
+    total = 0.0
+    for play in plays:
+        run_time = play.get("run_time", DEFAULT_PLAY_SECONDS)
+        total += run_time if isinstance(run_time, (int, float)) else DEFAULT_PLAY_SECONDS
+    return total
+
+
+def build_section_code(base_class_name, section_class_name, durations_file=None):
+    """
+    分段场景类：固定随机种子，保证各进程快进得到的状态一致；
+    durations_file 不为空时 (探测) 记录每次 play 的时长
+    """
+    code = f"""
+import random as _section_random
+import numpy as _section_np
+class {section_class_name}({base_class_name}):
+    def setup(self):
+        _section_random.seed(0)
+        _section_np.random.seed(0)
+        self._section_durations = []
+        super().setup()
+"""
+    if durations_file:
+        code += f"""
+    def play(self, *args, **kwargs):
+        super().play(*args, **kwargs)
+        self._section_durations.append(float(getattr(self, "duration", 0) or 0))
+
+    def tear_down(self):
+        try:
+            with open(r"{durations_file}", "w", encoding="utf-8") as f:
+                json.dump(self._section_durations, f)
+        finally:
+            super().tear_down()
+"""
+    return code
+
+
+def plan_sections(durations, workers=None, min_seconds=None):
+    """
+    按动画时长切成连续区间 [(起, 止)]，最后一段的止为 None (渲染到结尾)；
+    每段至少 min_seconds 秒动画，不值得切分时返回 None
+    """
+    workers = workers or RENDER_SECTION_WORKERS
+    min_seconds = min_seconds or RENDER_SECTION_MIN_SECONDS
+    total = sum(durations)
+    count = min(workers, len(durations), int(total // max(min_seconds, 1e-9)))
+    if count < 2:
+        return None
+    sections, start, elapsed = [], 0, 0.0
+    for index, duration in enumerate(durations[:-1]):
+        elapsed += duration
+        if len(sections) < count - 1 and elapsed >= total * (len(sections) + 1) / count:
+            sections.append((start, index))
+            start = index + 1
+    sections.append((start, None))
+    return sections if len(sections) > 1 else None
+
+
+def merge_usage(usages, wall_seconds):
+    """汇总各分段进程的资源用量：CPU 秒数相加，内存取单进程峰值"""
+    usages = [u for u in usages if u]
+    if not usages:
+        return None
+    merged = dict(usages[0])
+    merged["cpu_seconds"] = round(sum(u.get("cpu_seconds") or 0 for u in usages), 2)
+    peaks = [u["peak_rss_mb"] for u in usages if u.get("peak_rss_mb") is not None]
+    merged["peak_rss_mb"] = max(peaks) if peaks else None
+    merged["wall_seconds"] = round(wall_seconds, 2)
+    merged["killed"] = next((u["killed"] for u in usages if u.get("killed")), None)
+    merged["sections"] = len(usages) - 1  # 不含探测进程
+    return merged
+
+
+def execute_sectioned_render(job, job_dir, output_dir, emit, cancel=None):
+    """
+    分段并行渲染；场景太短或分段本身出问题 (探测不到时长、缺少分段视频、拼接失败) 时返回 None，由调用方整段渲染。
+    场景代码报错 (探测或某一段 Manim 返回非零) 时直接返回失败结果，不再整段重跑
+    """
+    if RENDER_SECTION_WORKERS < 2 or not shutil.which(FFMPEG_BIN):
+        return None
+    if estimate_duration(job["code"]) < 2 * RENDER_SECTION_MIN_SECONDS:
+        return None
+
+    start = time.time()
+    media_dir = job_dir
+
+    def failed(stderr, usages):
+        return {"returncode": -1 if cancel is not None and cancel.is_set() else 1,
+                "stderr": (stderr or "")[-2000:], "video_path": None, "objects": None,
+                "usage": merge_usage(usages, time.time() - start)}
+    inspector_class_name = f"Inspector_{job['job_id']}"
+    section_class_name = f"Section_{job['job_id']}"
+
+    def write_scene(name, dump_file, durations_file=None):
+        scene_file = os.path.join(job_dir, f"{name}.py")
+        with open(scene_file, "w", encoding="utf-8") as f:
+            f.write(job["code"] + "\n"
+                    + build_inspector_code(inspector_class_name, job["scene_name"], dump_file)
+                    + build_section_code(inspector_class_name, section_class_name, durations_file))
+        return scene_file
+
+    def manim_cmd(scene_file, animations, output_name):
+        return [
+            sys.executable, "-m", "manim",
+            job["quality"],
+            "--media_dir", media_dir,
+            "-n", animations,
+            "-o", output_name,
+            scene_file,
+            section_class_name
+        ]
+
+    # 1. 探测动画时长
+    emit("正在分析动画时长...")
+    durations_file = os.path.join(job_dir, "durations.json").replace("\\", "/")
+    probe_file = write_scene("probe", os.path.join(job_dir, "probe_objects.json").replace("\\", "/"), durations_file)
+    returncode, _, stderr, probe_usage = run_manim_safe(
+        manim_cmd(probe_file, str(SECTION_PROBE_START), "probe"), cancel
+    )
+    if cancel is not None and cancel.is_set():
+        return failed("渲染已取消", [probe_usage])
+    if returncode != 0:
+        return failed(stderr, [probe_usage])
+    try:
+        with open(durations_file, "r", encoding="utf-8") as f:
+            durations = json.load(f)
+    except (OSError, ValueError):
+        return None
+    sections = plan_sections(durations)
+    if not sections:
+        return None
+
+    # 2. 各分段并行渲染
+    emit(f"分段并行渲染：共 {len(durations)} 个动画 / {sum(durations):.0f} 秒，切成 {len(sections)} 段")
+    dump_file = os.path.join(job_dir, "objects_dump.json").replace("\\", "/")
+    commands = []
+    for index, (first, last) in enumerate(sections):
+        name = f"part_{index:03d}"
+        # 只有最后一段会执行到 construct 结尾，侦探报告以它为准
+        scene_file = write_scene(name, dump_file if last is None else os.path.join(job_dir, f"{name}.json"))
+        animations = f"{first},{last}" if last is not None else str(first)
+        commands.append((name, manim_cmd(scene_file, animations, name)))
+    with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+        outcomes = list(pool.map(lambda item: run_manim_safe(item[1], cancel), commands))
+    usages = [probe_usage] + [outcome[3] for outcome in outcomes]
+    if cancel is not None and cancel.is_set():
+        return failed("渲染已取消", usages)
+
+    part_files = []
+    for (name, _), (returncode, _, stderr, _) in zip(commands, outcomes):
+        if returncode != 0:
+            print(f"⚠️ [分段渲染] {name} 报错: {(stderr or '')[-200:]}")
+            return failed(stderr, usages)
+        part_path = find_video_file(media_dir, name)
+        if not part_path:
+            print(f"⚠️ [分段渲染] 找不到 {name} 的视频，改为整段渲染")
+            return None
+        part_files.append(part_path)
+
+    # 3. 无损拼接
+    emit("正在拼接分段视频...")
+    list_file = os.path.join(job_dir, "parts.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for part_path in part_files:
+            f.write(f"file '{os.path.abspath(part_path)}'\n")
+    target_path = os.path.join(output_dir, f"{job['job_id']}.mp4")
+    returncode, stderr = run_ffmpeg([
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-f", "concat", "-safe", "0",
+        "-i", list_file,
+        "-c", "copy",
+        target_path
+    ])
+    if returncode != 0 or not os.path.exists(target_path):
+        print(f"⚠️ [分段渲染] 拼接失败，改为整段渲染: {stderr[-200:]}")
+        return None
+
+    objects = None
+    try:
+        if os.path.exists(dump_file):
+            with open(dump_file, "r", encoding="utf-8") as f:
+                objects = json.load(f)
+    except Exception:
+        pass
+    usage = merge_usage(usages, time.time() - start)
+    print(f"🎞️ [分段渲染] {job['job_id']}: {len(sections)} 段，耗时 {time.time() - start:.1f}s")
+    return {"returncode": 0, "stderr": "", "video_path": target_path, "objects": objects, "usage": usage}
+
+
+# ================= 🧪 空跑校验 =================
+def execute_dry_run(job, cancel=None):
+    """
+    跳过全部动画执行一遍 construct (-n 一个极大值，不生成画面)，用于在正式渲染前廉价地发现运行时错误
+    (NameError、LaTeX 编译失败、错误的参数……)；返回 {"returncode", "stderr", "usage"}
+    """
+    job_dir = os.path.join(worker_scratch_dir(), f"dry_{job['job_id']}")
+    os.makedirs(job_dir, exist_ok=True)
+    try:
+        scene_file = os.path.join(job_dir, "dry_run_scene.py")
+        with open(scene_file, "w", encoding="utf-8") as f:
+            f.write(job["code"])
+        cmd = [
+            sys.executable, "-m", "manim",
+            job["quality"],
+            "--media_dir", job_dir,
+            "-n", str(SECTION_PROBE_START),
+            scene_file,
+            job["scene_name"]
+        ]
+        returncode, _, stderr, usage = run_manim_safe(cmd, cancel)
+        return {"returncode": returncode, "stderr": stderr[-2000:] if stderr else "", "usage": usage}
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+async def run_dry_run(job):
+    """在线程池中空跑；协程被取消时终止 Manim 进程"""
+    cancel = threading.Event()
+    try:
+        return await asyncio.to_thread(execute_dry_run, job, cancel)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+# ================= 📮 任务队列 (SQLite) =================
+class SQLiteRenderBroker:
+    """
+    基于 SQLite 的渲染任务队列，API 与 worker 共享同一个数据库文件即可协作
+    (多机部署时把数据库和 RENDER_OUTPUT_DIR 放在共享卷上)。
+    """
+
+    def __init__(self, path=RENDER_BROKER_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    started REAL,
+                    heartbeat REAL,
+                    finished REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created);
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    message TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_job ON events (job_id, seq);
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def submit(self, job):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created) VALUES (?, 'queued', ?, ?)",
+                (job["job_id"], json.dumps(job, ensure_ascii=False), time.time())
+            )
+        finally:
+            conn.close()
+        return job["job_id"]
+
+    def claim(self, worker):
+        """原子地领取最早的排队任务，没有任务时返回 None"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # 心跳超时的任务视为 worker 已崩溃，重新排队 (超过最大次数则判失败)
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "result = CASE WHEN attempts >= ? THEN ? ELSE result END "
+                "WHERE status = 'running' AND heartbeat < ?",
+                (RENDER_MAX_ATTEMPTS, RENDER_MAX_ATTEMPTS,
+                 json.dumps({"returncode": -1, "stderr": "渲染 worker 失联", "video_path": None, "objects": None}),
+                 now - RENDER_HEARTBEAT_TIMEOUT)
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if not row:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                "started = ?, heartbeat = ? WHERE id = ?",
+                (worker, now, now, row[0])
+            )
+            conn.execute("COMMIT")
+            return json.loads(row[1])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id):
+        """刷新心跳；任务已被 API 侧取消或清除时返回 False"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (time.time(), job_id)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def add_event(self, job_id, message):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO events (job_id, created, message) VALUES (?, ?, ?)",
+                (job_id, time.time(), message)
+            )
+        finally:
+            conn.close()
+
+    def complete(self, job_id, result):
+        """写回结果；任务已被 API 侧清除 (请求取消或等待超时) 时返回 False"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def poll(self, job_id, after_seq=0):
+        """返回 (状态, 结果, 新事件列表 [(seq, message)])"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT status, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            events = conn.execute(
+                "SELECT seq, message FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not row:
+            return "missing", None, events
+        return row[0], json.loads(row[1]) if row[1] else None, events
+
+    def cancel(self, job_id):
+        """取消尚未被领取的任务"""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = 'cancelled' WHERE id = ? AND status = 'queued'", (job_id,))
+        finally:
+            conn.close()
+
+    def purge(self, job_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        finally:
+            conn.close()
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = SQLiteRenderBroker()
+    return _broker
+
+
+# ================= 🎬 API 侧入口 =================
+async def run_render_job(job, on_event=None, output_dir=None, on_abandoned=None):
+    """
+    执行渲染任务并等待结果 (inline / broker 两种模式对调用方透明)
+    on_event: async callable(message)，用于把 worker 的进度转发给客户端
+    output_dir: inline 模式的视频输出目录 (默认 worker 临时目录)
+    协程被取消时终止渲染：inline 模式直接结束 Manim 进程组；broker 模式清除任务，worker 在下次心跳时发现并终止，
+    已经渲染完的视频在写回结果时发现任务被清除，由 worker 删除。
+    inline 模式下渲染线程被取消后仍会收尾，结束时把结果交给 on_abandoned(result) (补记用量、清理输出)
+    """
+    if RENDER_MODE != "broker":
+        cancel = threading.Event()
+        thread = asyncio.ensure_future(
+            asyncio.to_thread(execute_render_job, job, output_dir or worker_scratch_dir(), None, cancel)
+        )
+        try:
+            return await asyncio.shield(thread)
+        except asyncio.CancelledError:
+            cancel.set()
+            if on_abandoned is not None:
+                thread.add_done_callback(
+                    lambda done: done.cancelled() or done.exception() is not None or on_abandoned(done.result())
+                )
+            raise
+
+    broker = get_broker()
+    await asyncio.to_thread(broker.submit, job)
+    deadline = time.time() + RENDER_JOB_TIMEOUT
+    last_seq = 0
+    try:
+        while True:
+            status, result, events = await asyncio.to_thread(broker.poll, job["job_id"], last_seq)
+            for seq, message in events:
+                last_seq = seq
+                if on_event:
+                    await on_event(message)
+            if status in ("done", "failed"):
+                return result
+            if status in ("missing", "cancelled"):
+                return {"returncode": -1, "stderr": "渲染任务丢失", "video_path": None, "objects": None}
+            if time.time() > deadline:
+                await asyncio.to_thread(broker.cancel, job["job_id"])
+                return {"returncode": -1, "stderr": "渲染排队超时", "video_path": None, "objects": None}
+            await asyncio.sleep(RENDER_POLL_INTERVAL)
+    finally:
+        await asyncio.to_thread(broker.purge, job["job_id"])
+
+
+def render_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -0,0 +1,284 @@
+# render_limits.py
+"""
+MathSpace 渲染资源管控
+LLM 生成的场景代码可能失控 (超高分辨率曲面、死循环 updater)，这里给每个渲染进程加上：
+- 独立进程组：超时或结束后整组终止，ffmpeg / latex 等子进程不会成为孤儿
+- 资源上限：优先使用 cgroups v2 (RENDER_CGROUP_ROOT 存在且可写时)，
+  否则用 prlimit 设置 RLIMIT_AS / RLIMIT_CPU
+- 降低优先级：nice + ionice (best-effort 最低档)，渲染不会饿死 API 进程
+- 资源记账：CPU 秒数、峰值内存、墙钟时间
+以上依赖 POSIX (resource / wait4 / 进程组)；Windows 上退化为普通子进程 + 超时，不设资源上限、只记墙钟时间。
+"""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import signal
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows 没有 rlimit / wait4 / 进程组，退化为普通子进程 + 超时
+    resource = None
+
+from config import (
+    RENDER_MEMORY_LIMIT_MB, RENDER_CPU_LIMIT_SECONDS, RENDER_CPU_QUOTA,
+    RENDER_PIDS_LIMIT, RENDER_NICE, RENDER_IONICE_LEVEL,
+    RENDER_CGROUP_ROOT, RENDER_KILL_GRACE
+)
+
+WAIT_POLL_INTERVAL = 0.1
+
+
+# ================= 🧱 cgroups v2 =================
+def cgroup_available():
+    """RENDER_CGROUP_ROOT 是 cgroup v2 目录且本进程可以在其中创建子组"""
+    return (
+        bool(RENDER_CGROUP_ROOT)
+        and os.path.exists(os.path.join(RENDER_CGROUP_ROOT, "cgroup.controllers"))
+        and os.access(RENDER_CGROUP_ROOT, os.W_OK)
+    )
+
+
+class JobCgroup:
+    """单个渲染任务的 cgroup：内存 / CPU 配额 / 进程数上限，以及整组记账和整组终止"""
+
+    def __init__(self, name):
+        self.path = os.path.join(RENDER_CGROUP_ROOT, name)
+
+    def _write(self, filename, value):
+        with open(os.path.join(self.path, filename), "w") as f:
+            f.write(str(value))
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self.path, filename)) as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def create(self):
+        os.makedirs(self.path, exist_ok=True)
+        if RENDER_MEMORY_LIMIT_MB:
+            self._write("memory.max", RENDER_MEMORY_LIMIT_MB * 1024 * 1024)
+            self._write("memory.swap.max", 0)
+        if RENDER_CPU_QUOTA:
+            period = 100000
+            self._write("cpu.max", f"{int(RENDER_CPU_QUOTA * period)} {period}")
+        if RENDER_PIDS_LIMIT:
+            self._write("pids.max", RENDER_PIDS_LIMIT)
+
+    def attach(self, pid):
+        """把进程移入该 cgroup，它之后派生的子进程自动继承"""
+        self._write("cgroup.procs", pid)
+
+    def usage(self):
+        stats = dict(line.split() for line in self._read("cpu.stat").splitlines() if line.strip())
+        events = dict(line.split() for line in self._read("memory.events").splitlines() if line.strip())
+        peak = self._read("memory.peak").strip()
+        return {
+            "cpu_seconds": int(stats.get("usage_usec", 0)) / 1e6,
+            "peak_rss_mb": int(peak) / 1024 / 1024 if peak.isdigit() else None,
+            "oom_killed": int(events.get("oom_kill", 0)) > 0,
+        }
+
+    def destroy(self):
+        """杀掉组内残留进程并删除 cgroup"""
+        try:
+            if os.path.exists(os.path.join(self.path, "cgroup.kill")):
+                self._write("cgroup.kill", 1)
+            else:
+                for pid in self._read("cgroup.procs").split():
+                    try:
+                        os.kill(int(pid), signal.SIGKILL)
+                    except (ProcessLookupError, ValueError):
+                        pass
+            deadline = time.time() + RENDER_KILL_GRACE
+            while self._read("cgroup.procs").strip() and time.time() < deadline:
+                time.sleep(WAIT_POLL_INTERVAL)
+            os.rmdir(self.path)
+        except OSError as e:
+            print(f"⚠️ [资源] 清理 cgroup 失败 {self.path}: {e}")
+
+
+# ================= 🚦 受限进程 =================
+def _apply_limits(pid, cgroup):
+    """
+    在父进程中给刚启动的渲染进程加限制 (prlimit / setpriority / 写 cgroup.procs)。
+    不使用 preexec_fn：渲染在线程池中并发执行，fork 后运行 Python 代码不安全。
+    子进程此时还在启动解释器，之后派生的 ffmpeg / latex 都会继承这些限制。
+    """
+    if cgroup is not None:
+        cgroup.attach(pid)
+    else:
+        if RENDER_MEMORY_LIMIT_MB:
+            limit = RENDER_MEMORY_LIMIT_MB * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if RENDER_CPU_LIMIT_SECONDS:
+            # 软限制触发 SIGXCPU，硬限制留 5 秒余量后强杀
+            resource.prlimit(pid, resource.RLIMIT_CPU, (RENDER_CPU_LIMIT_SECONDS, RENDER_CPU_LIMIT_SECONDS + 5))
+    if RENDER_NICE:
+        os.setpriority(os.PRIO_PROCESS, pid, RENDER_NICE)
+
+
+def _with_ionice(cmd):
+    if RENDER_IONICE_LEVEL is None or sys.platform != "linux" or not shutil.which("ionice"):
+        return cmd
+    return ["ionice", "-c", "2", "-n", str(RENDER_IONICE_LEVEL)] + list(cmd)
+
+
+def _kill_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _drain(stream, chunks):
+    for chunk in iter(lambda: stream.read(8192), ""):
+        chunks.append(chunk)
+
+
+def _run_plain(cmd, timeout, cwd=None, cancel=None):
+    """没有 resource 模块时 (Windows)：普通子进程 + 超时 / 取消，不设资源上限"""
+    start = time.time()
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="ignore"
+    )
+    killed = None
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=WAIT_POLL_INTERVAL)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel is not None and cancel.is_set():
+                killed = "cancelled"
+            elif time.time() - start > timeout:
+                killed = "timeout"
+            if killed:
+                proc.kill()
+                stdout, stderr = proc.communicate()
+                break
+    if killed == "timeout":
+        stderr += f"\n渲染超时 ({timeout}s)，已终止渲染进程"
+    elif killed == "cancelled":
+        stderr += "\n渲染已取消"
+    usage = {"cpu_seconds": None, "peak_rss_mb": None, "wall_seconds": round(time.time() - start, 2),
+             "limiter": None, "killed": killed}
+    return {"returncode": proc.returncode, "stdout": stdout, "stderr": stderr, "usage": usage}
+
+
+def run_limited(cmd, timeout, cwd=None, cancel=None):
+    """
+    在资源受限的独立进程组中运行命令，返回 dict：
+    {"returncode", "stdout", "stderr", "usage": {"cpu_seconds", "peak_rss_mb", "wall_seconds", "limiter", "killed"}}
+    killed 为 None / "timeout" / "cancelled" / "cpu" / "memory"
+    cancel: threading.Event，被设置后终止整个进程组 (例如并行修复中落败的候选)
+    """
+    if resource is None:
+        return _run_plain(cmd, timeout, cwd, cancel)
+
+    cgroup = None
+    if cgroup_available():
+        cgroup = JobCgroup(f"job_{os.getpid()}_{uuid.uuid4().hex[:8]}")
+        try:
+            cgroup.create()
+        except OSError as e:
+            print(f"⚠️ [资源] 创建 cgroup 失败，改用 rlimit: {e}")
+            cgroup = None
+
+    start = time.time()
+    proc = subprocess.Popen(
+        _with_ionice(cmd),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="ignore",
+        start_new_session=True,  # 独立进程组 (pgid == pid)
+    )
+    try:
+        _apply_limits(proc.pid, cgroup)
+    except OSError as e:
+        print(f"⚠️ [资源] 设置渲染进程限制失败: {e}")
+        if cgroup is not None:
+            cgroup.destroy()
+            cgroup = None
+    stdout_chunks, stderr_chunks = [], []
+    readers = [
+        threading.Thread(target=_drain, args=(proc.stdout, stdout_chunks), daemon=True),
+        threading.Thread(target=_drain, args=(proc.stderr, stderr_chunks), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    # 用 wait4 回收，拿到该进程 (含其已回收子进程) 的 rusage；多个渲染线程并发时互不干扰
+    killed = None
+    deadline = start + timeout
+    rusage = None
+    status = None
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if killed is None and cancel is not None and cancel.is_set():
+            killed = "cancelled"
+            _kill_group(proc.pid, signal.SIGTERM)
+            deadline = time.time() + RENDER_KILL_GRACE
+        elif killed is None and time.time() > deadline:
+            killed = "timeout"
+            _kill_group(proc.pid, signal.SIGTERM)
+            deadline = time.time() + RENDER_KILL_GRACE
+        elif killed in ("timeout", "cancelled") and time.time() > deadline:
+            _kill_group(proc.pid, signal.SIGKILL)
+            deadline = float("inf")
+        time.sleep(WAIT_POLL_INTERVAL)
+
+    returncode = os.waitstatus_to_exitcode(status)
+    proc.returncode = returncode
+    # 主进程已退出，清掉组内残留的 ffmpeg / latex
+    _kill_group(proc.pid, signal.SIGKILL)
+    for reader in readers:
+        reader.join(timeout=RENDER_KILL_GRACE)
+    proc.stdout.close()
+    proc.stderr.close()
+    wall = time.time() - start
+
+    usage = {
+        "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 2),
+        "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),  # Linux 上 ru_maxrss 单位为 KB
+        "wall_seconds": round(wall, 2),
+        "limiter": "cgroup" if cgroup else "rlimit",
+        "killed": killed,
+    }
+    if cgroup is not None:
+        group_usage = cgroup.usage()
+        usage["cpu_seconds"] = round(group_usage["cpu_seconds"], 2)
+        if group_usage["peak_rss_mb"] is not None:
+            usage["peak_rss_mb"] = round(group_usage["peak_rss_mb"], 1)
+        if group_usage["oom_killed"] and not killed:
+            usage["killed"] = "memory"
+        cgroup.destroy()
+    if usage["killed"] is None and returncode in (-signal.SIGXCPU, -signal.SIGKILL) and RENDER_CPU_LIMIT_SECONDS \
+            and usage["cpu_seconds"] >= RENDER_CPU_LIMIT_SECONDS:
+        usage["killed"] = "cpu"
+
+    # 说明追加在末尾：调用方只保留 stderr 尾部交给修复器
+    stderr = "".join(stderr_chunks)
+    if usage["killed"] is None and returncode != 0 and "MemoryError" in stderr:
+        usage["killed"] = "memory"
+    if usage["killed"] == "timeout":
+        stderr += f"\n渲染超时 ({timeout}s)，已终止整个进程组"
+    elif usage["killed"] == "cancelled":
+        stderr += "\n渲染已取消"
+    elif usage["killed"] == "cpu":
+        stderr += f"\n渲染超出 CPU 时间限制 ({RENDER_CPU_LIMIT_SECONDS}s)，请降低场景复杂度"
+    elif usage["killed"] == "memory":
+        stderr += f"\n渲染超出内存限制 ({RENDER_MEMORY_LIMIT_MB}MB)，请降低分辨率或对象数量"
+
+    return {"returncode": returncode, "stdout": "".join(stdout_chunks), "stderr": stderr, "usage": usage}
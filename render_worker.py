@@ -0,0 +1,117 @@
+# render_worker.py
+"""
+MathSpace 独立渲染 worker
+从渲染队列领取任务并执行，结果写回队列。可以在任意多台机器上启动，
+只要它们能访问同一个 RENDER_BROKER_PATH 和 RENDER_OUTPUT_DIR (共享卷)。
+
+用法:
+    python render_worker.py --concurrency 2
+(API 侧需在 config.py 中设置 RENDER_MODE = "broker")
+"""
+
+import os
+import time
+import argparse
+import threading
+
+from config import RENDER_OUTPUT_DIR, RENDER_POLL_INTERVAL, RENDER_HEARTBEAT_TIMEOUT, STARTUP_BACKGROUND_CLEANUP
+from workspace import cleanup_worker_scratch
+from render_jobs import get_broker, execute_render_job, render_worker_name
+
+
+def discard_output(worker, job_id, result):
+    video_path = result.get("video_path")
+    if not video_path:
+        return
+    try:
+        os.remove(video_path)
+        print(f"🧹 [{worker}] 任务 {job_id} 已被放弃，删除输出 {os.path.basename(video_path)}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️ [{worker}] 删除被放弃任务的输出失败: {e}")
+
+
+def process_one(broker, worker):
+    """领取并执行一个任务，队列为空时返回 False"""
+    job = broker.claim(worker)
+    if not job:
+        return False
+
+    job_id = job["job_id"]
+    print(f"🎬 [{worker}] 领取任务 {job_id} (请求 {job.get('request_id')})")
+    broker.add_event(job_id, f"渲染节点 {worker} 已开始处理")
+
+    # 心跳：让 API / 其他 worker 知道任务仍在执行；任务已被 API 侧取消时终止渲染
+    stop = threading.Event()
+    cancel = threading.Event()
+
+    def beat():
+        while not stop.wait(RENDER_HEARTBEAT_TIMEOUT / 3):
+            try:
+                if not broker.heartbeat(job_id):
+                    print(f"🛑 [{worker}] 任务 {job_id} 已被取消，终止渲染")
+                    cancel.set()
+                    return
+            except Exception as e:
+                print(f"⚠️ [{worker}] 心跳失败: {e}")
+
+    heartbeat_thread = threading.Thread(target=beat, daemon=True)
+    heartbeat_thread.start()
+    start = time.time()
+    try:
+        result = execute_render_job(job, RENDER_OUTPUT_DIR, emit=lambda message: broker.add_event(job_id, message),
+                                    cancel=cancel)
+    except Exception as e:
+        result = {"returncode": -1, "stderr": f"渲染 worker 异常: {e}", "video_path": None, "objects": None}
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+
+    if not broker.complete(job_id, result):
+        # API 侧已经放弃这个任务，没有人会来取视频：删掉输出，免得在共享卷上越积越多
+        discard_output(worker, job_id, result)
+    status = "✅" if result.get("video_path") else "❌"
+    print(f"{status} [{worker}] 任务 {job_id} 完成，用时 {time.time() - start:.1f}s")
+    return True
+
+
+def worker_loop(worker, once=False):
+    broker = get_broker()
+    while True:
+        try:
+            processed = process_one(broker, worker)
+        except Exception as e:
+            print(f"⚠️ [{worker}] 队列访问失败: {e}")
+            processed = False
+        if once and not processed:
+            return
+        if not processed:
+            time.sleep(RENDER_POLL_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MathSpace 渲染 worker")
+    parser.add_argument("--concurrency", type=int, default=1, help="本进程同时执行的渲染任务数")
+    parser.add_argument("--once", action="store_true", help="处理完当前队列后退出")
+    args = parser.parse_args()
+
+    cleanup_worker_scratch(background=STARTUP_BACKGROUND_CLEANUP)
+    base_name = render_worker_name()
+    print(f"🏭 渲染 worker {base_name} 已启动 (并发 {args.concurrency})")
+
+    threads = [
+        threading.Thread(target=worker_loop, args=(f"{base_name}#{i}", args.once), daemon=True)
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        print("👋 渲染 worker 退出")
+
+
+if __name__ == "__main__":
+    main()
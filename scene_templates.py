@@ -0,0 +1,820 @@
+# scene_templates.py
+"""
+MathSpace 场景模板库
+常见的教材可视化 (函数图像、定积分面积、单位圆、勾股定理……) 由参数化的现成 Manim 场景直接生成，
+不经过任何 LLM 阶段，只需要渲染时间、零 token 费用：
+- 每个模板有必需关键词、可选关键词、排斥词和参数提取规则
+- 置信度 = 指令中被模板"解释"的比例 (去掉"请画出……的图像"之类的虚词后)，
+  指令里有模板不认识的要求 (平移、切线、再添加……) 时置信度下降，交回完整流水线
+- 函数表达式只接受白名单记号 (x、数字、+-*/^、sin/cos/…)，在服务端先采样检查定义域和取值范围；
+  采样时数字一律按浮点数计算 (9^9^8 之类直接溢出报错，而不是变成算不完的大整数乘方)
+模板自检: python scene_templates.py --check [--render]
+"""
+
+import re
+import sys
+import math
+import argparse
+
+MIN_SAMPLE_POINTS = 241
+MAX_ABS_VALUE = 1e6
+# 采样值的"典型范围" (10%~90% 分位) 之外：相邻两点跳变超过它 (渐近线、间断) 或最大值超过它的若干倍都拒绝
+MAX_STEP_RATIO = 1.0
+MAX_PEAK_RATIO = 50.0
+GRAPH_COLORS = ["BLUE", "RED", "GREEN", "ORANGE"]
+
+HEADER = """from manim import *
+import math
+import numpy as np
+
+
+class MathScene(Scene):
+    def construct(self):
+"""
+
+# 虚词：不影响模板选择的请求用语和标点
+FILLER_PATTERN = re.compile(
+    r"请|帮我|帮忙|给我|麻烦|画出|画|绘制|作出|做出|生成|演示|展示|显示|一下|一个|一张|"
+    r"的|上|在|内|中|并且|并|和|与|及|出来|图像|图象|图形|区间|范围|动画|视频|吧|呢|"
+    r"[，。、：:,.!！?？；;\s()（）\[\]【】]"
+)
+# 出现这些词说明是在已有场景上修改 / 追加，不能用整场景模板替换
+GLOBAL_REJECT_PATTERN = re.compile(r"再|添加|加上|加入|修改|改成|改为|换成|把|将|保留|原来|刚才|之前|继续|旁边")
+NUMBER = r"-?\s*(?:\d+(?:\.\d+)?\s*(?:π|pi)?|π|pi)"
+
+
+def fmt(value):
+    """生成代码里的数字：去掉多余的小数位"""
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def parse_number(text):
+    text = text.replace(" ", "")
+    sign = -1 if text.startswith("-") else 1
+    text = text.lstrip("-")
+    if text.endswith(("π", "pi")):
+        coef = text[:-1] if text.endswith("π") else text[:-2]
+        return sign * (float(coef) if coef else 1.0) * math.pi
+    return sign * float(text)
+
+
+def nice_step(span, target=8):
+    raw = max(span, 1e-9) / target
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for multiple in (1, 2, 5, 10):
+        if raw <= multiple * magnitude:
+            return multiple * magnitude
+    return 10 * magnitude
+
+
+def axis_bounds(low, high):
+    """把区间扩展到刻度整数倍，返回 (起点, 终点, 步长)"""
+    step = nice_step(high - low)
+    return math.floor(low / step) * step, math.ceil(high / step) * step, step
+
+
+# ================= 🧮 函数表达式 =================
+FUNCTIONS = ("log10", "log2", "sqrt", "sin", "cos", "tan", "exp", "abs", "ln", "lg", "log")
+TOKEN_PATTERN = re.compile(r"\s*(log10|log2|sqrt|sin|cos|tan|exp|abs|ln|lg|log|pi|π|\d+(?:\.\d+)?|x|e|[-+*/^()])")
+VALUE_END = re.compile(r"\d|x|e|pi|π|\)")
+IMPLICIT = "·"  # 隐式乘法 (2x、2sin(x))
+
+SAMPLE_NAMES = {"ln": "log", "lg": "log10", "log": "log", "π": "pi"}
+SCENE_NAMES = {
+    "sin": "np.sin", "cos": "np.cos", "tan": "np.tan", "exp": "np.exp", "sqrt": "np.sqrt", "abs": "np.abs",
+    "ln": "np.log", "log": "np.log", "log2": "np.log2", "lg": "np.log10", "log10": "np.log10",
+    "pi": "np.pi", "π": "np.pi", "e": "np.e",
+}
+TEX_NAMES = {
+    "sin": r"\sin", "cos": r"\cos", "tan": r"\tan", "exp": r"\exp", "ln": r"\ln", "log": r"\log",
+    "log2": r"\log_2", "lg": r"\lg", "log10": r"\log_{10}", "pi": r"\pi", "π": r"\pi",
+}
+SAMPLE_NAMESPACE = {
+    "__builtins__": {},
+    "sin": math.sin, "cos": math.cos, "tan": math.tan, "exp": math.exp, "sqrt": math.sqrt, "abs": abs,
+    "log": math.log, "log2": math.log2, "log10": math.log10, "pi": math.pi, "e": math.e,
+}
+
+
+def tokenize_expression(text):
+    """
+    从 text 开头尽可能长地切出合法表达式，返回 (记号列表, 消耗的字符数)；不合法返回 (None, 0)
+    只允许白名单记号，因此后续 eval 是安全的
+    """
+    tokens, pos = [], 0
+    best = (None, 0)
+    while True:
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            break
+        token = match.group(1)
+        if tokens and VALUE_END.fullmatch(tokens[-1]) and token not in "+-*/^)":
+            tokens.append(IMPLICIT)
+        tokens.append(token)
+        pos = match.end()
+        if _valid_tokens(tokens):
+            best = (list(tokens), pos)
+    return best if best[0] else (None, 0)
+
+
+def _valid_tokens(tokens):
+    depth = 0
+    for index, token in enumerate(tokens):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+        elif token in FUNCTIONS and (index + 1 >= len(tokens) or tokens[index + 1] != "("):
+            return False
+    if depth != 0 or "x" not in tokens or tokens[-1] in "+-*/^" + IMPLICIT:
+        return False
+    try:
+        compile(_python(tokens, {}), "<expr>", "eval")
+    except SyntaxError:
+        return False
+    return True
+
+
+def _python(tokens, names, floats=False):
+    """转成 Python 表达式；floats=True 时数字写成浮点字面量 (采样用)"""
+    parts = []
+    for token in tokens:
+        if token == "^":
+            parts.append("**")
+        elif token == IMPLICIT:
+            parts.append("*")
+        elif floats and token[0].isdigit():
+            parts.append(repr(float(token)))
+        else:
+            parts.append(names.get(token, token))
+    return "".join(parts)
+
+
+def _group_end(tokens, start):
+    depth = 0
+    for index in range(start, len(tokens)):
+        depth += {"(": 1, ")": -1}.get(tokens[index], 0)
+        if depth == 0:
+            return index
+    return len(tokens) - 1
+
+
+def _tex(tokens):
+    out, index = [], 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in ("sqrt", "abs") or token == "^":
+            # 指数 / 根号 / 绝对值的参数放进花括号
+            start = index + 1
+            if start < len(tokens) and tokens[start] == "(":
+                end = _group_end(tokens, start)
+                inner = _tex(tokens[start + 1:end])
+            else:
+                end = start + (1 if start < len(tokens) and tokens[start] != "-" else 2) - 1
+                inner = _tex(tokens[start:end + 1])
+            if token == "sqrt":
+                out.append(rf"\sqrt{{{inner}}}")
+            elif token == "abs":
+                out.append(rf"\left|{inner}\right|")
+            else:
+                out.append(f"^{{{inner}}}")
+            index = end + 1
+            continue
+        if token == "*":
+            out.append(r" \cdot ")
+        elif token != IMPLICIT:
+            out.append(TEX_NAMES.get(token, token) + (" " if token in TEX_NAMES and token not in ("pi", "π") else ""))
+        index += 1
+    return "".join(out).strip()
+
+
+def sample_function(tokens, x_min, x_max):
+    """在区间上采样，返回 (最小值, 最大值)；有定义域问题、数值过大或有渐近线 / 间断时返回 None"""
+    code = compile(_python(tokens, SAMPLE_NAMES, floats=True), "<expr>", "eval")
+    values = []
+    for i in range(MIN_SAMPLE_POINTS):
+        x = x_min + (x_max - x_min) * i / (MIN_SAMPLE_POINTS - 1)
+        try:
+            y = eval(code, SAMPLE_NAMESPACE, {"x": x})
+        except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+            return None
+        if isinstance(y, complex) or not math.isfinite(y) or abs(y) > MAX_ABS_VALUE:
+            return None
+        values.append(y)
+
+    ordered = sorted(values)
+    spread = max(ordered[len(ordered) * 9 // 10] - ordered[len(ordered) // 10], 1.0)
+    if max(abs(b - a) for a, b in zip(values, values[1:])) > MAX_STEP_RATIO * spread:
+        return None
+    if max(abs(ordered[0]), abs(ordered[-1])) > MAX_PEAK_RATIO * spread:
+        return None
+    return ordered[0], ordered[-1]
+
+
+def integrate(tokens, a, b, parts=200):
+    """Simpson 公式数值积分 (只用于标注近似值)"""
+    code = compile(_python(tokens, SAMPLE_NAMES, floats=True), "<expr>", "eval")
+    f = lambda x: eval(code, SAMPLE_NAMESPACE, {"x": x})
+    h = (b - a) / parts
+    total = f(a) + f(b) + sum((4 if i % 2 else 2) * f(a + i * h) for i in range(1, parts))
+    return total * h / 3
+
+
+EXPRESSION_PATTERN = re.compile(r"(?:y|f\s*\(\s*x\s*\))\s*=\s*", re.IGNORECASE)
+RANGE_PATTERNS = [
+    re.compile(rf"(?:x\s*[∈在]\s*)?[\[\(（【]\s*({NUMBER})\s*[,，]\s*({NUMBER})\s*[\]\)）】]"),
+    re.compile(rf"从\s*({NUMBER})\s*到\s*({NUMBER})"),
+]
+PERIOD_PATTERN = re.compile(r"(一|两|二|三|1|2|3)\s*个\s*周期")
+PERIOD_COUNTS = {"一": 1, "1": 1, "两": 2, "二": 2, "2": 2, "三": 3, "3": 3}
+
+
+def find_expressions(prompt):
+    """返回 [(记号列表, (起, 止))]"""
+    found = []
+    for match in EXPRESSION_PATTERN.finditer(prompt):
+        tokens, consumed = tokenize_expression(prompt[match.end():].lower())
+        if tokens:
+            found.append((tokens, (match.start(), match.end() + consumed)))
+    return found
+
+
+def find_range(prompt):
+    """返回 ((x_min, x_max), (起, 止)) 或 None"""
+    for pattern in RANGE_PATTERNS:
+        for match in pattern.finditer(prompt):
+            try:
+                low, high = parse_number(match.group(1)), parse_number(match.group(2))
+            except ValueError:
+                continue
+            if high > low:
+                return (low, high), match.span()
+    match = PERIOD_PATTERN.search(prompt)
+    if match:
+        return (0.0, 2 * math.pi * PERIOD_COUNTS[match.group(1)]), match.span()
+    return None
+
+
+# ================= 📐 模板 =================
+class SceneTemplate:
+    """
+    name / title: 模板标识与展示名
+    required: 每个正则都必须命中；optional: 命中的部分算作"已解释"；rejects: 命中即放弃该模板
+    examples: 自检用的示例指令
+    """
+    name = ""
+    title = ""
+    required = []
+    optional = []
+    rejects = None
+    examples = []
+
+    def extract(self, prompt):
+        """提取参数，返回 (params, 参数占用的区间列表)；参数不合法返回 None"""
+        return {}, []
+
+    def code(self, params):
+        raise NotImplementedError
+
+    def match(self, prompt):
+        """返回 (置信度, params) 或 None"""
+        if self.rejects is not None and self.rejects.search(prompt):
+            return None
+        spans = []
+        for pattern in self.required:
+            matches = list(pattern.finditer(prompt))
+            if not matches:
+                return None
+            spans.extend(m.span() for m in matches)
+        for pattern in self.optional:
+            spans.extend(m.span() for m in pattern.finditer(prompt))
+        extracted = self.extract(prompt)
+        if extracted is None:
+            return None
+        params, param_spans = extracted
+        return coverage(prompt, spans + param_spans), params
+
+
+def coverage(prompt, spans):
+    """去掉虚词后，指令中被模板解释的比例"""
+    explained = [False] * len(prompt)
+    for start, end in spans:
+        for i in range(start, end):
+            explained[i] = True
+    rest = "".join(" " if explained[i] else ch for i, ch in enumerate(prompt))
+    leftover = len(FILLER_PATTERN.sub("", rest))
+    core = len(FILLER_PATTERN.sub("", prompt))
+    return round(max(0.0, 1 - leftover / max(core, 1)), 3)
+
+
+class FunctionGraphTemplate(SceneTemplate):
+    name = "function_graph"
+    title = "函数图像"
+    required = []
+    optional = [re.compile(r"正弦|余弦|二次|一次|三次|指数|对数|幂|反比例|函数|曲线|坐标系|坐标轴")]
+    rejects = re.compile(
+        r"对称|平移|伸缩|变换|切线|割线|导数|面积|积分|极限|交点|零点|单调|最值|证明|反函数|参数|"
+        r"三维|3D|曲面|立体|动点|轨迹|变化过程"
+    )
+    examples = ["画出 y=x^2 在 [-3,3] 上的图像", "画出正弦函数 y=sin(x) 在一个周期内的图像", "绘制 y = 2x + 1 和 y = -x^2 + 4"]
+
+    def extract(self, prompt):
+        expressions = find_expressions(prompt)
+        if not expressions or len(expressions) > len(GRAPH_COLORS):
+            return None
+        found_range = find_range(prompt)
+        x_min, x_max = found_range[0] if found_range else (-5.0, 5.0)
+        spans = [span for _, span in expressions] + ([found_range[1]] if found_range else [])
+
+        functions, y_min, y_max = [], 0.0, 0.0
+        for tokens, _ in expressions:
+            sampled = sample_function(tokens, x_min, x_max)
+            if sampled is None:
+                return None
+            y_min, y_max = min(y_min, sampled[0]), max(y_max, sampled[1])
+            functions.append({"python": _python(tokens, SCENE_NAMES), "tex": _tex(tokens)})
+        if y_max - y_min < 1e-6:
+            y_min, y_max = y_min - 1, y_max + 1
+        return {
+            "functions": functions,
+            "x_range": [x_min, x_max],
+            "x_axis": axis_bounds(x_min, x_max),
+            "y_axis": axis_bounds(y_min, y_max),
+        }, spans
+
+    def code(self, params):
+        x_min, x_max = params["x_range"]
+        ax_min, ax_max, ax_step = params["x_axis"]
+        ay_min, ay_max, ay_step = params["y_axis"]
+        code = HEADER + f"""        axes = Axes(
+            x_range=[{fmt(ax_min)}, {fmt(ax_max)}, {fmt(ax_step)}],
+            y_range=[{fmt(ay_min)}, {fmt(ay_max)}, {fmt(ay_step)}],
+            x_length=10,
+            y_length=6,
+            tips=False,
+            axis_config={{"include_numbers": True, "font_size": 24}},
+        ).shift(DOWN * 0.3)
+        axes_labels = axes.get_axis_labels(x_label="x", y_label="y")
+        self.play(Create(axes), FadeIn(axes_labels), run_time=1.5)
+"""
+        for i, function in enumerate(params["functions"]):
+            color = GRAPH_COLORS[i]
+            code += f"""
+        graph_{i} = axes.plot(lambda x: {function["python"]}, x_range=[{fmt(x_min)}, {fmt(x_max)}], color={color})
+        label_{i} = MathTex(r"y = {function["tex"]}", color={color}, font_size=36)
+"""
+        count = len(params["functions"])
+        labels = ", ".join(f"label_{i}" for i in range(count))
+        code += f"""
+        VGroup({labels}).arrange(DOWN, aligned_edge=LEFT).to_corner(UL)
+"""
+        for i in range(count):
+            code += f"""        self.play(Create(graph_{i}), Write(label_{i}), run_time=2)
+"""
+        return code + """        self.wait(1)
+"""
+
+
+class RiemannAreaTemplate(SceneTemplate):
+    name = "riemann_area"
+    title = "定积分与黎曼和"
+    required = [re.compile(r"定积分|积分|黎曼和")]
+    optional = [re.compile(r"是|曲线下方?|的面积|面积|逼近|近似|矩形|小矩形|求和|几何意义")]
+    rejects = re.compile(r"不定积分|分部积分|换元|二重|三重|旋转体|体积|弧长")
+    examples = ["演示定积分是曲线下方的面积 (黎曼和逼近)", "用黎曼和逼近 y=sin(x) 在 [0,π] 上的定积分"]
+
+    def extract(self, prompt):
+        expressions = find_expressions(prompt)
+        if len(expressions) > 1:
+            return None
+        tokens, spans = (expressions[0][0], [expressions[0][1]]) if expressions else (["x", "^", "2"], [])
+        found_range = find_range(prompt)
+        a, b = found_range[0] if found_range else (0.0, 2.0)
+        if found_range:
+            spans.append(found_range[1])
+
+        pad = (b - a) * 0.15
+        sampled = sample_function(tokens, a - pad, b + pad)
+        if sampled is None:
+            return None
+        return {
+            "python": _python(tokens, SCENE_NAMES),
+            "tex": _tex(tokens),
+            "interval": [a, b],
+            "plot_range": [a - pad, b + pad],
+            "x_axis": axis_bounds(a - pad, b + pad),
+            "y_axis": axis_bounds(min(sampled[0], 0.0), max(sampled[1], 0.0) or 1.0),
+            "integral": integrate(tokens, a, b),
+            "rectangles": 8,
+        }, spans
+
+    def code(self, params):
+        a, b = params["interval"]
+        p_min, p_max = params["plot_range"]
+        ax_min, ax_max, ax_step = params["x_axis"]
+        ay_min, ay_max, ay_step = params["y_axis"]
+        n = params["rectangles"]
+        integral_tex = rf"\int_{{{fmt(a)}}}^{{{fmt(b)}}} {params['tex']} \, dx \approx {params['integral']:.3f}"
+        sum_tex = r"\sum_{i=1}^{n} f(x_i)\,\Delta x"
+        return HEADER + f"""        axes = Axes(
+            x_range=[{fmt(ax_min)}, {fmt(ax_max)}, {fmt(ax_step)}],
+            y_range=[{fmt(ay_min)}, {fmt(ay_max)}, {fmt(ay_step)}],
+            x_length=10,
+            y_length=6,
+            tips=False,
+            axis_config={{"include_numbers": True, "font_size": 24}},
+        ).shift(DOWN * 0.3)
+        graph = axes.plot(lambda x: {params["python"]}, x_range=[{fmt(p_min)}, {fmt(p_max)}], color=BLUE)
+        graph_label = MathTex(r"y = {params["tex"]}", color=BLUE, font_size=36).to_corner(UL)
+        self.play(Create(axes), Create(graph), Write(graph_label), run_time=2)
+
+        # 黎曼和：矩形逐步加密
+        rects = axes.get_riemann_rectangles(
+            graph, x_range=[{fmt(a)}, {fmt(b)}], dx={fmt((b - a) / n)},
+            color=YELLOW, fill_opacity=0.6, stroke_width=1
+        )
+        sum_label = MathTex(r"{sum_tex}", font_size=36).to_corner(UR)
+        self.play(Create(rects), Write(sum_label), run_time=2)
+        self.wait(0.5)
+        for parts in [{n * 2}, {n * 4}, {n * 8}]:
+            finer = axes.get_riemann_rectangles(
+                graph, x_range=[{fmt(a)}, {fmt(b)}], dx={fmt(b - a)} / parts,
+                color=YELLOW, fill_opacity=0.6, stroke_width=0.5
+            )
+            self.play(Transform(rects, finer), run_time=1.2)
+
+        # 极限即曲线下方的面积
+        area = axes.get_area(graph, x_range=[{fmt(a)}, {fmt(b)}], color=BLUE, opacity=0.5)
+        integral_label = MathTex(r"{integral_tex}", font_size=36).to_corner(UR)
+        self.play(FadeOut(rects), FadeIn(area), ReplacementTransform(sum_label, integral_label), run_time=1.5)
+        self.wait(1)
+"""
+
+
+class UnitCircleTemplate(SceneTemplate):
+    name = "unit_circle"
+    title = "单位圆与三角函数"
+    required = [re.compile(r"单位圆")]
+    optional = [re.compile(r"角度?|变化|时|sin|cos|正弦|余弦|三角函数|的?值|旋转|转动|一圈|点")]
+    rejects = re.compile(r"tan|正切|切线|诱导公式|弧长|扇形")
+    examples = ["演示单位圆上角度变化时 sin 和 cos 的值"]
+
+    def code(self, params):
+        return HEADER + r"""        plane = NumberPlane(
+            x_range=[-2, 2, 1], y_range=[-1.5, 1.5, 1], x_length=8, y_length=6,
+            background_line_style={"stroke_opacity": 0.3},
+        ).shift(LEFT * 2)
+        unit = plane.c2p(1, 0)[0] - plane.c2p(0, 0)[0]
+        circle = Circle(radius=unit, color=WHITE).move_to(plane.c2p(0, 0))
+        theta = ValueTracker(0.01)
+
+        def point():
+            t = theta.get_value()
+            return plane.c2p(np.cos(t), np.sin(t))
+
+        radius = always_redraw(lambda: Line(plane.c2p(0, 0), point(), color=YELLOW))
+        dot = always_redraw(lambda: Dot(point(), color=YELLOW))
+        cos_line = always_redraw(lambda: Line(
+            plane.c2p(0, 0), plane.c2p(np.cos(theta.get_value()), 0), color=GREEN, stroke_width=6
+        ))
+        sin_line = always_redraw(lambda: Line(
+            plane.c2p(np.cos(theta.get_value()), 0), point(), color=RED, stroke_width=6
+        ))
+        arc = always_redraw(lambda: Arc(
+            radius=0.4 * unit, start_angle=0, angle=max(theta.get_value() % TAU, 0.01),
+            arc_center=plane.c2p(0, 0), color=BLUE
+        ))
+
+        cos_label = MathTex(r"\cos\theta =", color=GREEN, font_size=40)
+        cos_value = DecimalNumber(1, num_decimal_places=2, color=GREEN, font_size=40)
+        sin_label = MathTex(r"\sin\theta =", color=RED, font_size=40)
+        sin_value = DecimalNumber(0, num_decimal_places=2, color=RED, font_size=40)
+        readout = VGroup(
+            VGroup(cos_label, cos_value).arrange(RIGHT),
+            VGroup(sin_label, sin_value).arrange(RIGHT),
+        ).arrange(DOWN, aligned_edge=LEFT).to_edge(RIGHT, buff=1)
+        cos_value.add_updater(lambda m: m.set_value(np.cos(theta.get_value())))
+        sin_value.add_updater(lambda m: m.set_value(np.sin(theta.get_value())))
+
+        self.play(Create(plane), Create(circle), run_time=1.5)
+        self.play(Create(radius), FadeIn(dot), Create(cos_line), Create(sin_line), Create(arc), FadeIn(readout))
+        self.play(theta.animate.set_value(TAU), run_time=8, rate_func=linear)
+        self.wait(1)
+"""
+
+
+class CircleAnatomyTemplate(SceneTemplate):
+    name = "circle_anatomy"
+    title = "圆的半径、直径与圆心"
+    required = [re.compile(r"圆"), re.compile(r"半径|直径|圆心")]
+    optional = [re.compile(r"标出|标注|标记|半径|直径|圆心|为|是")]
+    rejects = re.compile(r"单位圆|切线|面积|周长|弧长|圆周角|弦|扇形|内接|外接|圆锥|圆柱|球|椭圆|同心|相交|相切")
+    examples = ["画一个圆并标出半径、直径和圆心", "画一个半径为 2 的圆，标出圆心和直径"]
+
+    def extract(self, prompt):
+        match = re.search(r"半径\s*(?:为|是|=)?\s*(\d+(?:\.\d+)?)", prompt)
+        if not match:
+            return {"radius": 2.0}, []
+        radius = float(match.group(1))
+        if not 0 < radius <= 100:
+            return None
+        return {"radius": radius}, [match.span()]
+
+    def code(self, params):
+        radius = params["radius"]
+        display = min(max(radius, 1.0), 2.8)
+        return HEADER + f"""        r = {fmt(display)}
+        circle = Circle(radius=r, color=BLUE)
+        center = Dot(ORIGIN, color=YELLOW)
+        center_label = MathTex("O", font_size=36).next_to(center, DOWN + LEFT, buff=0.15)
+        self.play(Create(circle), run_time=1.5)
+        self.play(FadeIn(center), Write(center_label))
+
+        tip = r * np.array([np.cos(PI / 3), np.sin(PI / 3), 0])
+        radius_line = Line(ORIGIN, tip, color=RED, stroke_width=5)
+        radius_label = MathTex(r"r = {fmt(radius)}", color=RED, font_size=36)
+        radius_label.next_to(radius_line.get_center(), LEFT, buff=0.2)
+        self.play(Create(radius_line), Write(radius_label))
+
+        diameter = Line(LEFT * r, RIGHT * r, color=GREEN, stroke_width=5)
+        diameter_label = MathTex(r"d = 2r = {fmt(2 * radius)}", color=GREEN, font_size=36)
+        diameter_label.next_to(circle, DOWN, buff=0.3)
+        self.play(Create(diameter), Write(diameter_label))
+        self.wait(1)
+"""
+
+
+class PythagoreanTemplate(SceneTemplate):
+    name = "pythagorean"
+    title = "勾股定理"
+    required = [re.compile(r"勾股定理|毕达哥拉斯定理")]
+    optional = [re.compile(r"证明|验证|用|正方形|面积|拼接|拼图|直角三角形|边长|直角边|为")]
+    rejects = re.compile(r"逆定理|三维|空间|勾股数")
+    examples = ["用正方形面积拼接证明勾股定理", "演示直角边为 5 和 12 的勾股定理"]
+
+    def extract(self, prompt):
+        match = re.search(r"(\d+(?:\.\d+)?)\s*[,，、和与]\s*(\d+(?:\.\d+)?)", prompt)
+        if not match:
+            return {"a": 3.0, "b": 4.0}, []
+        a, b = float(match.group(1)), float(match.group(2))
+        if not (0 < a <= 50 and 0 < b <= 50) or max(a, b) / min(a, b) > 4:
+            return None
+        return {"a": a, "b": b}, [match.span()]
+
+    def code(self, params):
+        a, b = params["a"], params["b"]
+        c = math.hypot(a, b)
+        c_text = fmt(c) if abs(c - round(c)) < 1e-9 else rf"\sqrt{{{fmt(a * a + b * b)}}}"
+        equation = rf"{fmt(a)}^2 + {fmt(b)}^2 = {c_text}^2"
+        return HEADER + f"""        a, b = {fmt(a)}, {fmt(b)}
+        A = np.array([0.0, 0.0, 0.0])
+        B = np.array([a, 0.0, 0.0])
+        C = np.array([0.0, b, 0.0])
+        triangle = Polygon(A, B, C, color=WHITE, fill_color=GREY, fill_opacity=0.5)
+        square_a = Polygon(A, B, B + DOWN * a, A + DOWN * a, color=BLUE, fill_opacity=0.4)
+        square_b = Polygon(A, C, C + LEFT * b, A + LEFT * b, color=GREEN, fill_opacity=0.4)
+        outward = np.array([b, a, 0.0])  # 斜边 BC 向外的法向量，长度等于斜边
+        square_c = Polygon(B, C, C + outward, B + outward, color=RED, fill_opacity=0.4)
+
+        figure = VGroup(triangle, square_a, square_b, square_c)
+        figure.scale_to_fit_height(5.2).move_to(LEFT * 1.5)
+        label_a = MathTex("a^2", color=BLUE).move_to(square_a.get_center())
+        label_b = MathTex("b^2", color=GREEN).move_to(square_b.get_center())
+        label_c = MathTex("c^2", color=RED).move_to(square_c.get_center())
+
+        self.play(Create(triangle), run_time=1)
+        self.play(FadeIn(square_a), Write(label_a))
+        self.play(FadeIn(square_b), Write(label_b))
+        self.play(FadeIn(square_c), Write(label_c))
+
+        formula = MathTex("a^2 + b^2 = c^2", font_size=48).to_edge(RIGHT, buff=0.8).shift(UP * 0.5)
+        numbers = MathTex(r"{equation}", font_size=40).next_to(formula, DOWN, buff=0.4)
+        self.play(ReplacementTransform(VGroup(label_a, label_b, label_c).copy(), formula), run_time=1.5)
+        self.play(Write(numbers))
+        self.wait(1)
+"""
+
+
+class VectorAdditionTemplate(SceneTemplate):
+    name = "vector_addition"
+    title = "向量加法"
+    required = [re.compile(r"向量"), re.compile(r"加法|相加|之和|求和|合成|平行四边形|三角形法则")]
+    optional = [re.compile(r"法则|的|两个|和|向量|a|b")]
+    rejects = re.compile(r"减法|相减|差|数量积|点积|点乘|叉积|叉乘|内积|外积|投影|夹角|三维|空间")
+    examples = ["演示向量加法的平行四边形法则", "演示向量 (2,1) 和 (1,2) 相加"]
+
+    VECTOR_PATTERN = re.compile(r"[\(（]\s*(-?\d+(?:\.\d+)?)\s*[,，]\s*(-?\d+(?:\.\d+)?)\s*[\)）]")
+
+    def extract(self, prompt):
+        matches = list(self.VECTOR_PATTERN.finditer(prompt))
+        if not matches:
+            return {"a": [3.0, 1.0], "b": [1.0, 2.0]}, []
+        if len(matches) != 2:
+            return None
+        vectors = [[float(m.group(1)), float(m.group(2))] for m in matches]
+        if any(abs(v) > 6 for vector in vectors for v in vector) or any(vector == [0.0, 0.0] for vector in vectors):
+            return None
+        return {"a": vectors[0], "b": vectors[1]}, [m.span() for m in matches]
+
+    def code(self, params):
+        (ax, ay), (bx, by) = params["a"], params["b"]
+        xs, ys = [0, ax, bx, ax + bx], [0, ay, by, ay + by]
+        x_min, x_max = math.floor(min(xs)) - 1, math.ceil(max(xs)) + 1
+        y_min, y_max = math.floor(min(ys)) - 1, math.ceil(max(ys)) + 1
+        return HEADER + f"""        plane = NumberPlane(
+            x_range=[{x_min}, {x_max}, 1], y_range=[{y_min}, {y_max}, 1],
+            x_length=min(10, {x_max - x_min} * 6 / {y_max - y_min}), y_length=6,
+            background_line_style={{"stroke_opacity": 0.4}},
+        )
+        origin = plane.c2p(0, 0)
+        tip_a = plane.c2p({fmt(ax)}, {fmt(ay)})
+        tip_b = plane.c2p({fmt(bx)}, {fmt(by)})
+        tip_sum = plane.c2p({fmt(ax + bx)}, {fmt(ay + by)})
+
+        vec_a = Arrow(origin, tip_a, buff=0, color=BLUE)
+        vec_b = Arrow(origin, tip_b, buff=0, color=GREEN)
+        label_a = MathTex(r"\\vec{{a}} = ({fmt(ax)}, {fmt(ay)})", color=BLUE, font_size=32).next_to(tip_a, RIGHT, buff=0.1)
+        label_b = MathTex(r"\\vec{{b}} = ({fmt(bx)}, {fmt(by)})", color=GREEN, font_size=32).next_to(tip_b, LEFT, buff=0.1)
+        self.play(Create(plane), run_time=1)
+        self.play(GrowArrow(vec_a), Write(label_a))
+        self.play(GrowArrow(vec_b), Write(label_b))
+
+        # 平行四边形法则：平移两条边
+        side_a = DashedLine(tip_b, tip_sum, color=BLUE)
+        side_b = DashedLine(tip_a, tip_sum, color=GREEN)
+        self.play(Create(side_a), Create(side_b), run_time=1.5)
+
+        vec_sum = Arrow(origin, tip_sum, buff=0, color=YELLOW)
+        label_sum = MathTex(
+            r"\\vec{{a}} + \\vec{{b}} = ({fmt(ax + bx)}, {fmt(ay + by)})", color=YELLOW, font_size=32
+        ).next_to(tip_sum, UP, buff=0.1)
+        self.play(GrowArrow(vec_sum), Write(label_sum))
+        self.wait(1)
+"""
+
+
+class TriangleAngleSumTemplate(SceneTemplate):
+    name = "triangle_angle_sum"
+    title = "三角形内角和"
+    required = [re.compile(r"三角形"), re.compile(r"内角和|180\s*(?:度|°)?")]
+    optional = [re.compile(r"等于|是|为|证明|180\s*(?:度|°)")]
+    rejects = re.compile(r"外角|全等|相似|面积|中线|角平分线|垂直平分|勾股|多边形|四边形|球面")
+    examples = ["演示三角形内角和等于 180 度"]
+
+    def code(self, params):
+        return HEADER + r"""        A = np.array([-3.0, -1.0, 0.0])
+        B = np.array([3.0, -1.0, 0.0])
+        C = np.array([0.8, 2.2, 0.0])
+        triangle = Polygon(A, B, C, color=WHITE)
+
+        def corner(P, Q, R):
+            # 顶点 P 处、PQ 与 PR 之间的角：返回 (起始角, 角度)
+            start = np.arctan2((Q - P)[1], (Q - P)[0])
+            end = np.arctan2((R - P)[1], (R - P)[0])
+            angle = (end - start) % TAU
+            if angle > PI:
+                start, angle = end, TAU - angle
+            return start, angle
+
+        colors = [BLUE, GREEN, RED]
+        names = [r"\alpha", r"\beta", r"\gamma"]
+        corners = [corner(A, B, C), corner(B, C, A), corner(C, A, B)]
+        arcs, labels = VGroup(), VGroup()
+        for vertex, (start, angle), color, name in zip([A, B, C], corners, colors, names):
+            arcs.add(Arc(radius=0.5, start_angle=start, angle=angle, arc_center=vertex, color=color, stroke_width=6))
+            direction = np.array([np.cos(start + angle / 2), np.sin(start + angle / 2), 0.0])
+            labels.add(MathTex(name, color=color, font_size=36).move_to(vertex + 0.85 * direction))
+
+        self.play(Create(triangle), run_time=1.5)
+        self.play(Create(arcs), Write(labels))
+
+        # 把三个角拼到一条直线上
+        base = DOWN * 2.6
+        line = Line(base + LEFT * 2, base + RIGHT * 2, color=GREY)
+        offset = 0
+        targets = VGroup()
+        for (start, angle), color in zip(corners, colors):
+            targets.add(Arc(radius=0.8, start_angle=offset, angle=angle, arc_center=base, color=color, stroke_width=8))
+            offset += angle
+        self.play(Create(line))
+        self.play(*[TransformFromCopy(arc, target) for arc, target in zip(arcs, targets)], run_time=2)
+
+        result = MathTex(r"\alpha + \beta + \gamma = 180^\circ", font_size=44).to_edge(RIGHT, buff=0.6).shift(DOWN * 1.5)
+        self.play(Write(result))
+        self.wait(1)
+"""
+
+
+# ================= 🔎 匹配 =================
+class TemplateMatch:
+    def __init__(self, template, confidence, params):
+        self.template = template
+        self.confidence = confidence
+        self.params = params
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def title(self):
+        return self.template.title
+
+    def code(self):
+        return self.template.code(self.params)
+
+
+class TemplateLibrary:
+    def __init__(self, templates=None):
+        self.templates = templates or [
+            FunctionGraphTemplate(),
+            RiemannAreaTemplate(),
+            UnitCircleTemplate(),
+            CircleAnatomyTemplate(),
+            PythagoreanTemplate(),
+            VectorAdditionTemplate(),
+            TriangleAngleSumTemplate(),
+        ]
+
+    def match(self, prompt):
+        """返回置信度最高的 TemplateMatch (可能低于阈值，由调用方判断)；没有模板适用时返回 None"""
+        prompt = prompt.strip()
+        if not prompt or GLOBAL_REJECT_PATTERN.search(prompt):
+            return None
+        best = None
+        for template in self.templates:
+            try:
+                result = template.match(prompt)
+            except Exception as e:
+                print(f"⚠️ [模板] {template.name} 匹配异常: {e}")
+                continue
+            if result and (best is None or result[0] > best.confidence):
+                best = TemplateMatch(template, *result)
+        return best
+
+
+template_library = TemplateLibrary()
+
+
+# ================= ✅ 自检 =================
+def check_templates(render=False):
+    """每个模板的示例指令都必须命中该模板，且生成的代码可解析、能识别出场景类；render=True 时实际渲染"""
+    from config import TEMPLATE_MIN_CONFIDENCE
+    from code_analysis import code_analyzer
+
+    failures = 0
+    for template in template_library.templates:
+        for example in template.examples:
+            match = template_library.match(example)
+            problem = None
+            if match is None or match.name != template.name:
+                problem = f"匹配到 {match.name if match else '无'}"
+            elif match.confidence < TEMPLATE_MIN_CONFIDENCE:
+                problem = f"置信度过低 {match.confidence}"
+            else:
+                analysis = code_analyzer.analyze(match.code())
+                if analysis.get("scene_class") != "MathScene":
+                    problem = f"代码无法解析: {analysis.get('error')}"
+                elif render:
+                    problem = _render_check(match.code())
+            failures += 1 if problem else 0
+            status = f"❌ {problem}" if problem else f"✅ {match.confidence}"
+            print(f"{template.name:20s} {status:24s} {example}")
+    return failures
+
+
+def _render_check(code):
+    import tempfile
+    from render_jobs import new_render_job, execute_render_job
+
+    with tempfile.TemporaryDirectory(prefix="mathspace_template_") as output_dir:
+        job = new_render_job("template", code, "MathScene", "template_check")
+        result = execute_render_job(job, output_dir)
+        if result.get("returncode") != 0:
+            return "渲染失败: " + (result.get("stderr") or "")[-200:]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MathSpace 场景模板库")
+    parser.add_argument("--check", action="store_true", help="检查所有模板的示例指令")
+    parser.add_argument("--render", action="store_true", help="自检时实际调用 Manim 渲染")
+    parser.add_argument("prompt", nargs="?", help="查看某条指令的匹配结果和生成代码")
+    args = parser.parse_args()
+
+    if args.prompt:
+        match = template_library.match(args.prompt)
+        if match is None:
+            print("没有适用的模板")
+            return
+        print(f"# 模板: {match.name} ({match.title})  置信度: {match.confidence}")
+        print(match.code())
+        return
+    sys.exit(1 if check_templates(render=args.render) else 0)
+
+
+if __name__ == "__main__":
+    main()
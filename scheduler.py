@@ -0,0 +1,194 @@
+# scheduler.py
+"""
+MathSpace 公平调度器
+挡在 LLM 调用和渲染两个阶段前面，按"加权公平排队 (WFQ)"发放执行名额：
+- 每个任务有估算成本 (3D 场景、动画数量、渲染质量、整文件重写 vs diff)
+- 每个会话有虚拟时间：同一会话连续提交的任务排在其他会话后面，一个用户刷很多 3D 场景不会挡住所有人
+- 便宜的任务 (diff 修改、预览质量的简单场景) 完成标签更小，自然排在重任务前面
+- 根据队列中前面任务的估算成本和各阶段的实测速度，给出预计等待时间，推送给客户端
+调度在单个事件循环内进行，每个进程各自调度 (broker 模式下限制的是本进程提交到队列的并发)。
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+from config import (
+    SCHEDULER_SLOTS, SCHEDULER_SESSION_WEIGHTS, SCHEDULER_ETA_INTERVAL,
+    SCHEDULER_SECONDS_PER_COST, RENDER_QUALITY_COST
+)
+
+MAX_TRACKED_SESSIONS = 1000
+
+
+# ================= 💰 成本估算 =================
+def estimate_llm_cost(stage, intent=None, edit_mode=False):
+    """LLM 调用成本：主要由输出长度决定 (整文件重写 > diff > 短 JSON / 质检意见)"""
+    if stage == "intent":
+        return 0.5
+    if stage in ("generator", "improver", "reviewer"):
+        return 1.0 if edit_mode else 2.0
+    if stage == "fixer":
+        return 2.0
+    return 1.0
+
+
+def estimate_render_cost(analysis, quality):
+    """渲染成本：3D 场景、曲面、动画数量和渲染质量"""
+    cost = 1.0
+    if not analysis or "error" in analysis:
+        cost = 2.0
+    else:
+        if any("ThreeD" in base for base in analysis.get("scene_bases", [])):
+            cost += 3.0
+        cost += 0.5 * sum(1 for m in analysis.get("mobjects", []) if "Surface" in m.get("type", ""))
+        cost += 0.25 * len(analysis.get("plays", []))
+    return round(cost * RENDER_QUALITY_COST.get(quality, 1.0), 2)
+
+
+# ================= 🎟️ 排队 =================
+class Ticket:
+    __slots__ = ("session", "cost", "start_tag", "tag", "seq", "event", "granted", "started", "enqueued")
+
+    def __init__(self, session, cost, start_tag, tag, seq):
+        self.session = session
+        self.cost = cost
+        self.start_tag = start_tag
+        self.tag = tag
+        self.seq = seq
+        self.event = asyncio.Event()
+        self.granted = False
+        self.started = None
+        self.enqueued = time.time()
+
+    def __lt__(self, other):
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class StagePool:
+    """单个阶段 (llm / render) 的名额池"""
+
+    def __init__(self, name, capacity, seconds_per_cost):
+        self.name = name
+        self.capacity = capacity
+        self.seconds_per_cost = seconds_per_cost  # 实测速度 (指数平滑)
+        self.waiting = []
+        self.running = set()
+        self.session_vtime = {}
+        self.vtime = 0.0
+        self.completed = 0
+        self._seq = itertools.count()
+
+    def enqueue(self, session, cost, weight):
+        start = max(self.session_vtime.get(session, 0.0), self.vtime)
+        tag = start + cost / weight
+        self.session_vtime[session] = tag
+        ticket = Ticket(session, cost, start, tag, next(self._seq))
+        heapq.heappush(self.waiting, ticket)
+        self.dispatch()
+        return ticket
+
+    def dispatch(self):
+        while self.waiting and len(self.running) < self.capacity:
+            ticket = heapq.heappop(self.waiting)
+            ticket.granted = True
+            ticket.started = time.time()
+            self.vtime = max(self.vtime, ticket.start_tag)
+            self.running.add(ticket)
+            ticket.event.set()
+        if len(self.session_vtime) > MAX_TRACKED_SESSIONS:
+            # 虚拟时间已落后于全局的会话没有任何优先权，可以忘掉
+            self.session_vtime = {s: t for s, t in self.session_vtime.items() if t > self.vtime}
+
+    def cancel(self, ticket):
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            heapq.heapify(self.waiting)
+
+    def release(self, ticket, elapsed):
+        self.running.discard(ticket)
+        self.completed += 1
+        if ticket.cost > 0:
+            self.seconds_per_cost = 0.8 * self.seconds_per_cost + 0.2 * (elapsed / ticket.cost)
+        self.dispatch()
+
+    def estimate_wait(self, ticket=None):
+        """返回 (前面的任务数, 预计等待秒数)；ticket 为 None 时估算新任务"""
+        ahead = [t for t in self.waiting if ticket is None or t < ticket]
+        now = time.time()
+        running_left = sorted(
+            max(t.cost * self.seconds_per_cost - (now - t.started), 0) for t in self.running
+        )
+        # 排在前面的任务平均分摊到所有名额上；还有空闲名额时无需等待正在运行的任务
+        queued_work = sum(t.cost for t in ahead) * self.seconds_per_cost
+        free = self.capacity - len(self.running)
+        first_free = 0 if free > 0 else (running_left[0] if running_left else 0)
+        if free > 0 and not ahead:
+            return 0, 0.0
+        return len(ahead), round(first_free + queued_work / self.capacity, 1)
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "running": len(self.running),
+            "waiting": len(self.waiting),
+            "completed": self.completed,
+            "seconds_per_cost": round(self.seconds_per_cost, 2),
+            "estimated_wait": self.estimate_wait()[1],
+        }
+
+
+class FairScheduler:
+    def __init__(self, slots=SCHEDULER_SLOTS, weights=SCHEDULER_SESSION_WEIGHTS):
+        self.weights = weights
+        self.pools = {
+            stage: StagePool(stage, capacity, SCHEDULER_SECONDS_PER_COST.get(stage, 10.0))
+            for stage, capacity in slots.items()
+        }
+
+    @asynccontextmanager
+    async def slot(self, stage, session, cost, on_wait=None):
+        """
+        获取一个执行名额，拿到后才进入 with 代码块
+        on_wait: async callable(position, eta_seconds)，排队期间位置变化时回调 (用于推送给客户端)
+        """
+        pool = self.pools[stage]
+        session = session or "anonymous"
+        ticket = pool.enqueue(session, cost, self.weights.get(session, 1.0))
+        try:
+            last_position = None
+            while not ticket.granted:
+                position, eta = pool.estimate_wait(ticket)
+                if on_wait and position != last_position:
+                    last_position = position
+                    await on_wait(position, eta)
+                # 不用 wait_for：名额恰好在取消时到达，wait_for 会吞掉取消 (Python < 3.12)，任务仍会拿着名额继续执行
+                waiter = asyncio.ensure_future(ticket.event.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=SCHEDULER_ETA_INTERVAL)
+                finally:
+                    waiter.cancel()
+        except BaseException:
+            # 排队期间连接断开 / 任务被取消：让出位置
+            if ticket.granted:
+                pool.running.discard(ticket)
+                pool.dispatch()
+            else:
+                pool.cancel(ticket)
+            raise
+
+        try:
+            yield ticket
+        finally:
+            pool.release(ticket, time.time() - ticket.started)
+
+    def estimate_wait(self, stage):
+        return self.pools[stage].estimate_wait()[1]
+
+    def stats(self):
+        return {stage: pool.stats() for stage, pool in self.pools.items()}
+
+
+scheduler = FairScheduler()
@@ -0,0 +1,87 @@
+# singleflight.py
+"""
+MathSpace 请求合并 (single-flight)
+相同指令 (与缓存相同的 MD5 键) 正在生成时，后到的请求不再重复跑整条流水线，
+而是挂到进行中的任务上：先补发已产生的进度事件，之后与发起者同步收到进度和结果。
+"""
+
+import asyncio
+
+
+class BroadcastChannel:
+    """
+    对工作流伪装成一个 websocket (只实现 send_json)，把每条消息广播给所有订阅者。
+    某个订阅者断开不会影响任务本身和其他订阅者。
+    """
+
+    def __init__(self):
+        self.history = []
+        self.subscribers = []
+
+    async def send_json(self, message):
+        self.history.append(message)
+        for websocket in list(self.subscribers):
+            try:
+                await websocket.send_json(message)
+            except Exception:
+                self.unsubscribe(websocket)
+
+    async def subscribe(self, websocket, replay=True):
+        if replay:
+            # 逐条补发直到追上最新进度；循环结束与加入订阅之间没有 await，不会漏消息
+            sent = 0
+            while sent < len(self.history):
+                try:
+                    await websocket.send_json(self.history[sent])
+                except Exception:
+                    return
+                sent += 1
+        self.subscribers.append(websocket)
+
+    def unsubscribe(self, websocket):
+        if websocket in self.subscribers:
+            self.subscribers.remove(websocket)
+
+
+class SingleFlight:
+    """按键合并进行中的任务"""
+
+    def __init__(self):
+        self._inflight = {}
+
+    def is_inflight(self, key):
+        return key in self._inflight
+
+    def stats(self):
+        return {
+            key: {"subscribers": len(channel.subscribers), "events": len(channel.history)}
+            for key, (channel, _) in self._inflight.items()
+        }
+
+    async def run(self, key, websocket, workflow_factory, on_join=None):
+        """
+        key 相同的任务只执行一次 workflow_factory(channel)。
+        返回 True 表示本次是发起者，False 表示挂到了已有任务上。
+        """
+        leader = key not in self._inflight
+        if leader:
+            channel = BroadcastChannel()
+            task = asyncio.create_task(workflow_factory(channel))
+            self._inflight[key] = (channel, task)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            await channel.subscribe(websocket, replay=False)
+        else:
+            channel, task = self._inflight[key]
+            if on_join:
+                await on_join(websocket)
+            await channel.subscribe(websocket)
+
+        try:
+            # shield：某个连接断开/取消不会取消共享任务
+            await asyncio.shield(task)
+        finally:
+            channel.unsubscribe(websocket)
+        return leader
+
+
+request_coalescer = SingleFlight()
@@ -0,0 +1,158 @@
+# stage_memo.py
+"""
+MathSpace 阶段记忆与请求断点
+- 阶段记忆：意图识别、质检这类低温 (近似确定性) 的阶段，输入完全相同时直接复用上次输出，
+  键为 (阶段, 模型, 温度, 系统提示词, 用户输入) 的哈希，带有效期和条数上限；
+  查询走内存副本，定期从共享状态刷新 (其他 worker 写入的记忆稍后可见，漏掉一次命中只是多一次调用)
+- 请求断点：生成器 / 改进器的输出以及最后一次渲染失败的代码和错误按 (指令, 当前场景代码, 流水线档位) 保存，
+  渲染失败后重新提交同一指令时从最后完成的阶段继续 (有渲染错误时直接带着错误进入修复)，成功后删除
+两者都保存在共享状态后端 (键 "stage_memo" / "checkpoints")，多个 worker 共用。
+"""
+
+import json
+import time
+import hashlib
+from types import SimpleNamespace
+
+from config import (
+    STAGE_MEMO_STAGES, STAGE_MEMO_MAX_TEMPERATURE, STAGE_MEMO_TTL,
+    STAGE_MEMO_MAX_ENTRIES, STAGE_MEMO_MAX_CHARS, STAGE_MEMO_REFRESH_INTERVAL,
+    CHECKPOINT_ENABLED, CHECKPOINT_TTL, CHECKPOINT_MAX_ENTRIES
+)
+from state_backend import state
+
+
+def stable_hash(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def memoized_response(content):
+    """记忆命中时返回的响应：与 OpenAI 响应一样通过 choices[0].message.content 取内容，没有 usage"""
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def prune_entries(entries, ttl, max_entries, now, field="created"):
+    """删除过期条目，超出上限时按时间字段淘汰最早的"""
+    for key in [k for k, entry in entries.items() if now - entry[field] > ttl]:
+        entries.pop(key)
+    overflow = len(entries) - max_entries
+    if overflow > 0:
+        for key in sorted(entries, key=lambda k: entries[k][field])[:overflow]:
+            entries.pop(key)
+
+
+class StageMemo:
+    """低温阶段的输出记忆 (命中时不占调度名额、不产生费用)"""
+
+    def __init__(self, backend=state, state_key="stage_memo", stages=STAGE_MEMO_STAGES,
+                 max_temperature=STAGE_MEMO_MAX_TEMPERATURE, ttl=STAGE_MEMO_TTL,
+                 max_entries=STAGE_MEMO_MAX_ENTRIES, max_chars=STAGE_MEMO_MAX_CHARS,
+                 refresh_interval=STAGE_MEMO_REFRESH_INTERVAL):
+        self.backend = backend
+        self.state_key = state_key
+        self.stages = set(stages)
+        self.max_temperature = max_temperature
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.refresh_interval = refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = None  # 记忆文档的内存副本
+        self._loaded = 0.0
+
+    def _snapshot(self):
+        """记忆文档的内存副本，超过 refresh_interval 才重新读取共享状态"""
+        now = time.time()
+        if self._entries is None or now - self._loaded > self.refresh_interval:
+            self._entries = self.backend.get_json(self.state_key, {})
+            self._loaded = now
+        return self._entries
+
+    def reset(self):
+        """丢弃内存副本 (共享状态被清空后调用)"""
+        self._entries = None
+
+    def eligible(self, stage, temperature):
+        return stage in self.stages and temperature is not None and temperature <= self.max_temperature
+
+    def make_key(self, stage, model, temperature, messages):
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        user = "\n".join(m["content"] for m in messages if m["role"] != "system")
+        return stable_hash(stage, model, temperature, system, user)
+
+    def get(self, key):
+        """返回记忆的 {"content", "model", "created"}，不存在或已过期时返回 None"""
+        entry = self._snapshot().get(key)
+        if entry is None or time.time() - entry["created"] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, stage, model, content):
+        if not content or len(content) > self.max_chars:
+            return
+        now = time.time()
+        with self.backend.transaction(self.state_key, {}) as entries:
+            entries[key] = {"stage": stage, "model": model, "content": content, "created": now}
+            prune_entries(entries, self.ttl, self.max_entries, now)
+        # 事务里读到的就是最新的共享状态，顺便刷新内存副本
+        self._entries, self._loaded = entries, now
+
+    def stats(self):
+        entries = self._snapshot()
+        by_stage = {}
+        for entry in entries.values():
+            by_stage[entry["stage"]] = by_stage.get(entry["stage"], 0) + 1
+        return {"entries": by_stage, "hits": self.hits, "misses": self.misses}
+
+
+class CheckpointStore:
+    """
+    请求断点：{"created", "updated", "stages": {阶段: 输出}}
+    - generator: {"intent", "code", "edit_modes"}
+    - improver:  {"code", "critique", "edit_modes"}
+    - render:    {"code", "error"}  最后一次渲染失败的代码 (改进器或修复器的输出) 和错误
+    """
+
+    def __init__(self, backend=state, state_key="checkpoints", enabled=CHECKPOINT_ENABLED,
+                 ttl=CHECKPOINT_TTL, max_entries=CHECKPOINT_MAX_ENTRIES):
+        self.backend = backend
+        self.state_key = state_key
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def make_key(self, prompt, scene_code, profile):
+        return stable_hash(prompt.strip(), scene_code or "", profile)
+
+    def load(self, key):
+        """返回已完成阶段的输出 {阶段: 输出}，没有断点时返回空字典"""
+        if not self.enabled:
+            return {}
+        checkpoint = self.backend.get_json(self.state_key, {}).get(key)
+        if checkpoint is None or time.time() - checkpoint["updated"] > self.ttl:
+            return {}
+        return checkpoint["stages"]
+
+    def save(self, key, stage, output):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.backend.transaction(self.state_key, {}) as checkpoints:
+            checkpoint = checkpoints.setdefault(key, {"created": now, "stages": {}})
+            checkpoint["stages"][stage] = output
+            checkpoint["updated"] = now
+            prune_entries(checkpoints, self.ttl, self.max_entries, now, field="updated")
+
+    def discard(self, key):
+        if not self.enabled:
+            return
+        with self.backend.transaction(self.state_key, {}) as checkpoints:
+            checkpoints.pop(key, None)
+
+
+stage_memo = StageMemo()
+checkpoint_store = CheckpointStore()
@@ -0,0 +1,244 @@
+# state_backend.py
+"""
+MathSpace 共享状态后端
+缓存、对话记录、当前场景、视频仓库索引等全局状态统一通过这里读写，
+多个 worker / 多台机器可以共享同一份状态：
+- local:  本地文件 (单机多进程，靠文件锁保证原子更新)
+- sqlite: SQLite 数据库 (放在共享卷上即可多机共享)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+from config import STATE_BACKEND, STATE_DIR, STATE_SQLITE_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，退化为进程内锁
+    fcntl = None
+
+# 状态键 -> 本地文件名 (未列出的键使用 <key>.json)
+LOCAL_FILENAMES = {
+    "cache": "cache.json",
+    "conversation": "conversation.json",
+    "scene": "current_scene.py",
+    "artifacts": "artifacts.json",
+}
+
+
+class StateBackend:
+    """状态后端接口：文本读写 + 基于文本的 JSON 便捷方法 + 原子事务"""
+
+    def get_text(self, key, default=None):
+        raise NotImplementedError
+
+    def set_text(self, key, text):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def _exclusive(self, key):
+        """跨进程互斥，yield (读函数, 写函数)"""
+        raise NotImplementedError
+
+    def get_json(self, key, default=None):
+        text = self.get_text(key)
+        if text is None:
+            return default
+        try:
+            return json.loads(text)
+        except ValueError:
+            return default
+
+    def set_json(self, key, value):
+        self.set_text(key, json.dumps(value, ensure_ascii=False, indent=2))
+
+    @contextmanager
+    def transaction(self, key, default):
+        """
+        原子地读-改-写一个 JSON 文档：
+            with state.transaction("cache", {}) as cache:
+                cache[k] = v
+        块内抛出异常时不写回
+        """
+        with self._exclusive(key) as (read, write):
+            text = read()
+            try:
+                doc = json.loads(text) if text is not None else default
+            except ValueError:
+                doc = default
+            yield doc
+            write(json.dumps(doc, ensure_ascii=False, indent=2))
+
+
+class LocalFileBackend(StateBackend):
+    """每个键一个文件，写入走临时文件 + os.replace，更新时加文件锁"""
+
+    def __init__(self, root=STATE_DIR):
+        self.root = root
+        self._thread_lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.root, LOCAL_FILENAMES.get(key, f"{key}.json"))
+
+    def _read(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key, text):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def get_text(self, key, default=None):
+        text = self._read(key)
+        return default if text is None else text
+
+    def set_text(self, key, text):
+        with self._exclusive(key) as (_, write):
+            write(text)
+
+    def delete(self, key):
+        with self._exclusive(key):
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._thread_lock:
+            if not os.path.exists(self.root):
+                return
+            for filename in os.listdir(self.root):
+                if filename.endswith(".lock"):
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _exclusive(self, key):
+        with self._thread_lock:
+            os.makedirs(self.root, exist_ok=True)
+            if fcntl is None:
+                yield (lambda: self._read(key), lambda text: self._write(key, text))
+                return
+            with open(f"{self.path_for(key)}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield (lambda: self._read(key), lambda text: self._write(key, text))
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLiteBackend(StateBackend):
+    """
+    键值表存放在 SQLite 中，事务使用 BEGIN IMMEDIATE 串行化写入。
+    多机共享时把数据库放在共享卷上 (注意：部分 NFS 的文件锁不可靠)。
+    """
+
+    def __init__(self, path=STATE_SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # sqlite3 连接的 with 只管事务，不会关闭连接
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def get_text(self, key, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else default
+        finally:
+            conn.close()
+
+    def set_text(self, key, text):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                (key, text, time.time())
+            )
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM kv")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _exclusive(self, key):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            def read():
+                row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                return row[0] if row else None
+
+            def write(text):
+                conn.execute(
+                    "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                    (key, text, time.time())
+                )
+
+            try:
+                yield (read, write)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+
+def create_state_backend(kind=STATE_BACKEND):
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "local":
+        return LocalFileBackend()
+    raise ValueError(f"未知的状态后端: {kind}")
+
+
+state = create_state_backend()
@@ -16,8 +16,13 @@ let isManualTheme = false;
 let scene, camera, renderer, particles;
 let clock = new THREE.Clock();
 
-// WebSocket 连接变量
+// WebSocket 连接变量 (一条长连接复用所有任务，断线后自动重连并恢复任务)
 let ws = null;
+let wsReady = null;
+let reconnectDelay = 1000;
+// 进行中的任务: job_id -> { cursor, sessionId }；存在 localStorage，刷新页面后也能恢复
+let activeJobs = JSON.parse(localStorage.getItem('activeJobs')) || {};
+let pendingSubmits = {}; // client_ref -> 提交时所在的会话
 
 document.addEventListener('DOMContentLoaded', () => {
     console.log("🚀 MathSpace 视觉引擎增强版启动!");
@@ -32,10 +37,149 @@ document.addEventListener('DOMContentLoaded', () => {
     initCustomCursor(); 
     initMathParticleScene(); // 启动增强版背景
     
+    // 上次离开时还有未完成的任务：重连并继续接收进度
+    if (Object.keys(activeJobs).length > 0) {
+        showLoading("正在恢复进行中的任务");
+        connectSocket().catch(() => {});
+    }
+    
     if(window.marked) window.marked.setOptions({ breaks: true, gfm: true });
 });
 
 // === 1. WebSocket 发送消息逻辑 (带动画优化) ===
+function showLoading(text) {
+    const loading = document.getElementById('loading');
+    const loadingText = loading.querySelector('span');
+    loading.style.display = 'block';
+    // ✨【视觉优化】加上呼吸灯和动态省略号的 class
+    loadingText.className = 'breathing-text animated-dots';
+    loadingText.innerText = text; // 省略号交给 CSS 动画处理
+}
+
+function hideLoading() {
+    // 还有其他任务在跑时保持显示
+    if (Object.keys(activeJobs).length === 0 && Object.keys(pendingSubmits).length === 0) {
+        document.getElementById('loading').style.display = 'none';
+    }
+}
+
+function saveActiveJobs() {
+    localStorage.setItem('activeJobs', JSON.stringify(activeJobs));
+}
+
+function connectSocket() {
+    if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) return wsReady;
+
+    // 自动判断是 ws 还是 wss (安全连接)
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const wsUrl = `${protocol}//${window.location.host}/ws/chat`;
+    const socket = new WebSocket(wsUrl);
+    ws = socket;
+
+    wsReady = new Promise((resolve, reject) => {
+        socket.onopen = () => {
+            console.log("🔌 已连接到神经网络");
+            reconnectDelay = 1000;
+            // 恢复所有未完成的任务：从上次收到的事件之后继续
+            Object.entries(activeJobs).forEach(([jobId, job]) => {
+                socket.send(JSON.stringify({ type: 'resume', job_id: jobId, cursor: job.cursor }));
+            });
+            resolve(socket);
+        };
+        socket.onerror = (error) => {
+            console.error("WS Error:", error);
+            reject(error);
+        };
+    });
+
+    socket.onmessage = (event) => handleSocketMessage(JSON.parse(event.data));
+
+    socket.onclose = () => {
+        console.log("🔌 连接已关闭");
+        if (ws === socket) ws = null;
+        // 任务在服务端继续运行，断线后自动重连补齐进度
+        if (Object.keys(activeJobs).length > 0) {
+            showLoading("连接中断，正在重连");
+            setTimeout(() => connectSocket().catch(() => {}), reconnectDelay);
+            reconnectDelay = Math.min(reconnectDelay * 2, 15000);
+        }
+    };
+    return wsReady;
+}
+
+function displayJobMessage(job, role, content, shouldSave) {
+    // 结果属于提交时的会话；用户已切到其他会话时只保存不显示
+    if (!job.sessionId || job.sessionId === currentSessionId) {
+        displayMessage(role, content, shouldSave);
+    } else if (shouldSave) {
+        const s = chatSessions.find(x => x.id === job.sessionId);
+        if (s) { s.messages.push({ role, content }); saveData(); }
+    }
+}
+
+function finishJob(jobId) {
+    delete activeJobs[jobId];
+    saveActiveJobs();
+    hideLoading();
+}
+
+function handleSocketMessage(data) {
+    if (data.type === 'pong') return;
+
+    if (data.type === 'job') {
+        // 任务受理回执
+        activeJobs[data.job_id] = { cursor: 0, sessionId: pendingSubmits[data.client_ref] || currentSessionId };
+        delete pendingSubmits[data.client_ref];
+        saveActiveJobs();
+        return;
+    }
+
+    const job = activeJobs[data.job_id];
+    if (!job) return; // 已经处理完的任务 (重连补发的重复事件)
+    if (data.seq) {
+        if (data.seq <= job.cursor) return;
+        job.cursor = data.seq;
+        saveActiveJobs();
+    }
+
+    if (data.type === 'progress') {
+        // ✨ 实时更新进度条文字
+        // data.step 是步骤名，data.message 是中文描述
+        // 去掉后端可能自带的省略号，保证样式统一
+        const cleanMessage = data.message.replace(/\.\.\.$/, '');
+        showLoading(`[${data.step}] ${cleanMessage}`);
+    }
+    else if (data.type === 'result') {
+        // 🎉 成功收到结果
+        finishJob(data.job_id);
+        if (data.status === 'success') {
+            const cacheTag = data.cached ? '<span style="color:#f59e0b;font-size:10px;margin-left:5px;">⚡ 秒速缓存</span>' : '';
+            // 转码版本按体积从小到大排列，浏览器挑第一个能播放的，原始 MP4 兜底
+            const sources = (data.formats || [])
+                .filter(f => f.mime.startsWith('video/'))
+                .map(f => `<source src="${f.url}" type="${f.mime}">`)
+                .join('');
+            const videoHTML = `
+                <div class="video-container">
+                    <video controls autoplay loop playsinline>
+                        ${sources}
+                        <source src="${data.video}" type="video/mp4">
+                    </video>
+                    <div class="video-info">
+                        <span>DeepSeek V3 ${cacheTag}</span>
+                        <span>ManimGL</span>
+                    </div>
+                </div>`;
+            displayJobMessage(job, 'bot', videoHTML, true);
+        }
+    }
+    else if (data.type === 'error') {
+        // ❌ 报错
+        finishJob(data.job_id);
+        displayJobMessage(job, 'bot', `⚠️ 错误: ${data.message}\n详情: ${data.details || ''}`, false);
+    }
+}
+
 function sendMessage() {
     console.log("📨 准备发送消息...");
     
@@ -51,78 +195,21 @@ function sendMessage() {
     input.value = '';
     
     // 显示 Loading 状态
-    const loading = document.getElementById('loading');
-    const loadingText = loading.querySelector('span'); 
-    loading.style.display = 'block';
-    
-    // ✨【视觉优化】加上呼吸灯和动态省略号的 class
-    loadingText.className = 'breathing-text animated-dots'; 
-    loadingText.innerText = "正在连接大脑"; // 省略号交给 CSS 动画处理
-    
+    showLoading("正在连接大脑");
     scrollToBottom();
 
-    // 建立 WebSocket 连接
-    // 自动判断是 ws 还是 wss (安全连接)
-    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws/chat`;
-    
-    // 如果已有连接，先断开
-    if (ws) ws.close();
-    
-    ws = new WebSocket(wsUrl);
-
-    ws.onopen = () => {
-        console.log("🔌 已连接到神经网络");
-        // 连接建立后，立即发送指令
-        ws.send(JSON.stringify({ prompt: message }));
-    };
-
-    ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        
-        if (data.type === 'progress') {
-            // ✨ 实时更新进度条文字
-            // data.step 是步骤名，data.message 是中文描述
-            // 去掉后端可能自带的省略号，保证样式统一
-            const cleanMessage = data.message.replace(/\.\.\.$/, '');
-            loadingText.innerText = `[${data.step}] ${cleanMessage}`;
-        } 
-        else if (data.type === 'result') {
-            // 🎉 成功收到结果
-            loading.style.display = 'none';
-            if (data.status === 'success') {
-                const cacheTag = data.cached ? '<span style="color:#f59e0b;font-size:10px;margin-left:5px;">⚡ 秒速缓存</span>' : '';
-                const videoHTML = `
-                    <div class="video-container">
-                        <video controls autoplay loop playsinline>
-                            <source src="${data.video}" type="video/mp4">
-                        </video>
-                        <div class="video-info">
-                            <span>DeepSeek V3 ${cacheTag}</span>
-                            <span>ManimGL</span>
-                        </div>
-                    </div>`;
-                displayMessage('bot', videoHTML, true);
-            }
-            ws.close(); // 任务完成，挂断电话
-        } 
-        else if (data.type === 'error') {
-            // ❌ 报错
-            loading.style.display = 'none';
-            displayMessage('bot', `⚠️ 错误: ${data.message}\n详情: ${data.details || ''}`, false);
-            ws.close();
-        }
-    };
-
-    ws.onerror = (error) => {
-        console.error("WS Error:", error);
-        loading.style.display = 'none';
-        displayMessage('bot', `网络连接断开，请重试`, false);
-    };
-    
-    ws.onclose = () => {
-        console.log("🔌 连接已关闭");
-    };
+    // 复用长连接提交任务；client_ref 用来把受理回执对应回提交时的会话
+    const clientRef = Date.now().toString(36) + Math.random().toString(36).slice(2, 6);
+    pendingSubmits[clientRef] = currentSessionId;
+    connectSocket()
+        .then(socket => socket.send(JSON.stringify({
+            type: 'submit', prompt: message, session_id: currentSessionId, client_ref: clientRef
+        })))
+        .catch(() => {
+            delete pendingSubmits[clientRef];
+            hideLoading();
+            displayMessage('bot', `网络连接断开，请重试`, false);
+        });
 }
 
 // === 2. 语音输入逻辑 (智能自动发送版) ===
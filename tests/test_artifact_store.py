@@ -0,0 +1,132 @@
+# tests/test_artifact_store.py
+"""视频仓库：去重、配额内的 LRU 淘汰、缓存引用不受保留期限影响、复制退化的占用计算、对账收录旧视频"""
+
+import os
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+import artifact_store as store_module
+from artifact_store import ArtifactStore
+from state_backend import LocalFileBackend
+
+SIZE = 1000
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(store_module, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def make_store(tmp_path, **kwargs):
+    options = {"quota_bytes": 0, "max_age_seconds": 0, "access_flush_interval": 3600, **kwargs}
+    return ArtifactStore(public_dir=str(tmp_path / "static"), blob_dir=str(tmp_path / "blobs"),
+                         backend=LocalFileBackend(str(tmp_path / "state")), **options)
+
+
+def write_video(tmp_path, filename, content):
+    path = tmp_path / filename
+    path.write_bytes(content.ljust(SIZE, b"\0"))
+    return str(path)
+
+
+def public(store, name):
+    return os.path.join(store.public_dir, name)
+
+
+def test_identical_content_is_stored_once(tmp_path, clock):
+    store = make_store(tmp_path)
+    sha_a = store.ingest(write_video(tmp_path, "a.mp4", b"same"), "video_a.mp4")
+    sha_b = store.ingest(write_video(tmp_path, "b.mp4", b"same"), "video_b.mp4")
+
+    assert sha_a == sha_b
+    assert store.stats() == {"videos": 2, "unique_blobs": 1, "usage_bytes": SIZE, "quota_bytes": 0}
+    assert os.path.samefile(public(store, "video_a.mp4"), public(store, "video_b.mp4"))
+    assert not os.path.exists(tmp_path / "b.mp4")
+
+
+def test_quota_evicts_least_recently_used(tmp_path, clock):
+    store = make_store(tmp_path, quota_bytes=int(SIZE * 2.5))
+    evicted = []
+    store.add_evict_listener(evicted.extend)
+    store.ingest(write_video(tmp_path, "a.mp4", b"a"), "video_a.mp4")
+    clock.now += 10
+    store.ingest(write_video(tmp_path, "b.mp4", b"b"), "video_b.mp4")
+    clock.now += 10
+    assert store.touch("video_a.mp4")
+    clock.now += 10
+    store.ingest(write_video(tmp_path, "c.mp4", b"c"), "video_c.mp4")
+
+    assert evicted == ["video_b.mp4"]
+    assert not os.path.exists(public(store, "video_b.mp4"))
+    assert store.get_hash("video_a.mp4") and store.get_hash("video_c.mp4")
+
+
+def test_referenced_video_survives_age_eviction(tmp_path, clock):
+    store = make_store(tmp_path, max_age_seconds=100)
+    store.ingest(write_video(tmp_path, "a.mp4", b"a"), "video_a.mp4")
+    store.ingest(write_video(tmp_path, "b.mp4", b"b"), "video_b.mp4")
+    assert store.add_ref("video_a.mp4", "cache:a")
+    clock.now += 1000
+
+    assert store.enforce() == ["video_b.mp4"]
+    assert os.path.exists(public(store, "video_a.mp4"))
+
+    store.remove_ref("video_a.mp4", "cache:a")
+    assert store.enforce() == ["video_a.mp4"]
+
+
+def test_copy_fallback_counts_each_copy(tmp_path, clock, monkeypatch):
+    def no_hardlinks(src, dst):
+        raise OSError("hard links not supported")
+
+    monkeypatch.setattr(store_module.os, "link", no_hardlinks)
+    store = make_store(tmp_path)
+    store.ingest(write_video(tmp_path, "a.mp4", b"same"), "video_a.mp4")
+    store.ingest(write_video(tmp_path, "b.mp4", b"same"), "video_b.mp4")
+
+    assert store.stats()["unique_blobs"] == 1
+    assert store.stats()["usage_bytes"] == 3 * SIZE
+    assert not os.path.samefile(public(store, "video_a.mp4"), public(store, "video_b.mp4"))
+
+
+def test_reconcile_adopts_stray_videos(tmp_path, clock):
+    store = make_store(tmp_path)
+    os.makedirs(store.public_dir)
+    stray = write_video(tmp_path / "static", "video_old.mp4", b"old")
+    with open(stray, "rb") as f:
+        expected_sha = hashlib.sha256(f.read()).hexdigest()
+
+    store.reconcile()
+
+    assert store.get_hash("video_old.mp4") == expected_sha
+    assert os.path.exists(os.path.join(store.blob_dir, f"{expected_sha}.mp4"))
+    assert os.path.exists(stray)
+    assert store.stats()["videos"] == 1
+
+
+def test_touch_reads_the_index_only_for_unknown_names(tmp_path, clock, monkeypatch):
+    store = make_store(tmp_path)
+    store.ingest(write_video(tmp_path, "a.mp4", b"a"), "video_a.mp4")
+    loads = []
+    original = store._load_index
+    monkeypatch.setattr(store, "_load_index", lambda: loads.append(1) or original())
+
+    for _ in range(5):
+        assert store.touch("video_a.mp4")
+    assert not store.touch("video_missing.mp4")
+    assert len(loads) == 1
+
+    os.remove(public(store, "video_a.mp4"))
+    assert not store.touch("video_a.mp4")
@@ -0,0 +1,144 @@
+# tests/test_code_analysis.py
+"""单次遍历的场景分析器：与原先 ast.walk + 正则实现的结果对比，以及语法错误、静态检查"""
+
+import ast
+
+import pytest
+
+from code_analysis import CodeAnalyzer
+from llm_parsing import extract_objects_from_code
+
+GRAPH_SCENE = """from manim import *
+import numpy as np
+
+
+class MainScene(Scene):
+    def construct(self):
+        axes = Axes(x_range=[-3, 3], y_range=[-1, 9])
+        graph = axes.plot(lambda x: x ** 2, color=BLUE)
+        label = MathTex("y = x^2").next_to(graph, UP)
+        self.play(Create(axes), run_time=1.5)
+        self.play(Create(graph), Write(label))
+        dot = Dot(axes.c2p(1, 1))
+        self.add(dot)
+        self.play(dot.animate.shift(RIGHT))
+        self.wait(1)
+"""
+
+THREE_D_SCENE = """from manim import *
+
+
+class CubeScene(ThreeDScene):
+    def construct(self):
+        self.set_camera_orientation(phi=75 * DEGREES, theta=30 * DEGREES)
+        axes = ThreeDAxes()
+        cube = Cube(side_length=2)
+        sphere = Sphere(radius=0.5).shift(UP * 2)
+        self.add(axes)
+        self.play(Create(cube), FadeIn(sphere))
+        self.play(Rotate(cube, angle=PI / 2))
+"""
+
+HELPER_SCENE = """from manim import *
+import math
+
+
+class MainScene(MovingCameraScene):
+    def make_label(self, text):
+        return Text(text, font_size=24)
+
+    def construct(self):
+        title = self.make_label("圆与方")
+        circle = Circle(radius=1)
+        square = Square().next_to(circle, RIGHT)
+        group = VGroup(circle, square)
+        for i in range(3):
+            self.play(FadeIn(title), Transform(circle, square))
+        self.play(FadeOut(group))
+"""
+
+BROKEN_SCENE = """from manim import *
+
+class MainScene(Scene):
+    def construct(self):
+        circle = Circle(
+        self.play(Create(circle))
+"""
+
+SCENES = [GRAPH_SCENE, THREE_D_SCENE, HELPER_SCENE]
+
+
+def legacy_analyze(code):
+    """原先 main.analyze_code_structure 的实现 (ast.walk 多次判断)，作为对比基准"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return {"error": "代码解析失败"}
+    analysis = {"scene_class": None, "methods": [], "variables": [], "has_axes": False}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef):
+            base_ids = [base.id for base in node.bases if hasattr(base, "id")]
+            if any(b in ["Scene", "ThreeDScene", "MovingCameraScene", "ZoomedScene", "LinearTransformationScene"]
+                   for b in base_ids):
+                analysis["scene_class"] = node.name
+        elif isinstance(node, ast.FunctionDef):
+            analysis["methods"].append(node.name)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    analysis["variables"].append(target.id)
+        elif isinstance(node, ast.Call):
+            if hasattr(node.func, "id") and node.func.id in ["Axes", "ThreeDAxes", "NumberPlane"]:
+                analysis["has_axes"] = True
+    return analysis
+
+
+@pytest.mark.parametrize("code", SCENES)
+def test_matches_legacy_analysis(code):
+    expected = legacy_analyze(code)
+    result = CodeAnalyzer().analyze(code)
+
+    assert result["scene_class"] == expected["scene_class"]
+    assert result["has_axes"] == expected["has_axes"]
+    # ast.walk 是广度优先，新实现按源码顺序，只比较内容
+    assert sorted(result["methods"]) == sorted(expected["methods"])
+    assert sorted(result["variables"]) == sorted(expected["variables"])
+
+
+@pytest.mark.parametrize("code", SCENES)
+def test_objects_cover_the_regex_scanner(code):
+    # 正则会把 RIGHT 之类的方向常量当成对象，新实现不再误报
+    legacy = {name for name in extract_objects_from_code(code) if not name.isupper()}
+    assert legacy <= set(CodeAnalyzer().objects(code))
+
+
+def test_graph_scene_details():
+    result = CodeAnalyzer().analyze(GRAPH_SCENE)
+    assert result["axes"] == ["axes"]
+    assert {"name": "graph", "type": "axes.plot", "line": 8} in result["mobjects"]
+    assert result["plays"][0] == {"line": 10, "animations": ["Create"], "targets": ["axes"], "run_time": 1.5}
+    assert result["plays"][2]["animations"] == ["animate.shift"]
+    assert result["animations"] == ["Create", "Create", "Write", "animate.shift"]
+    assert result["objects"] == ["axes", "graph", "label", "dot"]
+
+
+def test_syntax_error_falls_back():
+    analyzer = CodeAnalyzer()
+    assert analyzer.analyze(BROKEN_SCENE) == legacy_analyze(BROKEN_SCENE) == {"error": "代码解析失败"}
+    assert analyzer.objects(BROKEN_SCENE) == extract_objects_from_code(BROKEN_SCENE)
+    assert analyzer.lint(BROKEN_SCENE)[0].startswith("语法错误")
+
+
+def test_results_are_cached_by_source():
+    analyzer = CodeAnalyzer()
+    assert analyzer.analyze(GRAPH_SCENE) is analyzer.analyze(GRAPH_SCENE)
+
+
+def test_lint_flags_common_mistakes():
+    code = "import numpy as np\n\nclass Demo:\n    def construct(self):\n        MathTex('面积')\n        math.sqrt(2)\n"
+    problems = CodeAnalyzer().lint(code)
+    assert "没有找到 Scene 子类" in problems
+    assert "缺少 from manim import *" in problems
+    assert "使用了 math 但没有 import math" in problems
+    assert any("MathTex 中包含中文" in p for p in problems)
+    assert CodeAnalyzer().lint(GRAPH_SCENE) == []
@@ -0,0 +1,89 @@
+# tests/test_code_edit.py
+"""增量编辑：合法补丁能应用，定位不到的补丁被拒绝，空补丁对生成器算失败、对改进器算无需改动"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from code_edit import apply_llm_patch, apply_unified_diff, PatchError, EmptyPatch
+
+SCENE = """from manim import *
+
+
+class MainScene(Scene):
+    def construct(self):
+        circle = Circle(color=BLUE)
+        self.play(Create(circle))
+        self.wait(1)
+"""
+
+COLOR_PATCH = """```diff
+--- a/current_scene.py
++++ b/current_scene.py
+@@ -6,3 +6,3 @@
+     def construct(self):
+-        circle = Circle(color=BLUE)
++        circle = Circle(color=RED)
+         self.play(Create(circle))
+```"""
+
+EMPTY_PATCH = """```diff
+--- a/current_scene.py
++++ b/current_scene.py
+@@ -6,2 +6,2 @@
+     def construct(self):
+         circle = Circle(color=BLUE)
+```"""
+
+
+def test_valid_patch_applies():
+    new_code = apply_llm_patch(SCENE, COLOR_PATCH)
+    assert "Circle(color=RED)" in new_code
+    assert "Circle(color=BLUE)" not in new_code
+    assert new_code.endswith("\n")
+
+
+def test_patch_tolerates_shifted_line_numbers():
+    shifted = COLOR_PATCH.replace("@@ -6,3 +6,3 @@", "@@ -40,3 +40,3 @@")
+    assert "Circle(color=RED)" in apply_llm_patch(SCENE, shifted)
+
+
+def test_mismatched_anchor_is_rejected():
+    patch = COLOR_PATCH.replace("self.play(Create(circle))", "self.play(FadeIn(square))")
+    with pytest.raises(PatchError, match="无法在当前代码中定位补丁"):
+        apply_llm_patch(SCENE, patch)
+
+
+def test_patch_producing_invalid_code_is_rejected():
+    patch = COLOR_PATCH.replace("Circle(color=RED)", "Circle(color=RED")
+    with pytest.raises(PatchError, match="语法错误"):
+        apply_llm_patch(SCENE, patch)
+
+
+def test_empty_patch_raises_empty_patch():
+    with pytest.raises(EmptyPatch):
+        apply_unified_diff(SCENE, EMPTY_PATCH)
+
+
+def run_request_code_patch(monkeypatch, reply, stage, allow_empty):
+    async def fake_call_llm(sched, call_stage, messages, temperature=None):
+        assert sched["edit_mode"] and call_stage == stage
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    monkeypatch.setattr(main, "call_llm", fake_call_llm)
+    return asyncio.run(main.request_code_patch("test", {}, stage, "system", "input", SCENE,
+                                               allow_empty=allow_empty))
+
+
+def test_empty_patch_fails_the_generator_edit(monkeypatch):
+    assert run_request_code_patch(monkeypatch, EMPTY_PATCH, "generator", allow_empty=False) is None
+
+
+def test_empty_patch_keeps_the_draft_for_the_improver(monkeypatch):
+    assert run_request_code_patch(monkeypatch, EMPTY_PATCH, "improver", allow_empty=True) == SCENE
+
+
+def test_unusable_patch_falls_back_to_rewrite(monkeypatch):
+    assert run_request_code_patch(monkeypatch, "没有 diff", "improver", allow_empty=True) is None
@@ -0,0 +1,122 @@
+# tests/test_job_registry.py
+"""可恢复任务：按 cursor 补发事件、客户端 cursor 的容错解析、已结束任务的保留与过期"""
+
+import asyncio
+from collections import deque
+
+import pytest
+
+import job_registry as registry_module
+from job_registry import Job, JobRegistry
+from main import parse_cursor
+from state_backend import LocalFileBackend
+
+
+class FakeSubscriber:
+    def __init__(self):
+        self.jobs = set()
+        self.received = []
+
+    async def send_json(self, message):
+        self.received.append(message)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return JobRegistry(backend=LocalFileBackend(str(tmp_path)))
+
+
+def test_resume_replays_events_after_cursor():
+    async def main():
+        job = Job("job_test", "画一个圆", "s1")
+        for step in ("init", "intent", "generator"):
+            await job.send_json({"type": "progress", "step": step})
+
+        subscriber = FakeSubscriber()
+        await job.subscribe(subscriber, cursor=1)
+        await job.send_json({"type": "result", "status": "success"})
+        return job, subscriber
+
+    job, subscriber = asyncio.run(main())
+    assert [e["seq"] for e in subscriber.received] == [2, 3, 4]
+    assert {e["job_id"] for e in subscriber.received} == {"job_test"}
+    assert job.status == "done" and job.finished is not None
+
+
+def test_events_after_reports_truncation():
+    async def main():
+        job = Job("job_test", "p", "s1")
+        job.events = deque(maxlen=3)
+        for i in range(5):
+            await job.send_json({"type": "progress", "step": str(i)})
+        return job
+
+    job = asyncio.run(main())
+    events, truncated = job.events_after(0)
+    assert [e["seq"] for e in events] == [3, 4, 5] and truncated
+    events, truncated = job.events_after(2)
+    assert [e["seq"] for e in events] == [3, 4, 5] and not truncated
+    assert job.events_after(5) == ([], False)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (7, 7), ("12", 12), (None, 0), ("abc", 0), ("1.5", 0), (-4, 0), (float("inf"), 0), ({"seq": 1}, 0),
+])
+def test_parse_cursor(value, expected):
+    assert parse_cursor(value) == expected
+
+
+def test_finished_jobs_are_persisted_and_expire_from_memory(registry, monkeypatch):
+    async def runner(job):
+        await job.send_json({"type": "result", "status": "success"})
+
+    async def main():
+        job = registry.create("画一个圆", "s1", runner)
+        await job.task
+        return job
+
+    job = asyncio.run(main())
+    record = registry.load_record(job.job_id)
+    assert record["status"] == "done" and record["events"][-1]["seq"] == 1
+
+    monkeypatch.setattr(registry_module, "JOB_RETENTION_SECONDS", 60)
+    job.finished -= 120
+    registry._prune()
+    assert registry.get(job.job_id) is None
+    assert registry.load_record(job.job_id)["status"] == "done"
+
+
+def test_history_limit_drops_the_oldest_records(registry, monkeypatch):
+    monkeypatch.setattr(registry_module, "JOB_HISTORY_LIMIT", 2)
+
+    async def runner(job):
+        await job.send_json({"type": "result", "status": "success"})
+
+    async def main():
+        jobs = []
+        for prompt in ("a", "b", "c"):
+            job = registry.create(prompt, "s1", runner)
+            await job.task
+            jobs.append(job)
+        return jobs
+
+    first, second, third = asyncio.run(main())
+    assert registry.load_record(first.job_id) is None
+    assert registry.load_record(second.job_id) and registry.load_record(third.job_id)
+
+
+def test_cancelled_job_ends_as_error(registry):
+    async def runner(job):
+        await job.send_json({"type": "progress", "step": "render"})
+        await asyncio.sleep(3600)
+
+    async def main():
+        job = registry.create("p", "s1", runner)
+        await asyncio.sleep(0)
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == "error"
+    assert registry.load_record(job.job_id)["status"] == "error"
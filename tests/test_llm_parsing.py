@@ -0,0 +1,100 @@
+# tests/test_llm_parsing.py
+"""LLM 回复解析：代码块、没有围栏的回复、被截断的回复、JSON 提取、合并质检的结构化输出"""
+
+import pytest
+
+from llm_parsing import (
+    iter_fenced_blocks, extract_code_from_markdown, extract_json_from_response, extract_objects_from_code,
+    extract_review_from_response
+)
+
+
+def test_fenced_blocks_are_yielded_in_order():
+    text = "说明\n```python\nprint(1)\n```\n中间\n```\nplain\n```\n```diff\n@@ -1 +1 @@\n```"
+    assert list(iter_fenced_blocks(text)) == [
+        ("python", "print(1)\n"),
+        ("", "plain\n"),
+        ("diff", "@@ -1 +1 @@\n"),
+    ]
+
+
+def test_python_block_is_preferred_over_the_first_block():
+    text = "```text\n不是代码\n```\n```python\nx = 1\n```"
+    assert extract_code_from_markdown(text) == "x = 1"
+
+
+def test_untagged_block_with_python_first_line():
+    assert extract_code_from_markdown("```\npython\nx = 1\n```") == "x = 1"
+
+
+def test_missing_fences():
+    assert extract_code_from_markdown("x = 1\ny = 2\n") == "x = 1\ny = 2"
+    assert extract_code_from_markdown("结果：<code>x = 1</code>") == "x = 1"
+
+
+def test_truncated_block_runs_to_the_end():
+    text = "```python\nfrom manim import *\nclass MainScene(Scene):\n    def construct(self):\n        self.wa"
+    assert list(iter_fenced_blocks(text))[-1][0] == "python"
+    assert extract_code_from_markdown(text).endswith("self.wa")
+
+
+def test_json_is_found_around_prose_and_nested_braces():
+    text = '意图如下：{"intent": "MODIFY", "detail": {"target": "circle"}, "note": "含 } 的字符串"} 完毕'
+    assert extract_json_from_response(text) == {
+        "intent": "MODIFY", "detail": {"target": "circle"}, "note": "含 } 的字符串"
+    }
+
+
+def test_truncated_json_returns_none():
+    assert extract_json_from_response('{"intent": "MODIFY", "reason": "被截') is None
+    assert extract_json_from_response("没有 JSON") is None
+
+
+def test_objects_from_code():
+    code = (
+        "class MainScene(Scene):\n"
+        "    def construct(self):\n"
+        "        title = Text('标题')\n"
+        "        circle = Circle()\n"
+        "        self.add(title)\n"
+        "        self.play(Create(circle), FadeIn(square, shift=UP), run_time=2)\n"
+    )
+    assert extract_objects_from_code(code) == ["title", "circle", "square"]
+
+
+def test_review_with_rating_issues_and_code():
+    text = r'{"rating": "fail", "issues": ["MathTex 中有中文", "缺少 import math"], "code": "x = 1\n"}'
+    assert extract_review_from_response(text) == {
+        "rating": "FAIL", "issues": ["MathTex 中有中文", "缺少 import math"], "code": "x = 1"
+    }
+
+
+def test_review_without_review_fields_defaults_to_warn():
+    review = extract_review_from_response('好的：{"code": "```python\nx = 1\n```"}')
+    assert review == {"rating": "WARN", "issues": [], "code": "x = 1"}
+
+
+def test_review_with_unknown_rating_and_single_issue():
+    review = extract_review_from_response('{"rating": "GOOD", "issues": "文字重叠", "code": "x = 1"}')
+    assert review["rating"] == "WARN" and review["issues"] == ["文字重叠"]
+
+
+def test_review_allows_unescaped_newlines_in_code():
+    # 模型常在 JSON 字符串里直接换行
+    review = extract_review_from_response('{"rating": "PASS", "issues": [], "code": "x = 1\ny = 2"}')
+    assert review["code"] == "x = 1\ny = 2"
+
+
+@pytest.mark.parametrize("text", [
+    '{"rating": "PASS", "issues": []}',
+    '{"rating": "PASS", "issues": [], "code": "   "}',
+    '{"rating": "PASS", "issues": [], "code": "x = 1',
+    "```python\nx = 1\n```",
+])
+def test_review_without_code_returns_none(text):
+    assert extract_review_from_response(text) is None
+
+
+def test_review_skips_objects_without_code():
+    text = '先说明 {"note": "思路"}，结果 {"rating": "PASS", "issues": [], "code": "x = 1"}'
+    assert extract_review_from_response(text)["code"] == "x = 1"
@@ -0,0 +1,85 @@
+# tests/test_llm_router.py
+"""模型路由：超过 SLO 切换备选并补记被放弃调用的用量，输出被截断时放大 max_tokens 重试一次"""
+
+import asyncio
+from types import SimpleNamespace
+
+from config import LLM_LENGTH_RETRY_MAX_TOKENS
+from llm_router import ModelRouter
+
+ENDPOINTS = {"a": {"base_url": "http://a", "api_key": "x"}, "b": {"base_url": "http://b", "api_key": "x"}}
+
+
+def fake_response(content, finish_reason="stop"):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content),
+                                                    finish_reason=finish_reason)])
+
+
+class FakeClient:
+    """只实现 chat.completions.create：按顺序返回 replies 中的 (延迟秒数, 回复)"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        delay, response = self.replies.pop(0)
+        await asyncio.sleep(delay)
+        return response
+
+
+def make_router(candidates, max_tokens=100, slo=0.05, **clients):
+    router = ModelRouter(endpoints=ENDPOINTS, routes={
+        "generator": {"candidates": candidates, "temperature": 0.5, "max_tokens": max_tokens, "slo": slo},
+    })
+    router.clients.update(clients)
+    return router
+
+
+def test_stalled_candidate_fails_over_and_is_billed_later():
+    slow = FakeClient((0.3, fake_response("slow")))
+    fast = FakeClient((0, fake_response("fast")))
+    router = make_router([("a", "slow-model"), ("b", "fast-model")], a=slow, b=fast)
+    abandoned = []
+
+    async def main():
+        result = await router.complete("generator", [], on_abandoned=lambda m, r: abandoned.append((m, r)))
+        assert abandoned == []
+        await asyncio.sleep(0.4)
+        return result
+
+    response, model = asyncio.run(main())
+    assert model == "fast-model" and response.choices[0].message.content == "fast"
+    assert [(m, r.choices[0].message.content) for m, r in abandoned] == [("slow-model", "slow")]
+    assert not router._abandoned
+    # 刚超时的候选进入冷却，下一次排到备选后面
+    assert router.route("generator")[0] == ("b", "fast-model")
+
+
+def test_last_candidate_is_not_cut_by_the_slo():
+    slow = FakeClient((0.1, fake_response("slow")))
+    router = make_router([("a", "only-model")], a=slow)
+    response, model = asyncio.run(router.complete("generator", []))
+    assert model == "only-model" and response.choices[0].message.content == "slow"
+
+
+def test_truncated_output_is_retried_with_more_tokens():
+    client = FakeClient((0, fake_response("半截", "length")), (0, fake_response("完整")))
+    router = make_router([("a", "model")], a=client)
+    abandoned = []
+
+    response, _ = asyncio.run(router.complete("generator", [], on_abandoned=lambda m, r: abandoned.append(r)))
+    assert response.choices[0].message.content == "完整"
+    assert [call["max_tokens"] for call in client.calls] == [100, 200]
+    # 被截断的那次调用同样计费
+    assert [r.choices[0].message.content for r in abandoned] == ["半截"]
+
+
+def test_truncated_output_at_the_cap_is_returned_as_is():
+    client = FakeClient((0, fake_response("半截", "length")))
+    router = make_router([("a", "model")], max_tokens=LLM_LENGTH_RETRY_MAX_TOKENS, a=client)
+    response, _ = asyncio.run(router.complete("generator", []))
+    assert response.choices[0].finish_reason == "length"
+    assert len(client.calls) == 1
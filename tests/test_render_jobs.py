@@ -0,0 +1,100 @@
+# tests/test_render_jobs.py
+"""分段渲染：切分计划、短场景直接整段渲染、场景代码报错时不再整段重跑 (用假的 Manim 进程)"""
+
+import os
+import json
+
+import pytest
+
+import render_jobs
+from render_jobs import (
+    plan_sections, estimate_duration, execute_render_job, new_render_job, SECTION_PROBE_START
+)
+
+
+def scene(*run_times):
+    plays = "\n".join(
+        f"        self.play(Create(Circle()), run_time={t})" if t is not None else "        self.play(Create(Circle()))"
+        for t in run_times
+    )
+    return f"from manim import *\n\nclass MainScene(Scene):\n    def construct(self):\n{plays}\n"
+
+
+def test_plan_sections_splits_by_duration():
+    assert plan_sections([5] * 8, workers=4, min_seconds=10) == [(0, 1), (2, 3), (4, 5), (6, None)]
+    assert plan_sections([30, 1, 1, 28], workers=2, min_seconds=10) == [(0, 0), (1, None)]
+
+
+@pytest.mark.parametrize("durations", [[3, 3, 3], [60], []])
+def test_plan_sections_declines_when_not_worth_it(durations):
+    assert plan_sections(durations, workers=4, min_seconds=10) is None
+
+
+def test_estimate_duration():
+    assert estimate_duration(scene(3, None, 2.5)) == 6.5
+    assert estimate_duration(scene()) == 0
+    assert estimate_duration("class Broken(") == 0
+
+
+class FakeManim:
+    """记录每次 Manim 调用；探测时写出 durations，按 fail 决定哪类调用报错"""
+
+    def __init__(self, durations, fail):
+        self.durations = durations
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, cmd, cancel=None):
+        animations = cmd[cmd.index("-n") + 1] if "-n" in cmd else None
+        kind = "probe" if animations == str(SECTION_PROBE_START) else "section" if animations else "full"
+        self.calls.append(kind)
+        if kind == "probe" and self.fail != "probe":
+            media_dir = cmd[cmd.index("--media_dir") + 1]
+            with open(os.path.join(media_dir, "durations.json"), "w", encoding="utf-8") as f:
+                json.dump(self.durations, f)
+        if kind == self.fail:
+            return 1, "", "NameError: name 'Cirlce' is not defined", {"cpu_seconds": 1.0}
+        return 0, "", "", {"cpu_seconds": 1.0}
+
+
+@pytest.fixture
+def sectioning(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_jobs, "worker_scratch_dir", lambda: str(tmp_path / "scratch"))
+    monkeypatch.setattr(render_jobs, "RENDER_SECTION_WORKERS", 4)
+    monkeypatch.setattr(render_jobs, "RENDER_SECTION_MIN_SECONDS", 10)
+    monkeypatch.setattr(render_jobs.shutil, "which", lambda name: f"/usr/bin/{name}")
+
+    def run(code, durations=(), fail=None):
+        fake = FakeManim(list(durations), fail)
+        monkeypatch.setattr(render_jobs, "run_manim_safe", fake)
+        job = new_render_job("req1", code, "MainScene", "video_req1")
+        return execute_render_job(job, str(tmp_path / "out")), fake.calls
+
+    return run
+
+
+def test_short_scene_skips_the_probe(sectioning):
+    result, calls = sectioning(scene(3, 3))
+    assert calls == ["full"]
+    assert result["returncode"] == 0
+
+
+def test_probe_error_is_not_rerendered(sectioning):
+    result, calls = sectioning(scene(15, 15), fail="probe")
+    assert calls == ["probe"]
+    assert result["returncode"] == 1 and "NameError" in result["stderr"]
+    assert result["video_path"] is None
+
+
+def test_section_error_is_not_rerendered(sectioning):
+    result, calls = sectioning(scene(15, 15), durations=[15, 15], fail="section")
+    assert calls == ["probe", "section", "section"]
+    assert result["returncode"] == 1 and "NameError" in result["stderr"]
+    assert result["usage"]["cpu_seconds"] == 3.0
+
+
+def test_unsplittable_probe_falls_back_to_full_render(sectioning):
+    # 静态估算够长，但探测到的实际时长不足两段 (例如 run_time 写在循环里)
+    result, calls = sectioning(scene(15, 15), durations=[4, 4])
+    assert calls == ["probe", "full"]
+    assert result["returncode"] == 0
@@ -0,0 +1,51 @@
+# tests/test_render_worker.py
+"""渲染 worker：正常写回结果时保留视频，任务已被 API 侧清除时删除输出"""
+
+import pytest
+
+import render_worker
+from render_jobs import SQLiteRenderBroker, new_render_job
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SQLiteRenderBroker(str(tmp_path / "broker" / "render_jobs.db"))
+
+
+def fake_render(tmp_path, on_finish=None):
+    def execute(job, output_dir, emit=None, cancel=None):
+        video_path = tmp_path / f"{job['output_filename']}.mp4"
+        video_path.write_bytes(b"mp4")
+        if on_finish:
+            on_finish(job)
+        return {"returncode": 0, "stderr": "", "video_path": str(video_path), "objects": []}
+    return execute
+
+
+def submit(broker):
+    job = new_render_job("req1", "class Demo: pass", "Demo", "video_req1")
+    broker.submit(job)
+    return job
+
+
+def test_completed_job_keeps_its_video(tmp_path, broker, monkeypatch):
+    monkeypatch.setattr(render_worker, "execute_render_job", fake_render(tmp_path))
+    job = submit(broker)
+
+    assert render_worker.process_one(broker, "test-worker")
+
+    status, result, _ = broker.poll(job["job_id"])
+    assert status == "done"
+    assert (tmp_path / "video_req1.mp4").exists()
+
+
+def test_abandoned_job_output_is_deleted(tmp_path, broker, monkeypatch):
+    # API 侧在渲染期间放弃 (取消或超时)，finally 里清除了任务
+    monkeypatch.setattr(render_worker, "execute_render_job",
+                        fake_render(tmp_path, on_finish=lambda job: broker.purge(job["job_id"])))
+    job = submit(broker)
+
+    assert render_worker.process_one(broker, "test-worker")
+
+    assert broker.poll(job["job_id"])[0] == "missing"
+    assert not (tmp_path / "video_req1.mp4").exists()
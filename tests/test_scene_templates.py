@@ -0,0 +1,46 @@
+# tests/test_scene_templates.py
+"""场景模板：示例指令命中、表达式采样的安全检查、每个模板实际渲染 (需要 Manim)"""
+
+import time
+
+import pytest
+
+from config import TEMPLATE_MIN_CONFIDENCE
+from render_jobs import new_render_job, execute_render_job
+from scene_templates import template_library
+
+EXAMPLES = [(template.name, example) for template in template_library.templates for example in template.examples]
+
+
+@pytest.mark.parametrize("name, example", EXAMPLES)
+def test_examples_match_their_template(name, example):
+    match = template_library.match(example)
+    assert match is not None and match.name == name
+    assert match.confidence >= TEMPLATE_MIN_CONFIDENCE
+
+
+def test_huge_exponent_is_rejected_quickly():
+    start = time.perf_counter()
+    match = template_library.match("画 y=x+9^9^8 在 [-3,3]")
+    assert time.perf_counter() - start < 1.0
+    assert match is None or match.name != "function_graph"
+
+
+@pytest.mark.parametrize("prompt", ["画出 y=tan(x) 在 [-3,3] 上的图像", "画出 y=1/x 在 [-2.9,3] 上的图像"])
+def test_asymptotes_are_rejected(prompt):
+    match = template_library.match(prompt)
+    assert match is None or match.name != "function_graph"
+
+
+def test_smooth_function_still_matches():
+    match = template_library.match("画出 y=tan(x) 在 [-1,1] 上的图像")
+    assert match is not None and match.name == "function_graph"
+
+
+@pytest.mark.parametrize("name, example", EXAMPLES)
+def test_examples_render(name, example, tmp_path):
+    pytest.importorskip("manim")
+    job = new_render_job("template", template_library.match(example).code(), "MathScene", f"template_{name}")
+    result = execute_render_job(job, str(tmp_path))
+    assert result["returncode"] == 0, result["stderr"][-500:]
+    assert result["video_path"] and result["video_path"].startswith(str(tmp_path))
@@ -0,0 +1,112 @@
+# tests/test_scheduler.py
+"""公平调度器：按会话加权轮流发放名额，排队或持有名额时被取消都会让出名额"""
+
+import asyncio
+
+from scheduler import FairScheduler
+
+
+def run_in_order(weights, submissions):
+    """单个名额：先占住名额，按 submissions 的顺序排队，放开后返回实际执行顺序"""
+    scheduler = FairScheduler(slots={"llm": 1}, weights=weights)
+    order = []
+
+    async def job(session, label):
+        async with scheduler.slot("llm", session, 1.0):
+            order.append(label)
+            await asyncio.sleep(0)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def blocker():
+            async with scheduler.slot("llm", "blocker", 1.0):
+                await release.wait()
+
+        holder = asyncio.create_task(blocker())
+        await asyncio.sleep(0)
+        tasks = []
+        for session, label in submissions:
+            tasks.append(asyncio.create_task(job(session, label)))
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+
+    asyncio.run(main())
+    return order
+
+
+def test_sessions_with_equal_weight_alternate():
+    submissions = [("a", f"a{i}") for i in range(1, 5)] + [("b", "b1"), ("b", "b2")]
+    assert run_in_order({}, submissions) == ["a1", "b1", "a2", "b2", "a3", "a4"]
+
+
+def test_low_weight_session_gets_a_quarter_share():
+    submissions = [s for i in range(1, 5) for s in (("user", f"u{i}"), ("precompute", f"p{i}"))]
+    order = run_in_order({"precompute": 0.25}, submissions)
+    assert order == ["u1", "u2", "u3", "p1", "u4", "p2", "p3", "p4"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = FairScheduler(slots={"llm": 1}, weights={})
+    pool = scheduler.pools["llm"]
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold(session):
+            async with scheduler.slot("llm", session, 1.0):
+                await release.wait()
+
+        holder = asyncio.create_task(hold("a"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold("b"))
+        await asyncio.sleep(0)
+        assert len(pool.waiting) == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert pool.waiting == []
+
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        assert not pool.running
+
+        release.set()
+        async with scheduler.slot("llm", "c", 1.0) as ticket:
+            assert ticket.granted
+
+    asyncio.run(main())
+
+
+def test_slot_granted_during_cancellation_is_passed_on():
+    scheduler = FairScheduler(slots={"llm": 1}, weights={})
+    pool = scheduler.pools["llm"]
+    entered = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold(session):
+            async with scheduler.slot("llm", session, 1.0):
+                entered.append(session)
+                await release.wait()
+
+        holder = asyncio.create_task(hold("a"))
+        await asyncio.sleep(0)
+        unlucky = asyncio.create_task(hold("b"))
+        await asyncio.sleep(0)
+        last = asyncio.create_task(hold("c"))
+        await asyncio.sleep(0)
+
+        # a 放开名额时名额已经发给了 b，但 b 在醒来前被取消：名额必须交给 c
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        assert pool.waiting[0].session == "c" and next(iter(pool.running)).session == "b"
+        unlucky.cancel()
+        await asyncio.gather(unlucky, return_exceptions=True)
+        release.set()
+        await asyncio.wait_for(last, timeout=5)
+
+    asyncio.run(main())
+    assert entered == ["a", "c"]
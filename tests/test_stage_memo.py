@@ -0,0 +1,167 @@
+# tests/test_stage_memo.py
+"""阶段记忆与请求断点：命中 / 过期 / 内存副本刷新，断点保存与续跑 (带着上次的渲染错误直接进入修复)"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import stage_memo as memo_module
+from stage_memo import StageMemo, CheckpointStore
+from state_backend import LocalFileBackend
+from usage_ledger import UsageLedger
+
+MESSAGES = [{"role": "system", "content": "你是质检员"}, {"role": "user", "content": "检查这段代码"}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class CountingBackend(LocalFileBackend):
+    def __init__(self, root):
+        super().__init__(root)
+        self.reads = 0
+
+    def get_json(self, key, default=None):
+        self.reads += 1
+        return super().get_json(key, default)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(memo_module, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return CountingBackend(str(tmp_path))
+
+
+def make_memo(backend, **kwargs):
+    options = {"stages": ["intent", "analyzer"], "max_temperature": 0.2, "ttl": 100,
+               "max_entries": 10, "max_chars": 50, "refresh_interval": 30, **kwargs}
+    return StageMemo(backend=backend, **options)
+
+
+def test_eligibility(backend):
+    memo = make_memo(backend)
+    assert memo.eligible("analyzer", 0.1)
+    assert not memo.eligible("analyzer", 0.7)
+    assert not memo.eligible("analyzer", None)
+    assert not memo.eligible("generator", 0.1)
+
+
+def test_key_depends_on_model_temperature_and_messages(backend):
+    memo = make_memo(backend)
+    key = memo.make_key("analyzer", ["primary/m"], 0.1, MESSAGES)
+    assert key == memo.make_key("analyzer", ["primary/m"], 0.1, [dict(m) for m in MESSAGES])
+    assert key != memo.make_key("analyzer", ["primary/other"], 0.1, MESSAGES)
+    assert key != memo.make_key("analyzer", ["primary/m"], 0.2, MESSAGES)
+    assert key != memo.make_key("analyzer", ["primary/m"], 0.1, MESSAGES[:1] + [{"role": "user", "content": "别的"}])
+
+
+def test_put_get_and_expiry(backend, clock):
+    memo = make_memo(backend)
+    memo.put("k", "analyzer", "m", "没有问题")
+    memo.put("long", "analyzer", "m", "x" * 51)
+    assert memo.get("k")["content"] == "没有问题"
+    assert memo.get("long") is None
+
+    clock.now += 101
+    assert memo.get("k") is None
+    assert (memo.hits, memo.misses) == (1, 2)
+
+
+def test_get_uses_the_in_memory_copy(backend, clock):
+    memo = make_memo(backend)
+    memo.put("k", "analyzer", "m", "没有问题")
+    reads = backend.reads
+    for _ in range(5):
+        assert memo.get("k")
+    assert memo.get("missing") is None
+    assert backend.reads == reads
+
+    # 其他 worker 写入的记忆在刷新间隔之后可见
+    make_memo(backend).put("other", "intent", "m", "{}")
+    assert memo.get("other") is None
+    clock.now += 31
+    assert memo.get("other")["content"] == "{}"
+    assert backend.reads == reads + 1
+
+    backend.clear()
+    memo.reset()
+    assert memo.get("k") is None
+
+
+def test_checkpoint_save_load_and_discard(backend, clock):
+    store = CheckpointStore(backend=backend, enabled=True, ttl=100, max_entries=10)
+    key = store.make_key("画一个圆", "", "classic")
+    assert key == store.make_key("  画一个圆 ", None, "classic")
+    assert key != store.make_key("画一个圆", "", "merged")
+    assert store.load(key) == {}
+
+    store.save(key, "generator", {"intent": None, "code": "draft", "edit_modes": {}})
+    store.save(key, "render", {"code": "final", "error": "NameError"})
+    assert set(store.load(key)) == {"generator", "render"}
+
+    clock.now += 101
+    assert store.load(key) == {}
+    store.save(key, "generator", {"intent": None, "code": "draft", "edit_modes": {}})
+    store.discard(key)
+    assert store.load(key) == {}
+
+
+def test_disabled_checkpoints_are_not_written(backend):
+    store = CheckpointStore(backend=backend, enabled=False)
+    store.save("k", "generator", {"code": "draft"})
+    assert store.load("k") == {} and backend.get_json("checkpoints") is None
+
+
+def test_resume_goes_straight_to_the_fixer(tmp_path, monkeypatch):
+    prompt = "画一个圆"
+    store = CheckpointStore(backend=LocalFileBackend(str(tmp_path / "state")), enabled=True)
+    key = store.make_key(prompt, "", main.PIPELINE_PROFILE)
+    store.save(key, "generator", {"intent": {"intent": "CREATE"}, "code": "draft", "edit_modes": {
+        "generator": "rewrite", "improver": "rewrite"}})
+    store.save(key, "improver", {"code": "improved", "critique": "ok", "edit_modes": {
+        "generator": "rewrite", "improver": "rewrite"}})
+    store.save(key, "render", {"code": "broken_code", "error": "NameError: Cirlce"})
+
+    monkeypatch.setattr(main, "checkpoint_store", store)
+    monkeypatch.setattr(main, "usage_ledger", UsageLedger(LocalFileBackend(str(tmp_path / "usage"))))
+    monkeypatch.setattr(main, "TEMPLATE_ENABLED", False)
+    monkeypatch.setattr(main, "FIXER_CANDIDATE_TEMPERATURES", [0.2])
+    monkeypatch.setattr(main, "MAX_RETRIES", 1)
+
+    llm_calls, rendered = [], []
+
+    async def fake_call_llm(sched, stage, messages, temperature=None):
+        llm_calls.append((stage, messages[-1]["content"]))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="```python\nfixed_code\n```"))])
+
+    async def fake_run_render_job(job, on_event=None, output_dir=None, on_abandoned=None):
+        rendered.append(job["code"])
+        return {"returncode": 1, "stderr": "still broken", "video_path": None, "objects": None}
+
+    monkeypatch.setattr(main, "call_llm", fake_call_llm)
+    monkeypatch.setattr(main, "run_render_job", fake_run_render_job)
+    sent = []
+
+    async def send_json(message):
+        sent.append(message)
+
+    asyncio.run(main.process_chat_workflow(prompt, SimpleNamespace(send_json=send_json), standalone=True))
+
+    assert [stage for stage, _ in llm_calls] == ["fixer"]
+    assert "NameError: Cirlce" in llm_calls[0][1] and "broken_code" in llm_calls[0][1]
+    assert rendered == ["fixed_code"]
+    assert store.load(key)["render"] == {"code": "fixed_code", "error": "still broken"}
+    assert sent[-1]["type"] == "error"
@@ -0,0 +1,48 @@
+# tests/test_state_backend.py
+"""共享状态后端：多个进程同时通过 transaction() 累加同一个计数器，不会丢失更新"""
+
+import multiprocessing
+
+import pytest
+
+from state_backend import LocalFileBackend, SQLiteBackend
+
+PROCESSES = 4
+INCREMENTS = 25
+
+
+def open_backend(kind, path):
+    return SQLiteBackend(path) if kind == "sqlite" else LocalFileBackend(path)
+
+
+def increment(kind, path):
+    backend = open_backend(kind, path)
+    for _ in range(INCREMENTS):
+        with backend.transaction("counter", {"value": 0}) as doc:
+            doc["value"] += 1
+
+
+@pytest.mark.parametrize("kind", ["local", "sqlite"])
+def test_concurrent_increments_across_processes(tmp_path, kind):
+    path = str(tmp_path / "state.db") if kind == "sqlite" else str(tmp_path / "state")
+    open_backend(kind, path)
+
+    workers = [multiprocessing.Process(target=increment, args=(kind, path)) for _ in range(PROCESSES)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    assert open_backend(kind, path).get_json("counter") == {"value": PROCESSES * INCREMENTS}
+
+
+@pytest.mark.parametrize("kind", ["local", "sqlite"])
+def test_failed_transaction_is_not_written(tmp_path, kind):
+    backend = open_backend(kind, str(tmp_path / "state.db") if kind == "sqlite" else str(tmp_path / "state"))
+    backend.set_json("counter", {"value": 1})
+    with pytest.raises(RuntimeError):
+        with backend.transaction("counter", {"value": 0}) as doc:
+            doc["value"] = 99
+            raise RuntimeError("abort")
+    assert backend.get_json("counter") == {"value": 1}
@@ -0,0 +1,106 @@
+# tests/test_usage_ledger.py
+"""用量记账：预算级别随用量逐级升高、跨天清零、超时被放弃的调用照样计费、超出预算时不再调用 LLM"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import usage_ledger as ledger_module
+from state_backend import LocalFileBackend
+from usage_ledger import UsageLedger, RequestUsage
+
+
+def fake_response(content="ok", prompt_tokens=100, completion_tokens=50):
+    return SimpleNamespace(
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+    )
+
+
+def spend(cost):
+    return {"prompt_tokens": 0, "completion_tokens": 0, "cost": cost}
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger_module, "BUDGET_SESSION_DAILY", 1.0)
+    monkeypatch.setattr(ledger_module, "BUDGET_GLOBAL_DAILY", 3.0)
+    monkeypatch.setattr(ledger_module, "BUDGET_ECONOMY_RATIO", 0.8)
+    return UsageLedger(LocalFileBackend(str(tmp_path)))
+
+
+def test_session_levels_escalate(ledger):
+    assert ledger.budget_level("a") == "normal"
+    ledger.record("a", spend(0.5))
+    assert ledger.budget_level("a") == "normal"
+    ledger.record("a", spend(0.35))
+    assert ledger.budget_level("a") == "economy"
+    ledger.record("a", spend(0.2))
+    assert ledger.budget_level("a") == "minimal"
+    # 其他会话不受影响
+    assert ledger.budget_level("b") == "normal"
+
+
+def test_global_budget_applies_to_every_session(ledger):
+    for session in ("a", "b", "c"):
+        ledger.record(session, spend(0.9))
+    assert ledger.budget_level("fresh") == "economy"
+    ledger.record("d", spend(0.4))
+    assert ledger.budget_level("fresh") == "minimal"
+
+
+def test_new_day_resets_the_ledger(ledger, monkeypatch):
+    ledger.record("a", spend(1.5))
+    assert ledger.budget_level("a") == "minimal"
+    monkeypatch.setattr(UsageLedger, "_today", staticmethod(lambda: "2999-01-01"))
+    assert ledger.budget_level("a") == "normal"
+    ledger.record("a", spend(0.1))
+    assert ledger.snapshot()["global"]["calls"] == 1
+
+
+def test_abandoned_calls_are_billed_to_the_budget_key(ledger, monkeypatch):
+    monkeypatch.setattr(main, "usage_ledger", ledger)
+
+    async def fake_complete(stage, messages, temperature, forced_model, on_abandoned=None):
+        # 主候选超过 SLO 被放弃，后台跑完后补记；备用候选先返回
+        on_abandoned("slow-model", fake_response(prompt_tokens=1000, completion_tokens=1000))
+        return fake_response(), "fast-model"
+
+    monkeypatch.setattr(main.llm_router, "complete", fake_complete)
+    usage = RequestUsage()
+    sched = {"session": "client-chosen", "budget": "conn_1", "usage": usage, "model": None}
+    asyncio.run(main.call_llm(sched, "generator", [{"role": "user", "content": "hi"}]))
+
+    assert [call["stage"] for call in usage.calls] == ["generator.abandoned", "generator"]
+    sessions = {entry["session"]: entry for entry in ledger.snapshot()["top_sessions"]}
+    assert set(sessions) == {"conn_1"}
+    assert sessions["conn_1"]["calls"] == 2
+    assert sessions["conn_1"]["cost"] == usage.totals["cost"] > 0
+
+
+def test_over_budget_without_fallback_refuses_generation(ledger, monkeypatch):
+    ledger.record("conn_1", spend(1.5))
+    monkeypatch.setattr(main, "usage_ledger", ledger)
+    monkeypatch.setattr(main, "BUDGET_FALLBACK_MODEL", None)
+    monkeypatch.setattr(main, "TEMPLATE_ENABLED", False)
+    monkeypatch.setattr(main.checkpoint_store, "load", lambda key: {})
+    llm_calls = []
+
+    async def fake_complete(stage, *args, **kwargs):
+        llm_calls.append(stage)
+        return fake_response(), "model"
+
+    monkeypatch.setattr(main.llm_router, "complete", fake_complete)
+    sent = []
+
+    async def send_json(message):
+        sent.append(message)
+
+    channel = SimpleNamespace(send_json=send_json)
+    asyncio.run(main.process_chat_workflow("画一个圆", channel, standalone=True,
+                                           session_id="client-chosen", budget_key="conn_1"))
+
+    assert llm_calls == []
+    assert sent[-1]["type"] == "error" and "预算" in sent[-1]["message"]
@@ -0,0 +1,232 @@
+# tracing.py
+"""
+MathSpace 请求追踪
+每个请求一条 trace，流水线的每一步是一个 span (意图 / 生成 / 质检 / 改进 / 每次渲染 / 修复 /
+封装 / 入库 / 缓存读写)，带耗时和属性 (token 数、退出码、字节数……)：
+- 当前 span 保存在 contextvars 中，子任务 (请求合并、线程池) 自动挂到发起者的 trace 下
+- 没有进行中的 trace 时，普通 span 是空操作 (预热、后台任务不会刷满缓冲区)；new_trace=True 才会新建 trace
+- 最近的 trace 保存在内存环形缓冲区，/monitor 用它画瀑布图
+- 可选导出为 OTLP/JSON (每行一个 ExportTraceServiceRequest)，可直接导入 OpenTelemetry Collector / Jaeger
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACE_BUFFER_SIZE, TRACE_EXPORT_FILE, TRACE_SERVICE_NAME
+
+MAX_SPANS_PER_TRACE = 300
+MAX_ATTRIBUTE_CHARS = 200
+
+_current_span = contextvars.ContextVar("mathspace_span", default=None)
+
+
+def _clean(value):
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_ATTRIBUTE_CHARS else text[:MAX_ATTRIBUTE_CHARS - 3] + "..."
+
+
+class Span:
+    def __init__(self, tracer, trace, name, parent, attributes):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.status = "ok"
+        self.error = None
+        self._token = None
+        self.set(**attributes)
+
+    def set(self, **attributes):
+        for key, value in attributes.items():
+            self.attributes[key] = _clean(value)
+        return self
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = _clean(error)
+        return self
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        if error is not None:
+            self.fail(error)
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # 在其他上下文中结束 (例如被取消的任务)，不影响当前上下文
+                pass
+            self._token = None
+        self.tracer._finish(self)
+
+    def to_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 2) if self.end_ns else None,
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class NullSpan:
+    """没有进行中的 trace 时返回的空 span，调用方无需判断"""
+
+    def set(self, **attributes):
+        return self
+
+    def fail(self, error):
+        return self
+
+    def end(self, error=None):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Trace:
+    def __init__(self, root_name):
+        self.trace_id = os.urandom(16).hex()
+        self.name = root_name
+        self.spans = []
+        self.root = None
+        self.dropped = 0
+
+    def summary(self):
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start_ns": root.start_ns,
+            "duration_ms": round((root.end_ns - root.start_ns) / 1e6, 2) if root.end_ns else None,
+            "status": "error" if any(s.status == "error" for s in self.spans) else "ok",
+            "span_count": len(self.spans),
+            "attributes": root.attributes,
+        }
+
+    def to_dict(self):
+        return {**self.summary(), "dropped_spans": self.dropped, "spans": [s.to_dict() for s in self.spans]}
+
+
+class Tracer:
+    def __init__(self, buffer_size=TRACE_BUFFER_SIZE, export_file=TRACE_EXPORT_FILE):
+        self.traces = deque(maxlen=buffer_size)
+        self.export_file = export_file
+        self._export_lock = threading.Lock()
+
+    # ---------- 创建 span ----------
+    def start_span(self, name, new_trace=False, **attributes):
+        """开始一个 span 并设为当前 span；记得调用 span.end()"""
+        parent = _current_span.get()
+        if parent is None:
+            if not new_trace:
+                return NULL_SPAN
+            trace = Trace(name)
+            span = Span(self, trace, name, None, attributes)
+            trace.root = span
+            self.traces.append(trace)
+        else:
+            trace = parent.trace
+            if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+                trace.dropped += 1
+                return NULL_SPAN
+            span = Span(self, trace, name, parent, attributes)
+        span._token = _current_span.set(span)
+        return span
+
+    @contextmanager
+    def span(self, name, new_trace=False, **attributes):
+        span = self.start_span(name, new_trace=new_trace, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=f"{type(e).__name__}: {e}")
+            raise
+        span.end()
+
+    def current(self):
+        return _current_span.get() or NULL_SPAN
+
+    def _finish(self, span):
+        trace = span.trace
+        if len(trace.spans) < MAX_SPANS_PER_TRACE:
+            trace.spans.append(span)
+        if span is trace.root and self.export_file:
+            self.export(trace)
+
+    # ---------- 查询 ----------
+    def recent(self, limit=20):
+        finished = [t for t in self.traces if t.root.end_ns is not None]
+        return [t.summary() for t in reversed(finished[-limit:])]
+
+    def get(self, trace_id):
+        for trace in self.traces:
+            if trace.trace_id == trace_id:
+                return trace.to_dict()
+        return None
+
+    # ---------- OTLP/JSON 导出 ----------
+    @staticmethod
+    def _otlp_value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": "" if value is None else str(value)}
+
+    def to_otlp(self, trace):
+        spans = []
+        for span in trace.spans:
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [{"key": k, "value": self._otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{"scope": {"name": "mathspace.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def export(self, trace):
+        try:
+            line = json.dumps(self.to_otlp(trace), ensure_ascii=False)
+            with self._export_lock, open(self.export_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"⚠️ [追踪] 导出失败: {e}")
+
+
+tracer = Tracer()
@@ -0,0 +1,133 @@
+# usage_ledger.py
+"""
+MathSpace 用量记账
+记录每次 LLM 调用的 prompt / completion token 与折算费用：
+- 单次请求：汇总后写入对话记录
+- 会话 / 全局：按自然日累计，保存在共享状态后端 (键 "usage")，多个 worker 共用一份账本
+- 预算：超过阈值时逐级降级 (先跳过质检分析器并改为单个修复候选，再换用更便宜的模型或停止自动修复)，
+  每次 LLM 调用和修复重试前都重新检查
+"""
+
+import time
+
+from config import (
+    LLM_PRICE_PER_MILLION, LLM_PRICE_CURRENCY,
+    BUDGET_SESSION_DAILY, BUDGET_GLOBAL_DAILY, BUDGET_ECONOMY_RATIO
+)
+from state_backend import state
+
+BUDGET_LEVELS = ("normal", "economy", "minimal")
+MAX_TRACKED_SESSIONS = 500
+
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = LLM_PRICE_PER_MILLION.get(model, LLM_PRICE_PER_MILLION["default"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def empty_totals():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+def add_to_totals(totals, usage):
+    totals["calls"] += 1
+    totals["prompt_tokens"] += usage["prompt_tokens"]
+    totals["completion_tokens"] += usage["completion_tokens"]
+    totals["cost"] = round(totals["cost"] + usage["cost"], 6)
+
+
+class RequestUsage:
+    """单次请求内所有 LLM 调用的明细与合计"""
+
+    def __init__(self):
+        self.calls = []
+        self.totals = empty_totals()
+
+    def add(self, stage, model, response):
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        record = {
+            "stage": stage,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": round(call_cost(model, prompt_tokens, completion_tokens), 6),
+        }
+        self.calls.append(record)
+        add_to_totals(self.totals, record)
+        return record
+
+    def to_dict(self):
+        return {**self.totals, "currency": LLM_PRICE_CURRENCY, "calls_detail": self.calls}
+
+
+class UsageLedger:
+    """按天累计的会话 / 全局账本"""
+
+    def __init__(self, backend=state, state_key="usage"):
+        self.backend = backend
+        self.state_key = state_key
+
+    @staticmethod
+    def _today():
+        return time.strftime("%Y-%m-%d")
+
+    def _empty(self):
+        return {"day": self._today(), "global": empty_totals(), "sessions": {}}
+
+    def _current(self, ledger):
+        """跨天后清零"""
+        if not isinstance(ledger, dict) or ledger.get("day") != self._today():
+            return self._empty()
+        return ledger
+
+    def record(self, session, usage):
+        with self.backend.transaction(self.state_key, self._empty()) as ledger:
+            current = self._current(ledger)
+            if current is not ledger:
+                ledger.clear()
+                ledger.update(current)
+            add_to_totals(ledger["global"], usage)
+            session_totals = ledger["sessions"].setdefault(session, empty_totals())
+            add_to_totals(session_totals, usage)
+            session_totals["updated"] = time.time()
+            if len(ledger["sessions"]) > MAX_TRACKED_SESSIONS:
+                oldest = sorted(ledger["sessions"], key=lambda s: ledger["sessions"][s].get("updated", 0))
+                for stale in oldest[:len(ledger["sessions"]) - MAX_TRACKED_SESSIONS]:
+                    ledger["sessions"].pop(stale, None)
+
+    def budget_level(self, session):
+        """
+        normal:  预算充足
+        economy: 会话或全局用量超过 BUDGET_ECONOMY_RATIO —— 跳过质检分析器，只用一个修复候选
+        minimal: 超过预算 —— 换用 BUDGET_FALLBACK_MODEL；未配置便宜模型时不再自动修复
+        """
+        ledger = self._current(self.backend.get_json(self.state_key, None))
+        ratios = []
+        if BUDGET_GLOBAL_DAILY:
+            ratios.append(ledger["global"]["cost"] / BUDGET_GLOBAL_DAILY)
+        if BUDGET_SESSION_DAILY:
+            ratios.append(ledger["sessions"].get(session, empty_totals())["cost"] / BUDGET_SESSION_DAILY)
+        ratio = max(ratios, default=0)
+        if ratio >= 1:
+            return "minimal"
+        if ratio >= BUDGET_ECONOMY_RATIO:
+            return "economy"
+        return "normal"
+
+    def snapshot(self, top=10):
+        ledger = self._current(self.backend.get_json(self.state_key, None))
+        sessions = sorted(ledger["sessions"].items(), key=lambda item: item[1]["cost"], reverse=True)
+        return {
+            "day": ledger["day"],
+            "currency": LLM_PRICE_CURRENCY,
+            "global": ledger["global"],
+            "global_budget": BUDGET_GLOBAL_DAILY,
+            "session_budget": BUDGET_SESSION_DAILY,
+            "top_sessions": [{"session": s, **totals} for s, totals in sessions[:top]],
+            "session_count": len(sessions),
+        }
+
+
+usage_ledger = UsageLedger()
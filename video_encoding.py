@@ -0,0 +1,192 @@
+# video_encoding.py
+"""
+MathSpace 渲染后转码
+Manim 直接输出的 MP4 没有针对内容调优，而数学动画以纯色块和线条为主，换一组编码参数能小很多：
+- mp4:  x264 + animation 调优 + 较高 CRF，兼容性最好
+- webm: VP9，同等画质下体积更小 (编码较慢)
+- webp: 短片段额外输出动画 WebP
+档位指定 target_bytes 时按时长折算码率两遍编码。
+转码在独立的转码队列中后台执行 (不占用请求要等待的 faststart / HLS 封装 worker)，原始视频立即可播；
+转码后的格式列表写回缓存条目，命中缓存时一并返回。
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+from config import (
+    FFMPEG_BIN, ENCODED_DIR,
+    ENCODING_PROFILES, ENCODING_ENABLED_PROFILES, ENCODING_MIN_SAVING, ENCODING_TIMEOUT,
+    ENCODING_WORKERS
+)
+from artifact_store import file_sha256
+from video_packaging import PackagingQueue, ffmpeg_available, probe_duration, run_ffmpeg
+
+FORMAT_MIME_TYPES = {"mp4": "video/mp4", "webm": "video/webm", "webp": "image/webp"}
+# 转码产物文件名：<档位>.<内容哈希前 12 位>.<扩展名>，内容不同地址就不同，可以 immutable 长缓存
+ENCODED_NAME_PATTERN = re.compile(r"^[\w\-]+\.([0-9a-f]{12})\.(mp4|webm|webp)$")
+TARGET_BITRATE_HEADROOM = 0.95   # 按目标大小折算码率时给容器开销留的余量
+
+
+def encoded_dir_for(name):
+    return os.path.join(ENCODED_DIR, os.path.splitext(name)[0])
+
+
+def encoded_url(name, filename):
+    return f"/video/enc/{os.path.splitext(name)[0]}/{filename}"
+
+
+def video_codec_args(profile, bitrate=None):
+    """视频流编码参数；bitrate 不为空时按码率编码 (两遍编码的两遍共用)"""
+    if profile["format"] == "mp4":
+        args = ["-c:v", "libx264", "-preset", profile.get("preset", "medium"), "-pix_fmt", "yuv420p"]
+        if profile.get("tune"):
+            args += ["-tune", profile["tune"]]
+        return args + (["-b:v", str(bitrate)] if bitrate else ["-crf", str(profile.get("crf", 23))])
+    if profile["format"] == "webm":
+        args = ["-c:v", "libvpx-vp9", "-row-mt", "1", "-deadline", "good",
+                "-cpu-used", str(profile.get("cpu_used", 2)), "-pix_fmt", "yuv420p"]
+        return args + (["-b:v", str(bitrate)] if bitrate else ["-crf", str(profile.get("crf", 32)), "-b:v", "0"])
+    raise ValueError(f"不支持的视频格式: {profile['format']}")
+
+
+def audio_codec_args(profile):
+    """Manim 场景一般没有音轨；有的话 mp4 用 AAC、webm 用 Opus"""
+    codec = ["-c:a", "aac", "-b:a", "96k"] if profile["format"] == "mp4" else ["-c:a", "libopus", "-b:a", "64k"]
+    return ["-map", "0:v:0", "-map", "0:a?"] + codec
+
+
+def container_args(profile):
+    return ["-movflags", "+faststart"] if profile["format"] == "mp4" else []
+
+
+def encode_two_pass(src_path, dst_path, profile, bitrate):
+    """按目标码率两遍编码：第一遍只做码率分析，不输出文件"""
+    with tempfile.TemporaryDirectory(prefix="passlog_", dir=os.path.dirname(dst_path)) as log_dir:
+        passlog = os.path.join(log_dir, "pass")
+        codec = video_codec_args(profile, bitrate)
+        returncode, stderr = run_ffmpeg([
+            FFMPEG_BIN, "-y", "-v", "error", "-i", src_path, *codec,
+            "-pass", "1", "-passlogfile", passlog, "-an", "-f", "null", os.devnull
+        ], timeout=ENCODING_TIMEOUT)
+        if returncode != 0:
+            return returncode, stderr
+        return run_ffmpeg([
+            FFMPEG_BIN, "-y", "-v", "error", "-i", src_path, *codec, *audio_codec_args(profile),
+            "-pass", "2", "-passlogfile", passlog, *container_args(profile), dst_path
+        ], timeout=ENCODING_TIMEOUT)
+
+
+def encode_profile(src_path, out_dir, profile_name, duration):
+    """按一个档位转码，成功时返回 {"profile", "format", "mime", "bytes", "file"}，不适用或失败时返回 None"""
+    profile = ENCODING_PROFILES[profile_name]
+    fmt = profile["format"]
+    if fmt == "webp" and (duration is None or duration > profile.get("max_duration", 8)):
+        return None
+
+    tmp_path = os.path.join(out_dir, f".{profile_name}.tmp.{fmt}")
+    target_bytes = profile.get("target_bytes") or 0
+    if fmt == "webp":
+        returncode, stderr = run_ffmpeg([
+            FFMPEG_BIN, "-y", "-v", "error", "-i", src_path,
+            "-vf", f"fps={profile.get('fps', 15)},scale='min({profile.get('max_width', 640)},iw)':-2:flags=lanczos",
+            "-c:v", "libwebp", "-lossless", "0", "-q:v", str(profile.get("quality", 60)),
+            "-loop", "0", "-an", tmp_path
+        ], timeout=ENCODING_TIMEOUT)
+    elif target_bytes and duration:
+        bitrate = int(target_bytes * 8 / duration * TARGET_BITRATE_HEADROOM)
+        returncode, stderr = encode_two_pass(src_path, tmp_path, profile, bitrate)
+    else:
+        returncode, stderr = run_ffmpeg([
+            FFMPEG_BIN, "-y", "-v", "error", "-i", src_path,
+            *video_codec_args(profile), *audio_codec_args(profile),
+            *container_args(profile), tmp_path
+        ], timeout=ENCODING_TIMEOUT)
+
+    if returncode != 0 or not os.path.exists(tmp_path):
+        print(f"⚠️ [转码] {profile_name} 失败: {stderr[-200:]}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    filename = f"{profile_name}.{file_sha256(tmp_path)[:12]}.{fmt}"
+    os.replace(tmp_path, os.path.join(out_dir, filename))
+    return {
+        "profile": profile_name,
+        "format": fmt,
+        "mime": FORMAT_MIME_TYPES[fmt],
+        "bytes": os.path.getsize(os.path.join(out_dir, filename)),
+        "file": filename,
+    }
+
+
+def encode_video(src_path, name, profiles=None):
+    """
+    按档位依次转码，返回保留下来的版本 (按体积从小到大，每项带播放地址 url)
+    没有比原始视频小 ENCODING_MIN_SAVING 以上的版本直接丢弃
+    """
+    profiles = ENCODING_ENABLED_PROFILES if profiles is None else profiles
+    if not profiles or not ffmpeg_available() or not os.path.exists(src_path):
+        return []
+
+    duration = probe_duration(src_path)
+    original_bytes = os.path.getsize(src_path)
+    out_dir = encoded_dir_for(name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    formats = []
+    for profile_name in profiles:
+        if profile_name not in ENCODING_PROFILES:
+            print(f"⚠️ [转码] 未知档位: {profile_name}")
+            continue
+        try:
+            variant = encode_profile(src_path, out_dir, profile_name, duration)
+        except Exception as e:
+            print(f"⚠️ [转码] {profile_name} 异常: {e}")
+            continue
+        if variant is None:
+            continue
+        if variant["bytes"] > original_bytes * (1 - ENCODING_MIN_SAVING):
+            os.remove(os.path.join(out_dir, variant["file"]))
+            continue
+        variant["url"] = encoded_url(name, variant["file"])
+        formats.append(variant)
+
+    if not formats:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return []
+    formats.sort(key=lambda f: f["bytes"])
+    summary = ", ".join(f"{f['profile']} {f['bytes'] // 1024}KB" for f in formats)
+    print(f"🗜️ [转码] {name} ({original_bytes // 1024}KB) -> {summary}")
+    return formats
+
+
+def list_encoded(name):
+    """磁盘上已有的转码版本 (按体积从小到大)"""
+    out_dir = encoded_dir_for(name)
+    if not os.path.isdir(out_dir):
+        return []
+    formats = []
+    for filename in os.listdir(out_dir):
+        match = ENCODED_NAME_PATTERN.match(filename)
+        if not match:
+            continue
+        formats.append({
+            "profile": filename.split(".", 1)[0],
+            "format": match.group(2),
+            "mime": FORMAT_MIME_TYPES[match.group(2)],
+            "bytes": os.path.getsize(os.path.join(out_dir, filename)),
+            "file": filename,
+            "url": encoded_url(name, filename),
+        })
+    return sorted(formats, key=lambda f: f["bytes"])
+
+
+def remove_encoded_outputs(names):
+    """视频被淘汰时一并删除它的转码产物"""
+    for name in names:
+        shutil.rmtree(encoded_dir_for(name), ignore_errors=True)
+
+
+encoding_queue = PackagingQueue(workers=ENCODING_WORKERS)
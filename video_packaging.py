@@ -0,0 +1,199 @@
+# video_packaging.py
+"""
+MathSpace 渲染后封装
+- faststart：把 moov 头移到文件开头 (stream copy)，浏览器拿到前几百 KB 即可开始播放
+- HLS：较长的场景额外切片为 m3u8 播放列表
+所有封装任务都在独立的后台队列中执行，不占用渲染线程。
+"""
+
+import os
+import shutil
+import struct
+import asyncio
+import subprocess
+
+from config import (
+    FFMPEG_BIN, FFPROBE_BIN, HLS_DIR,
+    PACKAGING_WORKERS, PACKAGING_TIMEOUT, PACKAGING_FASTSTART,
+    HLS_ENABLED, HLS_MIN_DURATION, HLS_SEGMENT_SECONDS
+)
+
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG_BIN) is not None
+
+
+def has_faststart(path):
+    """读取 MP4 顶层 box：moov 出现在 mdat 之前即已是 faststart"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, box_type = struct.unpack(">I4s", header)
+                if box_type == b"moov":
+                    return True
+                if box_type == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def run_ffmpeg(args, timeout=PACKAGING_TIMEOUT):
+    result = subprocess.run(
+        args,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="ignore",
+        timeout=timeout
+    )
+    return result.returncode, result.stderr
+
+
+def remux_faststart(path):
+    """原地 remux 为 faststart (不重新编码)，失败时保留原文件"""
+    if not PACKAGING_FASTSTART or has_faststart(path) or not ffmpeg_available():
+        return path
+    tmp_path = f"{path}.faststart.mp4"
+    returncode, stderr = run_ffmpeg([
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-i", path,
+        "-map", "0", "-c", "copy",
+        "-movflags", "+faststart",
+        tmp_path
+    ])
+    if returncode == 0 and os.path.exists(tmp_path):
+        os.replace(tmp_path, path)
+    else:
+        print(f"⚠️ [封装] faststart 失败，保留原文件: {stderr[-200:]}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def probe_duration(path):
+    """用 ffprobe 读取视频时长 (秒)"""
+    if shutil.which(FFPROBE_BIN) is None:
+        return None
+    try:
+        result = subprocess.run(
+            [FFPROBE_BIN, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30
+        )
+        return float(result.stdout.strip())
+    except (ValueError, subprocess.SubprocessError, OSError):
+        return None
+
+
+def hls_dir_for(name):
+    return os.path.join(HLS_DIR, os.path.splitext(name)[0])
+
+
+def hls_url_for(name):
+    """HLS 已生成时返回播放列表地址，否则返回 None"""
+    playlist = os.path.join(hls_dir_for(name), "index.m3u8")
+    if os.path.exists(playlist):
+        return f"/static/hls/{os.path.splitext(name)[0]}/index.m3u8"
+    return None
+
+
+def segment_hls(video_path, name):
+    """时长超过阈值的视频切片为 HLS (stream copy)，返回播放列表地址"""
+    if not HLS_ENABLED or not ffmpeg_available():
+        return None
+    duration = probe_duration(video_path)
+    if duration is None or duration < HLS_MIN_DURATION:
+        return None
+
+    out_dir = hls_dir_for(name)
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    returncode, stderr = run_ffmpeg([
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-i", video_path,
+        "-c", "copy",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(tmp_dir, "seg_%03d.ts"),
+        os.path.join(tmp_dir, "index.m3u8")
+    ])
+    if returncode != 0:
+        print(f"⚠️ [封装] HLS 切片失败: {stderr[-200:]}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"🎞️ [封装] HLS 已生成: {name} ({duration:.1f}s)")
+    return hls_url_for(name)
+
+
+def remove_hls_outputs(names):
+    """视频被淘汰时一并删除它的 HLS 切片"""
+    for name in names:
+        shutil.rmtree(hls_dir_for(name), ignore_errors=True)
+
+
+class PackagingQueue:
+    """后台封装队列：固定数量的 worker 从 asyncio 队列中取任务，在线程池里跑 ffmpeg"""
+
+    def __init__(self, workers=PACKAGING_WORKERS):
+        self.workers = workers
+        self._queue = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def _worker(self, worker_id):
+        while True:
+            kind, func, args, future = await self._queue.get()
+            try:
+                result = await asyncio.to_thread(func, *args)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                print(f"⚠️ [封装] {kind} 任务异常: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, kind, func, *args):
+        """提交任务，返回可 await 的 Future"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((kind, func, args, future))
+        return future
+
+    def submit_background(self, kind, func, *args):
+        """提交不需要等待结果的任务 (异常只记录日志)"""
+        future = self.submit(kind, func, *args)
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    def pending(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+
+packaging_queue = PackagingQueue()
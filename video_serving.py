@@ -0,0 +1,155 @@
+# video_serving.py
+"""
+MathSpace 视频分发
+支持 HTTP Range (206) 断点/拖动播放、基于内容哈希的强 ETag、
+immutable 长缓存，以及 ASGI zerocopysend 扩展 (服务器支持时走 sendfile 零拷贝)。
+"""
+
+import os
+import re
+import anyio
+from email.utils import formatdate
+from starlette.responses import Response
+
+from config import VIDEO_CACHE_MAX_AGE, VIDEO_CHUNK_SIZE
+
+VIDEO_NAME_PATTERN = re.compile(r"^[\w\-]+\.mp4$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header, file_size):
+    """
+    解析单段 Range 头，返回 (start, end)（闭区间）
+    - 无 Range / 语法无法识别 / 多段请求 → None（按 200 返回整个文件）
+    - 超出文件范围 → RangeNotSatisfiable（416）
+    """
+    if not range_header:
+        return None
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start_text, end_text = match.groups()
+    if not start_text and not end_text:
+        return None
+
+    if not start_text:
+        # bytes=-500 → 最后 500 字节
+        suffix = int(end_text)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(file_size - suffix, 0), file_size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, file_size - 1)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class VideoFileResponse(Response):
+    """按字节区间发送文件；服务器声明 zerocopysend 扩展时交给它做 sendfile"""
+
+    def __init__(self, path, start, end, status_code=200, headers=None, send_body=True):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+        self.status_code = status_code
+        self.background = None
+        self.body = b""
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        count = self.end - self.start + 1
+        if not self.send_body or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+            return
+
+        remaining = count
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(VIDEO_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # 文件在发送过程中被截断，正常结束响应
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def build_video_response(request, path, content_hash=None, content_type="video/mp4"):
+    """根据请求头构造 200 / 206 / 304 / 416 响应"""
+    stat = os.stat(path)
+    file_size = stat.st_size
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        # 未登记进仓库的旧文件：退化为基于大小和修改时间的弱 ETag
+        etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "cache-control": f"public, max-age={VIDEO_CACHE_MAX_AGE}, immutable",
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "content-type": content_type,
+    }
+    send_body = request.method != "HEAD"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        headers.pop("content-type")
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # If-Range 不匹配说明客户端持有的是旧版本，返回完整文件
+        range_header = None
+
+    try:
+        byte_range = parse_range_header(range_header, file_size)
+    except RangeNotSatisfiable:
+        headers["content-range"] = f"bytes */{file_size}"
+        headers["content-length"] = "0"
+        headers.pop("content-type")
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        headers["content-length"] = str(file_size)
+        return VideoFileResponse(path, 0, file_size - 1, 200, headers, send_body)
+
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+    headers["content-length"] = str(end - start + 1)
+    return VideoFileResponse(path, start, end, 206, headers, send_body)
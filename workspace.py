@@ -0,0 +1,116 @@
+# workspace.py
+"""
+MathSpace 工作区管理
+每个 worker 进程只使用自己的临时目录 temp_gen/worker_<主机>_<pid>/，
+启动清理时只删除自己的目录，以及本机上已经退出的 worker 留下的目录，
+不会误删其他 worker 正在渲染的文件。
+残留目录可能很多 (崩溃后留下大量 req_* 目录)，启动时先原子改名为 trash_* 移出视线，
+再由后台线程慢慢删除，不阻塞服务接收流量。
+"""
+
+import os
+import uuid
+import shutil
+import socket
+import threading
+
+from config import TEMP_DIR
+
+WORKER_DIR_PREFIX = "worker_"
+TRASH_DIR_PREFIX = "trash_"   # 已改名待删除的目录 (删除中途进程退出的话，下次启动继续删)
+
+
+def worker_id():
+    """当前进程的 worker 标识 (fork 之后调用才准确)"""
+    return f"{socket.gethostname()}_{os.getpid()}"
+
+
+def worker_scratch_dir():
+    return os.path.join(TEMP_DIR, f"{WORKER_DIR_PREFIX}{worker_id()}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def stale_scratch_dirs():
+    """需要清理的目录：自己的旧目录、本机已退出 worker 的目录、旧版遗留的 req_* 目录"""
+    if not os.path.exists(TEMP_DIR):
+        return []
+    hostname = socket.gethostname()
+    own = os.path.basename(worker_scratch_dir())
+    stale = []
+    for name in os.listdir(TEMP_DIR):
+        path = os.path.join(TEMP_DIR, name)
+        if not os.path.isdir(path):
+            continue
+        if name.startswith(TRASH_DIR_PREFIX) or name.startswith("req_"):
+            # 旧版本直接放在 temp_gen 下的请求目录
+            stale.append(path)
+            continue
+        if not name.startswith(WORKER_DIR_PREFIX):
+            continue
+        host, _, pid_text = name[len(WORKER_DIR_PREFIX):].rpartition("_")
+        if name == own:
+            stale.append(path)
+        elif host == hostname and pid_text.isdigit() and not _pid_alive(int(pid_text)):
+            stale.append(path)
+    return stale
+
+
+def retire_dir(path):
+    """把目录原子改名为 trash_*，返回新路径 (改名失败时返回原路径，由调用方直接删除)"""
+    if os.path.basename(path).startswith(TRASH_DIR_PREFIX):
+        return path
+    target = os.path.join(TEMP_DIR, f"{TRASH_DIR_PREFIX}{worker_id()}_{uuid.uuid4().hex[:8]}")
+    try:
+        os.rename(path, target)
+    except OSError:
+        return path
+    return target
+
+
+class ScratchPurger:
+    """后台删除已改名的残留目录"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    def _run(self, paths):
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+            with self.lock:
+                self.pending -= 1
+        print(f"🧹 [系统] 后台已删除 {len(paths)} 个残留临时目录")
+
+    def submit(self, paths):
+        if not paths:
+            return
+        with self.lock:
+            self.pending += len(paths)
+        threading.Thread(target=self._run, args=(paths,), name="scratch-purge", daemon=True).start()
+
+
+scratch_purger = ScratchPurger()
+
+
+def cleanup_worker_scratch(background=False):
+    """
+    清理本 worker 的临时目录并重建，返回清理的目录数
+    background=True 时只做原子改名，真正的删除交给后台线程 (scratch_purger.pending 查看进度)
+    """
+    stale = stale_scratch_dirs()
+    if background:
+        scratch_purger.submit([retire_dir(path) for path in stale])
+    else:
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(worker_scratch_dir(), exist_ok=True)
+    return len(stale)